@@ -0,0 +1,190 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+"""Benchmark build time, no-op rebuild time, .so size and import time of GoExtension.
+
+Synthetic Go packages of increasing size are generated in a temporary Go module
+and built by `python setup.py build_ext` in a subprocess, using go-extension of this repository.
+
+Examples
+--------
+Run the default matrix and store the results::
+
+    $ python benchmarks/bench_build.py --output bench.json
+
+Compare with a previous run and fail on regressions larger than 20%::
+
+    $ python benchmarks/bench_build.py --output new.json --compare bench.json --threshold 0.2
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MODULE = "example.com/bench"
+# Metrics compared by --compare. Larger values are worse for all of them.
+METRICS = ("cold_build", "warm_build", "noop_rebuild", "so_size", "import_time")
+
+
+class Case(t.NamedTuple):
+    functions: int
+    structs: int
+    packages: int
+
+    @property
+    def name(self) -> str:
+        return f"f{self.functions}-s{self.structs}-p{self.packages}"
+
+
+def generate_go_packages(root: Path, case: Case) -> list[str]:
+    """Write a Go module with `case.packages` packages and return their import paths."""
+    (root / "go.mod").write_text(f"module {MODULE}\n\ngo 1.18\n")
+    packages = []
+    for p in range(case.packages):
+        pkg_dir = root / f"pkg{p}"
+        pkg_dir.mkdir(parents=True, exist_ok=True)
+        lines = [f"package pkg{p}", ""]
+        for s in range(case.structs):
+            lines += [
+                f"type Struct{s} struct {{",
+                "\tName  string",
+                "\tValue float64",
+                "}",
+                "",
+                f"func (s *Struct{s}) Scale(k float64) float64 {{ return s.Value * k }}",
+                "",
+            ]
+        for f in range(case.functions):
+            lines += [f"func Func{f}(a, b int) int {{ return a*{f + 1} + b }}", ""]
+        (pkg_dir / "main.go").write_text("\n".join(lines))
+        packages.append(f"{MODULE}/pkg{p}")
+    return packages
+
+
+def write_setup(root: Path, packages: list[str]) -> None:
+    (root / "setup.py").write_text(
+        "import setuptools\n"
+        "from go_extension import GoExtension\n"
+        f"setuptools.setup(name='bench', ext_modules=[GoExtension('bench_go', {packages!r})])\n"
+    )
+
+
+def run_build(root: Path, env: dict[str, str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "setup.py", "-q", "build_ext", "-b", "build"],
+        cwd=root,
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def import_time(root: Path, env: dict[str, str]) -> float:
+    code = "import time; t = time.perf_counter(); import bench_go.pkg0; print(time.perf_counter() - t)"
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=root / "build",
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return float(proc.stdout.split()[-1])
+
+
+def bench_case(case: Case, repeat: int) -> dict[str, t.Any]:
+    """Measure a case `repeat` times and keep the minimum of each time."""
+    times: dict[str, list[float]] = {metric: [] for metric in METRICS if metric != "so_size"}
+    so_size = 0
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="go-extension-bench-") as tmp:
+            root = Path(tmp)
+            packages = generate_go_packages(root, case)
+            write_setup(root, packages)
+            env = dict(
+                os.environ,
+                PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_ROOT), os.environ.get("PYTHONPATH")])),
+                GOCACHE=str(root / "gocache"),
+                GO_EXTENSION_CACHE_DIR="",
+            )
+            times["cold_build"].append(run_build(root, env))
+            times["noop_rebuild"].append(run_build(root, env))
+            shutil.rmtree(root / "build")
+            times["warm_build"].append(run_build(root, env))
+            so_size = sum(path.stat().st_size for path in (root / "build").rglob("*.so"))
+            times["import_time"].append(import_time(root, env))
+    return {"case": case._asdict(), **{metric: min(values) for metric, values in times.items()}, "so_size": so_size}
+
+
+def environment() -> dict[str, str]:
+    go = subprocess.run(["go", "env", "GOVERSION"], stdout=subprocess.PIPE, text=True).stdout.strip()
+    return {
+        "python": sys.version.split()[0],
+        "go": go,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": str(os.cpu_count()),
+    }
+
+
+def compare(results: dict[str, t.Any], baseline: dict[str, t.Any], threshold: float) -> list[str]:
+    """Return descriptions of metrics worse than `baseline` by more than `threshold` (a ratio)."""
+    base = {Case(**result["case"]).name: result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        name = Case(**result["case"]).name
+        if name not in base:
+            continue
+        for metric in METRICS:
+            old, new = base[name][metric], result[metric]
+            if old and (new - old) / old > threshold:
+                regressions.append(f"{name} {metric}: {old:.4g} -> {new:.4g} (+{(new - old) / old:.0%})")
+    return regressions
+
+
+def parse_ints(value: str) -> list[int]:
+    return [int(item) for item in value.split(",")]
+
+
+def main(argv: t.Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", type=parse_ints, default=[10, 100], help="exported functions per package")
+    parser.add_argument("--structs", type=parse_ints, default=[0, 20], help="struct types per package")
+    parser.add_argument("--packages", type=parse_ints, default=[1, 4], help="packages per GoExtension")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the minimum is reported")
+    parser.add_argument("--output", type=Path, help="JSON file to write results to")
+    parser.add_argument("--compare", type=Path, help="JSON results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="ratio of allowed slowdown [default: 0.2]")
+    args = parser.parse_args(argv)
+
+    cases = [Case(*values) for values in itertools.product(args.functions, args.structs, args.packages)]
+    results: dict[str, t.Any] = {"environment": environment(), "results": []}
+    for case in cases:
+        result = bench_case(case, args.repeat)
+        results["results"].append(result)
+        print(
+            f"{case.name}: cold {result['cold_build']:.2f}s, warm {result['warm_build']:.2f}s, "
+            f"no-op {result['noop_rebuild']:.2f}s, .so {result['so_size'] / 1e6:.1f}MB, "
+            f"import {result['import_time'] * 1e3:.1f}ms"
+        )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.compare:
+        regressions = compare(results, json.loads(args.compare.read_text()), args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
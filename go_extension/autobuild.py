@@ -0,0 +1,249 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+"""Rebuild GoExtensions whose Go sources changed when they are imported.
+
+Examples
+--------
+In `conftest.py` or `sitecustomize.py` of a project being developed:
+
+>>> from go_extension import GoExtension, autobuild
+>>> autobuild.install([GoExtension("py_pkg.hello_go", ["example.com/foo/bar/go_pkg"])])  # doctest: +SKIP
+>>> import py_pkg.hello_go  # rebuilt if its Go sources changed  # doctest: +SKIP
+"""
+
+import hashlib
+import importlib.abc
+import importlib.machinery
+import json
+import os
+import sys
+import threading
+import types
+import typing as t
+from pathlib import Path
+from setuptools import dist
+from setuptools._distutils import errors, log
+
+from go_extension import build_ext, cache, compiler, extension, sizes
+
+
+class _State(t.NamedTuple):
+    config: str
+    hashes: dict[str, str]
+    stats: cache.Snapshot
+
+
+class GoExtensionFinder(importlib.abc.MetaPathFinder):
+    """Finder on `sys.meta_path` rebuilding registered GoExtensions when they are imported if they are stale.
+
+    It finds no module itself: after checking an extension, the import continues with the other finders.
+    Files the Go packages depend on are listed by `go list` and hashed when an extension is checked first.
+    They are recorded with their modification times and sizes, and the directories of the packages,
+    so that checking an unchanged extension only stats them.
+    A file whose modification time changed is hashed again, and the extension is rebuilt only if its content changed.
+    A changed package directory, like a new Go file, makes `go list` list the files again.
+    """
+
+    project_dir: Path
+    gopy_compiler: compiler.GoPyCompiler
+    state_dir: t.Optional[Path]
+
+    def __init__(
+        self,
+        project_dir: str | os.PathLike[str] = os.curdir,
+        gopy_compiler: t.Optional[compiler.GoPyCompiler] = None,
+        state_dir: t.Optional[str | os.PathLike[str]] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        project_dir : str | os.PathLike[str]
+            The root directory of the project, where `setup.py build_ext --inplace` runs.
+        gopy_compiler : go_extension.compiler.GoPyCompiler | None
+            The compiler rebuilding extensions.
+        state_dir : str | os.PathLike[str] | None
+            A directory to record files and hashes of extensions in, so that they are reused by later processes.
+            Defaults to `autobuild` in the cache directory of go-extension.
+        """
+        self.project_dir = Path(project_dir).resolve()
+        self.gopy_compiler = gopy_compiler or compiler.GoPyCompiler()
+        if state_dir is None:
+            root = cache.cache_root()
+            state_dir = None if root is None else root / "autobuild"
+        self.state_dir = None if state_dir is None else Path(state_dir)
+        self._extensions: dict[str, extension.GoExtension] = {}
+        self._states: dict[str, _State] = {}
+        self._lock = threading.RLock()
+
+    def register(self, ext: extension.GoExtension) -> None:
+        """Rebuild `ext` if needed when `ext.original_name` is imported."""
+        self._extensions[ext.original_name] = ext
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: t.Optional[t.Sequence[str]],
+        target: t.Optional[types.ModuleType] = None,
+    ) -> t.Optional[importlib.machinery.ModuleSpec]:
+        if fullname in self._extensions:
+            self.ensure_fresh(fullname)
+        return None
+
+    def is_fresh(self, name: str) -> bool:
+        """Return true if the files of extension `name` are unchanged since it was checked last.
+
+        This only stats files, and does not hash them or run `go list`.
+        """
+        ext = self._extensions[name]
+        state = self._states.get(name) or self._load_state(name)
+        if state is None or state.config != self.gopy_compiler.build_config(ext):
+            return False
+        return cache.stat_files(state.stats) == state.stats
+
+    def ensure_fresh(self, name: str) -> bool:
+        """Rebuild extension `name` if files it depends on or its options changed.
+
+        Parameters
+        ----------
+        name : str
+            `original_name` of a registered GoExtension.
+
+        Returns
+        -------
+        bool
+            True if the extension was rebuilt.
+
+        Raises
+        ------
+        ImportError
+            If the rebuild fails.
+        """
+        if self.is_fresh(name):
+            return False
+        with self._lock:
+            if self.is_fresh(name):
+                return False
+            cwd = os.getcwd()
+            os.chdir(self.project_dir)
+            try:
+                return self._check(name)
+            finally:
+                os.chdir(cwd)
+
+    def _check(self, name: str) -> bool:
+        ext = self._extensions[name]
+        command = build_ext.build_ext(dist.Distribution())
+        command.inplace = True
+        command.force = True
+        command.gopy_compiler = self.gopy_compiler
+        output = Path(command.get_ext_fullpath(ext.name)).parent
+        state = self._states.get(name) or self._load_state(name)
+        config = self.gopy_compiler.build_config(ext)
+        # Files are listed again, since a package may have new files or imports.
+        self.gopy_compiler.forget_dependencies()
+        files = list(ext.sources) + list(ext.depends)
+        if ext.resolve_depends:
+            files += self.gopy_compiler.resolve_dependencies(ext.packages)
+        files = sorted({str(self.project_dir / path) for path in files})
+        hashes = {path: _hash_file(path) for path in files}
+        artifacts = sizes.artifacts(output)
+        if not artifacts:
+            stale = True
+        elif state is None:
+            built = min(artifact.stat().st_mtime_ns for artifact in artifacts)
+            stale = any(stat[0] > built for stat in cache.stat_files(files).values())
+        else:
+            stale = state.hashes != hashes or state.config != config
+        if stale:
+            log.info("rebuilding '%s' extension, whose Go sources changed", name)
+            try:
+                command.build_go(ext)
+            except (errors.DistutilsError, OSError) as err:
+                raise ImportError(f"failed to rebuild '{name}' extension: {err}", name=name) from err
+            artifacts = sizes.artifacts(output)
+        # Directories are recorded as well, so that new files in packages are noticed.
+        watched = files + sorted({os.path.dirname(path) for path in files}) + [str(path) for path in artifacts]
+        self._states[name] = _State(config, hashes, cache.stat_files(watched))
+        self._save_state(name)
+        return stale
+
+    def _state_file(self, name: str) -> t.Optional[Path]:
+        if self.state_dir is None:
+            return None
+        digest = hashlib.sha256(f"{self.project_dir}\0{name}".encode()).hexdigest()[:16]
+        return self.state_dir / f"{name}-{digest}.json"
+
+    def _load_state(self, name: str) -> t.Optional[_State]:
+        path = self._state_file(name)
+        if path is None:
+            return None
+        try:
+            data = json.loads(path.read_text())
+            state = _State(data["config"], data["hashes"], {k: (v[0], v[1]) for k, v in data["stats"].items()})
+        except (OSError, ValueError, KeyError, TypeError, IndexError):
+            return None
+        self._states[name] = state
+        return state
+
+    def _save_state(self, name: str) -> None:
+        path = self._state_file(name)
+        if path is None:
+            return
+        state = self._states[name]
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(state._asdict()))
+            os.replace(tmp, path)
+        except OSError as err:
+            log.warn("failed to record sources of '%s' extension: %s", name, err)
+
+
+def install(
+    exts: t.Iterable[extension.GoExtension],
+    project_dir: str | os.PathLike[str] = os.curdir,
+    gopy_compiler: t.Optional[compiler.GoPyCompiler] = None,
+) -> GoExtensionFinder:
+    """Rebuild `exts` when they are imported if their Go sources changed.
+
+    A `GoExtensionFinder` is inserted at the head of `sys.meta_path`, or the installed one is reused.
+
+    Parameters
+    ----------
+    exts : Iterable[go_extension.extension.GoExtension]
+        GoExtension objects built in place in `project_dir`.
+    project_dir : str | os.PathLike[str]
+        The root directory of the project.
+    gopy_compiler : go_extension.compiler.GoPyCompiler | None
+        The compiler rebuilding extensions.
+
+    Returns
+    -------
+    go_extension.autobuild.GoExtensionFinder
+    """
+    project = Path(project_dir).resolve()
+    finder = next(
+        (f for f in sys.meta_path if isinstance(f, GoExtensionFinder) and f.project_dir == project),
+        None,
+    )
+    if finder is None:
+        finder = GoExtensionFinder(project, gopy_compiler)
+        sys.meta_path.insert(0, finder)
+    for ext in exts:
+        finder.register(ext)
+    return finder
+
+
+def uninstall() -> None:
+    """Remove finders inserted by `install()` from `sys.meta_path`."""
+    sys.meta_path[:] = [finder for finder in sys.meta_path if not isinstance(finder, GoExtensionFinder)]
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return ""
+    return digest.hexdigest()
@@ -0,0 +1,273 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+import fnmatch
+import os
+import re
+import typing as t
+from pathlib import Path
+
+from setuptools._distutils import errors
+
+from go_extension import extension, templates
+
+# Go slice types of gopy given a buffer protocol fast path, and their elements:
+# (Go type, item size, accepted struct format characters).
+BUFFER_SLICES = {
+    "Slice_byte": ("byte", 1, "Bbc"),
+    "Slice_float64": ("float64", 8, "d"),
+    "Slice_int64": ("int64", 8, "ql"),
+}
+_ADD_FUNCTION = re.compile(r"^(?P<head>\s*mod\.add_function\('(?P<name>\w+)',.*)\)\s*$")
+_MARKER = "go-extension"
+
+# Exported functions changing settings of a running Go runtime, called by `_runtime.py` through ctypes.
+RUNTIME_SETTERS = {
+    "GOMAXPROCS": "GoExtension_SetMaxProcs",
+    "GOGC": "GoExtension_SetGCPercent",
+    "GOMEMLIMIT": "GoExtension_SetMemoryLimit",
+}
+_RUNTIME_MARKER = "go-extension: runtime settings"
+
+# Statistics of the Go heap written by `GoExtension_ReadHeapStats`, in order.
+HEAP_STATS = ("heap_alloc", "heap_inuse", "heap_sys", "heap_objects", "total_alloc", "num_gc")
+_PROFILING_MARKER = "go-extension: profiling"
+# Functions gopy exports from every extension module to start Go and manage handles, left out of call metrics.
+GOPY_HELPERS = ("GoPyInit", "IncRef", "DecRef", "NumHandles")
+
+# Functions of the handle registry of gopy (package gopyh) replaced by `replace_handle_registry()`.
+HANDLE_FUNCTIONS = ("Register", "VarFromHandleTry", "VarFromHandle", "DecRef", "IncRef", "NumHandles")
+# Functions gopy always calls; handles would leak between the two registries if any were left unreplaced.
+_REQUIRED_HANDLE_FUNCTIONS = ("Register", "VarFromHandle", "DecRef")
+# Statistics of handles written by `GoExtension_ReadHandleStats`, in order.
+HANDLE_STATS = ("live", "peak", "allocations", "releases", "capacity")
+_HANDLES_MARKER = "go-extension: handle registry"
+_GOPYH_CALL = re.compile(r"\bgopyh\.(?P<function>" + "|".join(HANDLE_FUNCTIONS) + r")\(")
+
+
+def needs_postprocess(ext: extension.GoExtension) -> bool:
+    """Return whether bindings of `ext` are modified after generation by gopy.
+
+    Parameters
+    ----------
+    ext : go_extension.extension.GoExtension
+
+    Returns
+    -------
+    bool
+
+    Examples
+    --------
+    >>> needs_postprocess(extension.GoExtension("hello_go", ["example.com/hello"], buffer_protocol=True))
+    True
+    """
+    return bool(
+        ext.release_gil or ext.buffer_protocol or ext.go_runtime is not None or ext.instrument or ext.handle_registry
+    )
+
+
+def fingerprint(ext: extension.GoExtension) -> str:
+    """Return options of `ext` affecting `postprocess()`, used as a part of a build cache key."""
+    return (
+        f"release_gil={sorted(ext.release_gil)!r} buffer_protocol={ext.buffer_protocol!r} "
+        f"runtime_setters={ext.go_runtime is not None!r} profiling={ext.instrument!r} "
+        f"handle_registry={ext.handle_registry!r}"
+    )
+
+
+def postprocess(ext: extension.GoExtension, output: str | os.PathLike[str]) -> None:
+    """Modify bindings generated by `gopy gen` in `output` as configured by `ext`.
+
+    Parameters
+    ----------
+    ext : go_extension.extension.GoExtension
+        A GoExtension object whose bindings were generated.
+    output : str | os.PathLike[str]
+        The output directory of `gopy gen`.
+    """
+    root = Path(output)
+    if ext.release_gil:
+        release_gil(root / "build.py", ext.release_gil)
+    if ext.buffer_protocol:
+        add_buffer_protocol(root, ext._compiled_name)
+    if ext.go_runtime is not None:
+        add_runtime_setters(root, ext._compiled_name)
+    if ext.instrument:
+        add_profiling(root, ext._compiled_name)
+    if ext.handle_registry:
+        replace_handle_registry(root, ext._compiled_name)
+
+
+def release_gil(build_py: str | os.PathLike[str], patterns: t.Iterable[str]) -> list[str]:
+    """Release the GIL around calls of Go functions matching `patterns`.
+
+    Functions are named like `pkg.Func` or `pkg.Type.Method`, and patterns are of `fnmatch`.
+    A Go function called without the GIL must not call back into Python.
+
+    Parameters
+    ----------
+    build_py : str | os.PathLike[str]
+        `build.py` generated by gopy, which generates the C extension module with pybindgen.
+    patterns : Iterable[str]
+        Patterns of Go functions.
+
+    Returns
+    -------
+    list[str]
+        Names of the C functions of the matched Go functions.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> path = Path(tempfile.mkdtemp(), "build.py")
+    >>> _ = path.write_text("mod.add_function('hello_Sum', retval('double'), [param('int64_t', 'h')])\\n")
+    >>> release_gil(path, ["hello.Sum"])
+    ['hello_Sum']
+    >>> print(path.read_text())
+    mod.add_function('hello_Sum', retval('double'), [param('int64_t', 'h')], unblock_threads=True)
+    <BLANKLINE>
+    """
+    path = Path(build_py)
+    names = [pattern.replace(".", "_") for pattern in patterns]
+    released = []
+    lines = path.read_text().splitlines()
+    for i, line in enumerate(lines):
+        match = _ADD_FUNCTION.match(line)
+        if match is None or "unblock_threads" in line:
+            continue
+        if any(fnmatch.fnmatchcase(match.group("name"), name) for name in names):
+            lines[i] = f"{match.group('head')}, unblock_threads=True)"
+            released.append(match.group("name"))
+    path.write_text("\n".join(lines) + "\n")
+    return released
+
+
+def add_buffer_protocol(output: str | os.PathLike[str], name: str) -> None:
+    """Add `from_buffer()` to Go slices of bytes, float64 and int64 of bindings in `output`.
+
+    `from_buffer()` copies a C-contiguous buffer into a new Go slice at once, with the GIL released,
+    instead of appending its items one by one.
+
+    Parameters
+    ----------
+    output : str | os.PathLike[str]
+        The output directory of `gopy gen`.
+    name : str
+        The name of the bindings passed to `gopy gen -name`.
+    """
+    root = Path(output)
+    go_file, build_py, go_py = root / f"{name}.go", root / "build.py", root / "go.py"
+    if "func goExtensionCopy(" in go_file.read_text():
+        return
+    go_code = ["\n" + templates.render("buffers.go.in", marker=_MARKER)]
+    wrappers = [f"# Generated by {_MARKER}: buffer protocol fast path."]
+    for i, (slice_, (elem, itemsize, formats)) in enumerate(BUFFER_SLICES.items()):
+        go_code.append("\n" + templates.render("from_buffer.go.in", slice=slice_, elem=elem, itemsize=itemsize))
+        # The helper checking formats is defined once, with the first wrapper.
+        body = ("\n" + templates.render("check_format.c.in") if i == 0 else "") + (
+            "\n" + templates.render("from_buffer.c.in", slice=slice_, itemsize=itemsize, formats=formats)
+        )
+        wrappers.append(
+            f"mod.add_custom_function_wrapper({slice_ + '_from_buffer'!r}, 'go_extension_{slice_}_from_buffer', "
+            f"wrapper_body={body!r}, flags=['METH_VARARGS', 'METH_KEYWORDS'])"
+        )
+    with go_file.open("a") as f:
+        f.write("".join(go_code))
+    _insert_before_generate(build_py, wrappers)
+    with go_py.open("a") as f:
+        f.write(
+            "\n\n" + templates.render("from_buffer.py.in", marker=_MARKER, name=name, slices=", ".join(BUFFER_SLICES))
+        )
+
+
+def add_runtime_setters(output: str | os.PathLike[str], name: str) -> None:
+    """Export functions changing `GOMAXPROCS`, `GOGC` and `GOMEMLIMIT` of the running Go runtime.
+
+    They are named by `RUNTIME_SETTERS`, take the new value and return the previous one.
+
+    Parameters
+    ----------
+    output : str | os.PathLike[str]
+        The output directory of `gopy gen`.
+    name : str
+        The name of the bindings passed to `gopy gen -name`.
+    """
+    go_file = Path(output, f"{name}.go")
+    if _RUNTIME_MARKER in go_file.read_text():
+        return
+    with go_file.open("a") as f:
+        f.write("\n" + templates.render("runtime.go.in", marker=_RUNTIME_MARKER))
+
+
+def add_profiling(output: str | os.PathLike[str], name: str) -> None:
+    """Export functions writing pprof profiles and reading statistics of the heap of the Go runtime.
+
+    `GoExtension_StartCPUProfile` and `GoExtension_WriteHeapProfile` take a path,
+    and they and `GoExtension_StopCPUProfile` return an error message to be freed by `GoExtension_Free`, or NULL.
+    `GoExtension_ReadHeapStats` writes `HEAP_STATS` into an array of long long.
+
+    Parameters
+    ----------
+    output : str | os.PathLike[str]
+        The output directory of `gopy gen`.
+    name : str
+        The name of the bindings passed to `gopy gen -name`.
+    """
+    go_file = Path(output, f"{name}.go")
+    if _PROFILING_MARKER in go_file.read_text():
+        return
+    with go_file.open("a") as f:
+        f.write("\n" + templates.render("profiling.go.in", marker=_PROFILING_MARKER))
+
+
+def replace_handle_registry(output: str | os.PathLike[str], name: str) -> int:
+    """Replace the handle registry of gopy with a free-list based one counting handles.
+
+    Calls of `HANDLE_FUNCTIONS` of gopyh in the generated Go code are replaced by functions of the same signatures.
+    `GoExtension_ReadHandleStats` writes `HANDLE_STATS` into an array of long long,
+    `GoExtension_HandleTypes` returns the counts of each Go type as JSON, to be freed by `GoExtension_FreeHandleTypes`,
+    and `GoExtension_ResetHandlePeak` resets the peak counts to the live ones.
+
+    Parameters
+    ----------
+    output : str | os.PathLike[str]
+        The output directory of `gopy gen`.
+    name : str
+        The name of the bindings passed to `gopy gen -name`.
+
+    Returns
+    -------
+    int
+        The number of calls replaced.
+
+    Raises
+    ------
+    distutils.errors.DistutilsExecError
+        If the generated code does not call all of `Register`, `VarFromHandle` and `DecRef` of gopyh,
+        like code generated by an unsupported version of gopy.
+    """
+    go_file = Path(output, f"{name}.go")
+    content = go_file.read_text()
+    if _HANDLES_MARKER in content:
+        return 0
+    replaced: set[str] = set()
+
+    def replace(match: re.Match[str]) -> str:
+        replaced.add(match.group("function"))
+        return f"goExtension{match.group('function')}("
+
+    content, count = _GOPYH_CALL.subn(replace, content)
+    missing = [function for function in _REQUIRED_HANDLE_FUNCTIONS if function not in replaced]
+    if missing:
+        raise errors.DistutilsExecError(
+            f"can not replace the handle registry: {go_file} does not call "
+            + ", ".join(f"gopyh.{function}" for function in missing)
+        )
+    go_file.write_text(content + "\n" + templates.render("handles.go.in", marker=_HANDLES_MARKER))
+    return count
+
+
+def _insert_before_generate(build_py: Path, lines: t.Sequence[str]) -> None:
+    """Insert `lines` into `build.py` before pybindgen writes the module."""
+    content = build_py.read_text().splitlines()
+    index = next((i for i, line in enumerate(content) if line.lstrip().startswith("mod.generate(")), len(content))
+    content[index:index] = lines
+    build_py.write_text("\n".join(content) + "\n")
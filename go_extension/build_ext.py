@@ -2,10 +2,57 @@
 from setuptools.command import build_ext as _build_ext
 from setuptools.extension import Extension
 from setuptools import dist, dep_util
-from setuptools._distutils import log
+from setuptools._distutils import errors, log
+from concurrent import futures
 from pathlib import Path
+import json
+import os
+import shlex
+import shutil
+import threading
+import time
+import typing as t
 
-from go_extension import extension, compiler
+from go_extension import bindings, cache, daemon, extension, compiler, profiling, runner, sizes, targets, templates
+
+_FICLONE = 0x40049409  # Linux ioctl to clone a file (reflink)
+
+_RUNTIME_IMPORT = "from ._runtime import ForkedRuntimeError, configure, init, started  # noqa: F401\n"
+
+_RUNTIME_INIT = """\
+# Generated by go-extension: the Go runtime is started with the settings of _runtime.
+{runtime_import}
+init()
+"""
+
+_METRICS_IMPORT = (
+    "from ._metrics import (  # noqa: F401\n"
+    "    cpu_profile,\n"
+    "    instrument as _instrument,\n"
+    "    metrics,\n"
+    "    reset_metrics,\n"
+    "    start_cpu_profile,\n"
+    "    stop_cpu_profile,\n"
+    "    write_heap_profile,\n"
+    ")\n"
+)
+
+_METRICS_INIT = """
+# Generated by go-extension: calls of the Go functions are recorded by _metrics.
+{metrics_import}
+_instrument()
+"""
+
+_HANDLES_IMPORT = "from ._handles import handle_stats, release, reset_handle_peak, track as _track  # noqa: F401\n"
+
+_HANDLES_INIT = """
+# Generated by go-extension: handles of Go objects are counted and released by _handles.
+{handles_import}
+_track()
+"""
+
+# Starts the Go runtime with the settings of _runtime in `instrument()` of _metrics and `track()` of _handles.
+_RUNTIME_START = "    from ._runtime import init\n\n    init()\n"
 
 
 class build_ext(_build_ext.build_ext):  # type: ignore
@@ -20,12 +67,109 @@ class build_ext(_build_ext.build_ext):  # type: ignore
     >>> setup(cmdclass={'build_ext': build_ext})  # doctest: +SKIP
     """
 
+    user_options = _build_ext.build_ext.user_options + [
+        ("go-cache=", None, "directory of the Go build cache (GOCACHE)"),
+        ("go-modcache=", None, "directory of the Go module cache (GOMODCACHE)"),
+        ("go-flags=", None, "flags passed to every go command (GOFLAGS)"),
+        ("go-offline", None, "build without network access"),
+        (
+            "go-prewarm",
+            None,
+            "compile Go packages shared by GoExtensions into the Go build cache once before building",
+        ),
+        ("go-quiet", None, "log a summary of each Go build instead of its output, and the output only on failure"),
+        ("go-daemon", None, "build GoExtensions by the build server of go_extension.daemon if it is running"),
+        ("go-proxy=", None, "Go module proxy (GOPROXY), or a local directory used as a file:// proxy"),
+        ("gopy-version=", None, "version of gopy to install if missing [default: latest]"),
+        ("goimports-version=", None, "version of goimports to install if missing [default: latest]"),
+        ("go-profile=", None, "directory to write timing of each build phase to"),
+        ("go-timeout=", None, "timeout of each go and gopy command in seconds"),
+        ("go-bundle=", None, "package to build all GoExtensions into, sharing one Go runtime"),
+        ("go-build-flags=", None, "flags of go build compiling GoExtensions, like '-trimpath -ldflags=\"-s -w\"'"),
+        ("cgo-cflags=", None, "flags added to CGO_CFLAGS of GoExtensions"),
+        ("cgo-ldflags=", None, "flags added to CGO_LDFLAGS of GoExtensions"),
+        ("go-pgo=", None, "CPU profile for profile-guided optimization of GoExtensions"),
+        (
+            "go-targets=",
+            None,
+            "platforms to cross-compile GoExtensions for, like 'linux/arm64 CC=aarch64-linux-gnu-gcc'",
+        ),
+        ("go-targets-dir=", None, "directory of artifacts of each target [default: build/targets]"),
+        ("go-size-report=", None, "JSON file to write sizes of GoExtension shared libraries and their contents to"),
+        (
+            "go-size-budget=",
+            None,
+            "maximum size of a GoExtension shared library, like 20M; larger ones fail the build",
+        ),
+        (
+            "go-debug-info=",
+            None,
+            "keep, strip or split debug information of GoExtension shared libraries [default: keep]",
+        ),
+        ("go-debug-dir=", None, "directory of debug information split from shared libraries [default: build/debug]"),
+    ]
+    boolean_options = _build_ext.build_ext.boolean_options + ["go-offline", "go-prewarm", "go-quiet", "go-daemon"]
+
     go_command: str = "go"
     gopycompiler: compiler.GoPyCompiler
+    extensions: list[Extension]
+    go_cache: t.Optional[str]
+    go_modcache: t.Optional[str]
+    go_flags: t.Optional[str]
+    go_offline: bool
+    go_prewarm: bool
+    go_quiet: bool
+    go_daemon: bool
+    go_proxy: t.Optional[str]
+    gopy_version: t.Optional[str]
+    goimports_version: t.Optional[str]
+    go_profile: t.Optional[str]
+    go_timeout: t.Optional[str]
+    go_bundle: t.Optional[str]
+    go_build_flags: t.Optional[str]
+    cgo_cflags: t.Optional[str]
+    cgo_ldflags: t.Optional[str]
+    go_pgo: t.Optional[str]
+    go_targets: t.Optional[str]
+    go_targets_dir: t.Optional[str]
+    go_size_report: t.Optional[str]
+    go_size_budget: t.Optional[str]
+    go_debug_info: t.Optional[str]
+    go_debug_dir: t.Optional[str]
 
     def __init__(self, distr: dist.Distribution) -> None:
         super().__init__(distr)
         self.gopy_compiler = compiler.GoPyCompiler()
+        self._size_budget: t.Optional[int] = None
+        self._size_reports: list[dict[str, t.Any]] = []
+        self._unstripped_sizes: dict[Path, int] = {}
+        self._size_lock = threading.Lock()
+
+    def initialize_options(self) -> None:
+        super().initialize_options()
+        self.go_cache = None
+        self.go_modcache = None
+        self.go_flags = None
+        self.go_offline = False
+        self.go_prewarm = False
+        self.go_quiet = False
+        self.go_daemon = False
+        self.go_proxy = None
+        self.gopy_version = None
+        self.goimports_version = None
+        self.go_profile = None
+        self.go_timeout = None
+        self.go_bundle = None
+        self.go_build_flags = None
+        self.cgo_cflags = None
+        self.cgo_ldflags = None
+        self.go_pgo = None
+        self.go_targets = None
+        self.go_targets_dir = None
+        self.go_size_report = None
+        self.go_size_budget = None
+        self.go_debug_info = None
+        self.go_debug_dir = None
 
     def run(self) -> None:
         self.gopy_compiler = compiler.GoPyCompiler(
@@ -34,40 +178,473 @@ class build_ext(_build_ext.build_ext):  # type: ignore
             dry_run=bool(getattr(self, "dry_run", False)),
             force=bool(getattr(self, "force", False)),
             inplace=bool(getattr(self, "inplace", False)),
+            workers=self._parallel_workers(),
+            gocache=self.go_cache,
+            gomodcache=self.go_modcache,
+            goflags=self.go_flags,
+            offline=bool(self.go_offline),
+            goproxy=self.go_proxy,
+            gopy_version=self.gopy_version or "latest",
+            goimports_version=self.goimports_version or "latest",
+            timeout=float(self.go_timeout) if self.go_timeout else None,
+            build_flags=shlex.split(self.go_build_flags or ""),
+            cgo_cflags=shlex.split(self.cgo_cflags or ""),
+            cgo_ldflags=shlex.split(self.cgo_ldflags or ""),
+            pgo=self.go_pgo,
+            daemon_socket=str(daemon.default_socket_path()) if self.go_daemon else None,
         )
-        super().run()
+        if self.go_debug_info not in (None, *sizes.DEBUG_INFO_MODES):
+            raise errors.DistutilsOptionError(f"--go-debug-info must be one of {', '.join(sizes.DEBUG_INFO_MODES)}")
+        try:
+            self._size_budget = None if self.go_size_budget is None else sizes.parse_size(self.go_size_budget)
+        except ValueError as err:
+            raise errors.DistutilsOptionError(f"invalid --go-size-budget: {err}") from err
+        self._size_reports = []
+        self._unstripped_sizes = {}
+        if self.go_profile is None:
+            super().run()
+        else:
+            self.gopy_compiler.profile = profiling.BuildProfile()
+            try:
+                super().run()
+            finally:
+                report, trace = self.gopy_compiler.profile.write(self.go_profile)
+                log.info("wrote build profile to %s and %s", report, trace)
+        if self._analyzes_sizes() and not self.gopy_compiler.dry_run:
+            self.check_sizes()
+
+    def get_outputs(self) -> list[str]:
+        """Return paths of the files built from the extensions.
+
+        Bundled GoExtensions are built into the shared library of the bundle and Python modules of their facades,
+        instead of their own shared libraries.
+        """
+        go_exts = [ext for ext in self.extensions if isinstance(ext, extension.GoExtension)] if self.go_bundle else []
+        if not go_exts:
+            return t.cast("list[str]", super().get_outputs())
+        self.check_extensions_list(self.extensions)
+        outputs = [self.get_ext_fullpath(ext.name) for ext in self.extensions if ext not in go_exts]
+        bundle = self._go_bundle_extension(go_exts)
+        outputs.append(self.get_ext_fullpath(bundle.name))
+        names = self.gopy_compiler.package_names(bundle.packages)
+        for ext in go_exts:
+            output = Path(self.get_ext_fullpath(ext.name)).parent
+            modules = _facade_modules([names[pkg] for pkg in ext.packages])
+            outputs += [str(output / name) for name in ["__init__.py", *(f"{module}.py" for module in modules)]]
+        return outputs
+
+    def _parallel_workers(self) -> int:
+        parallel = getattr(self, "parallel", None)
+        if parallel is True:
+            return os.cpu_count() or 1
+        return int(parallel or 1)
+
+    def build_extensions(self) -> None:
+        self.check_extensions_list(self.extensions)
+        go_exts = [ext for ext in self.extensions if isinstance(ext, extension.GoExtension)]
+        # Resolve dependencies of all extensions by one `go list`.
+        packages = [pkg for ext in go_exts if ext.resolve_depends for pkg in ext.packages]
+        self.gopy_compiler.resolve_dependencies(packages)
+        if self.go_prewarm and not self.go_bundle:
+            self.prewarm_go([ext for ext in go_exts if not self.should_skip_ext(ext)])
+        if self.go_bundle and go_exts:
+            self.build_go_bundle(go_exts)
+        elif self.gopy_compiler.workers >= 2 and len(go_exts) >= 2:
+            self.build_go_parallel(go_exts)
+        else:
+            super().build_extensions()
+            go_exts = []
+        if go_exts:
+            extensions = self.extensions
+            self.extensions = [ext for ext in extensions if not isinstance(ext, extension.GoExtension)]
+            try:
+                super().build_extensions()
+            finally:
+                self.extensions = extensions
+        if self.go_targets:
+            self.build_go_targets([ext for ext in self.extensions if isinstance(ext, extension.GoExtension)])
 
     def build_extension(self, ext: Extension) -> None:
         if isinstance(ext, extension.GoExtension):
-            self.build_go(ext)
+            if self.go_quiet:
+                self._build_go_captured(ext)
+            else:
+                self.build_go(ext)
         else:
             super().build_extension(ext)
 
-    def build_go(self, ext: extension.GoExtension) -> None:
+    def prewarm_go(self, exts: t.Sequence[extension.GoExtension]) -> None:
+        """Compile Go packages of GoExtensions into the Go build cache before building them one by one.
+
+        See `go_extension.compiler.GoPyCompiler.prewarm()`.
+
+        Parameters
+        ----------
+        exts : Sequence[go_extension.extension.GoExtension]
+            GoExtension objects to build.
+        """
+        if len(exts) < 2:
+            return
+        started = time.perf_counter()
+        saved = self.gopy_compiler.prewarm(exts, Path(self.build_temp or "build", "go-extension"))
+        log.info(
+            "prewarmed the Go build cache for %d extensions in %.1fs, "
+            "saving an estimated %.1fs compared to cold builds",
+            len(exts),
+            time.perf_counter() - started,
+            saved,
+        )
+
+    def build_go_bundle(self, exts: t.Sequence[extension.GoExtension]) -> None:
+        """Build GoExtensions into one shared library, so that the Go runtime is loaded once per process.
+
+        Go packages of all extensions are compiled into the package named by `go_bundle`,
+        and each extension becomes a facade package importing its Go packages from the bundle.
+
+        Parameters
+        ----------
+        exts : Sequence[go_extension.extension.GoExtension]
+            GoExtension objects to bundle.
+        """
+        bundle = self._go_bundle_extension(exts)
+        log.info("bundling %s into '%s'", ", ".join(f"'{ext.original_name}'" for ext in exts), bundle.original_name)
+        self.build_go(bundle)
+        names = self.gopy_compiler.package_names(bundle.packages)
+        for ext in exts:
+            self.write_go_facade(ext, bundle.original_name, [names[pkg] for pkg in ext.packages])
+
+    def _go_bundle_extension(self, exts: t.Sequence[extension.GoExtension]) -> extension.GoExtension:
+        assert self.go_bundle
+        return extension.GoExtension(
+            self.go_bundle,
+            list(dict.fromkeys(pkg for ext in exts for pkg in ext.packages)),
+            sources=list(dict.fromkeys(src for ext in exts for src in ext.sources)),
+            depends=list(dict.fromkeys(dep for ext in exts for dep in ext.depends)),
+            resolve_depends=any(ext.resolve_depends for ext in exts),
+            lazy=any(ext.lazy for ext in exts),
+            release_gil=list(dict.fromkeys(pattern for ext in exts for pattern in ext.release_gil)),
+            buffer_protocol=any(ext.buffer_protocol for ext in exts),
+            go_build_flags=list(dict.fromkeys(flag for ext in exts for flag in ext.go_build_flags)),
+            cgo_cflags=list(dict.fromkeys(flag for ext in exts for flag in ext.cgo_cflags)),
+            cgo_ldflags=list(dict.fromkeys(flag for ext in exts for flag in ext.cgo_ldflags)),
+            pgo=next((ext.pgo for ext in exts if ext.pgo), None),
+            go_runtime=next((ext.go_runtime for ext in exts if ext.go_runtime is not None), None),
+            instrument=any(ext.instrument for ext in exts),
+            handle_registry=any(ext.handle_registry for ext in exts),
+        )
+
+    def write_go_facade(self, ext: extension.GoExtension, bundle: str, modules: t.Sequence[str]) -> None:
+        """Write a package re-exporting Go modules of a bundle as the package of `ext`.
+
+        Parameters
+        ----------
+        ext : go_extension.extension.GoExtension
+            A bundled GoExtension.
+        bundle : str
+            The name of the bundle package.
+        modules : Sequence[str]
+            Names of the Python modules of the Go packages in `ext`.
+        """
+        output = Path(self.get_ext_fullpath(ext.name)).parent
+        log.info("writing facade of '%s' extension", ext.original_name)
+        if self.dry_run:
+            return
+        output.mkdir(parents=True, exist_ok=True)
+        modules = _facade_modules(modules)
+        if ext.lazy:
+            _write_lazy_init(output, modules)
+        else:
+            init = [f"# Generated by go-extension: Go packages of this package are bundled in {bundle}."]
+            init += [f"from {bundle} import {module}  # noqa" for module in modules]
+            _write_text(output / "__init__.py", "\n".join(init) + "\n")
+        for module in modules:
+            _write_text(output / f"{module}.py", templates.render("facade.py.in", bundle=bundle, module=module))
+        if self.gopy_compiler.inplace:
+            files = ["__init__.py"] + [f"{module}.py" for module in modules]
+            _link_tree(output, self._inplace_package_dir(ext), files)
+
+    def build_go_parallel(self, exts: t.Sequence[extension.GoExtension]) -> None:
+        """Build GoExtensions concurrently.
+
+        At most `gopy_compiler.workers` extensions are built at the same time.
+        Output of each extension is captured into a bounded log, summarised in one line when it succeeds,
+        and saved to `build_temp`/go-extension/NAME.log with its tail logged when it fails.
+        Remaining builds are cancelled on the first failure.
+
+        Parameters
+        ----------
+        exts : Sequence[go_extension.extension.GoExtension]
+            GoExtension objects to build.
+        """
+        workers = min(self.gopy_compiler.workers, len(exts))
+        log.info("building %d Go extensions with %d workers", len(exts), workers)
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            jobs = {executor.submit(self._build_go_captured, ext): ext for ext in exts}
+            try:
+                for job in futures.as_completed(jobs):
+                    with self._filter_build_errors(jobs[job]):
+                        job.result()
+            except BaseException as err:
+                for job in jobs:
+                    job.cancel()
+                if isinstance(err, KeyboardInterrupt):
+                    # Commands of running jobs are in their own process group and did not receive Ctrl-C.
+                    runner.kill_all()
+                raise
+
+    def build_go_targets(self, exts: t.Sequence[extension.GoExtension]) -> None:
+        """Cross-compile GoExtensions for each of `go_targets`.
+
+        The package of each extension is written under `go_targets_dir`/`GOOS-GOARCH`.
+        Builds run concurrently, limited by `--parallel`, the number of CPUs and the available memory
+        (see `go_extension.targets.concurrency()`), and share the Go module cache and build cache.
+
+        Parameters
+        ----------
+        exts : Sequence[go_extension.extension.GoExtension]
+            GoExtension objects to build.
+        """
+        assert self.go_targets
+        try:
+            go_targets = targets.parse_targets(self.go_targets)
+        except ValueError as err:
+            raise errors.DistutilsOptionError(f"invalid --go-targets: {err}") from err
+        jobs = [(target, ext) for target in go_targets for ext in exts]
+        requested = self.gopy_compiler.workers if getattr(self, "parallel", None) else None
+        workers = targets.concurrency(len(jobs), requested)
+        log.info("building %d Go extensions for %d targets with %d workers", len(exts), len(go_targets), workers)
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            submitted = {executor.submit(self._build_go_target, target, ext): (target, ext) for target, ext in jobs}
+            try:
+                for job in futures.as_completed(submitted):
+                    with self._filter_build_errors(submitted[job][1]):
+                        job.result()
+            except BaseException as err:
+                for job in submitted:
+                    job.cancel()
+                if isinstance(err, KeyboardInterrupt):
+                    # Commands of running jobs are in their own process group and did not receive Ctrl-C.
+                    runner.kill_all()
+                raise
+
+    def _build_go_target(self, target: targets.Target, ext: extension.GoExtension) -> None:
+        gopy_compiler = self.gopy_compiler.clone(env=dict(self.gopy_compiler.env, **target.env), capture_output=True)
+        if target.python is not None:
+            gopy_compiler.python = target.python
+        package = self.get_ext_fullname(ext.name).split(".")[:-1]
+        output = Path(self.go_targets_dir or os.path.join("build", "targets"), target.tag, *package)
+        description = f"'{ext.original_name}' extension for {target.tag}"
+        started = time.perf_counter()
+        try:
+            with gopy_compiler.phase("build_go", "build_go", extension=ext.original_name, target=target.tag):
+                gopy_compiler.build(ext, output)
+        except Exception:
+            log_path = self._log_path(ext, target.tag)
+            gopy_compiler.log_captured(description, time.perf_counter() - started, True, log_path)
+            raise
+        gopy_compiler.log_captured(description, time.perf_counter() - started)
+
+    def _build_go_captured(self, ext: extension.GoExtension) -> None:
+        gopy_compiler = self.gopy_compiler.clone(capture_output=True)
+        description = f"'{ext.original_name}' extension"
+        started = time.perf_counter()
+        try:
+            self.build_go(ext, gopy_compiler)
+        except Exception:
+            gopy_compiler.log_captured(description, time.perf_counter() - started, True, self._log_path(ext))
+            raise
+        gopy_compiler.log_captured(description, time.perf_counter() - started)
+
+    def _log_path(self, ext: extension.GoExtension, tag: t.Optional[str] = None) -> t.Optional[Path]:
+        """Return the file to save the log of a failed build of `ext` to, or None for a temporary file."""
+        if self.build_temp is None:
+            return None
+        name = ext.original_name if tag is None else f"{ext.original_name}.{tag}"
+        return Path(self.build_temp, "go-extension", f"{name}.log")
+
+    def build_go(self, ext: extension.GoExtension, gopy_compiler: t.Optional[compiler.GoPyCompiler] = None) -> None:
         """Build GoExtension.
 
         Parameters
         ----------
         ext : go_extension.extension.GoExtension
             A GoExtension object to build.
+        gopy_compiler : go_extension.compiler.GoPyCompiler | None
+            A compiler to build with. Defaults to `self.gopy_compiler`.
         """
         assert isinstance(ext, extension.GoExtension)
+        gopy_compiler = gopy_compiler or self.gopy_compiler
+        with gopy_compiler.phase("build_go", "build_go", extension=ext.original_name):
+            self._build_go(ext, gopy_compiler)
+
+    def _build_go(self, ext: extension.GoExtension, gopy_compiler: compiler.GoPyCompiler) -> None:
+        output = Path(self.get_ext_fullpath(ext.name)).parent
+        before = cache.snapshot(output)
+        built: list[str] = []
         if self.should_skip_ext(ext):
             log.debug("skipping '%s' extension (up-to-date)", ext.original_name)
-            return
         else:
             log.info("building '%s' extension", ext.original_name)
-        if self.gopy_compiler.inplace:
-            # Reference: setuptools.command.build_ext.build_ext.copy_extensions_to_source()
-            build_py = self.get_finalized_command("build_py")
-            fullname = str(self.get_ext_fullname(ext.name))
-            modpath = fullname.split(".")
-            package = ".".join(modpath[:-1])
-            package_dir = build_py.get_package_dir(package)
-            # end
-            self.gopy_compiler.generate(ext, output=Path(package_dir))
-        ext_path = self.get_ext_fullpath(ext.name)
-        self.gopy_compiler.build(ext, output=Path(ext_path).parent)
+            if gopy_compiler.dry_run:
+                gopy_compiler.build(ext, output=output)
+            else:
+                built = self._build_staged(ext, output, gopy_compiler)
+        if self._analyzes_sizes() and not gopy_compiler.dry_run:
+            self._analyze_sizes(ext, output, gopy_compiler)
+        if ext.lazy and not gopy_compiler.dry_run:
+            modules = sorted(
+                path.stem
+                for path in output.glob("*.py")
+                if path.name not in ("__init__.py", "build.py", "_runtime.py", "_metrics.py", "_handles.py")
+            )
+            _write_lazy_init(output, modules, ext.go_runtime is not None, ext.instrument, ext.handle_registry)
+        if ext.go_runtime is not None and not gopy_compiler.dry_run:
+            _write_runtime(output, ext.go_runtime, ext.lazy)
+        if ext.instrument and not gopy_compiler.dry_run:
+            _write_metrics(output, ext.lazy, ext.go_runtime is not None)
+        if ext.handle_registry and not gopy_compiler.dry_run:
+            _write_handles(output, ext.lazy, ext.go_runtime is not None)
+        if gopy_compiler.inplace and not gopy_compiler.dry_run:
+            files = self._produced_files(ext, output, before, built)
+            with gopy_compiler.phase("place inplace", "copy"):
+                _link_tree(output, self._inplace_package_dir(ext), files)
+
+    def _build_staged(
+        self, ext: extension.GoExtension, output: Path, gopy_compiler: compiler.GoPyCompiler
+    ) -> list[str]:
+        """Build `ext` in a staging directory next to `output`, then move files whose content changed into `output`.
+
+        Unchanged files keep their modification times, so the inplace package and tools watching it see no change.
+        The staging directory has a fixed name, so paths recorded in the built files are the same in every build.
+
+        Returns
+        -------
+        list[str]
+            Names of the files built directly in `output`, changed or not.
+        """
+        staging = output.parent / f".{output.name}.go-staging"
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            gopy_compiler.build(ext, output=staging)
+            if self.go_debug_info not in (None, "keep"):
+                self._strip_debug_info(ext, staging, gopy_compiler, output)
+            built = sorted(path.name for path in staging.iterdir() if path.is_file())
+            with gopy_compiler.phase("update built files", "copy"):
+                cache.relocate(staging, staging, output)
+                changed = cache.replace_changed(staging, output)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self._write_build_config(ext)
+        log.info("updated %d of %d built files of '%s'", len(changed), len(built), ext.original_name)
+        return built
+
+    def _produced_files(
+        self, ext: extension.GoExtension, output: Path, before: cache.Snapshot, built: t.Sequence[str] = ()
+    ) -> list[str]:
+        """Return files directly in `output` written by building `ext`, now or by earlier builds.
+
+        Other files in `output`, like those build_py copied or those of GoExtensions in subpackages,
+        are left out of the inplace package.
+        They are recorded in the build directory, since a skipped build writes no files.
+        """
+        files = {name for name in cache.changed_files(output, before) if "/" not in name}
+        files.update(built)
+        files.update(self._recorded_files(ext))
+        produced = sorted(name for name in files if (output / name).is_file())
+        path = self._produced_files_path(ext)
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(produced))
+        return produced
+
+    def _recorded_files(self, ext: extension.GoExtension) -> list[str]:
+        """Return files of `ext` recorded by `_produced_files()`, or an empty list if not recorded."""
+        path = self._produced_files_path(ext)
+        if path is None:
+            return []
+        try:
+            files = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return []
+        return [name for name in files if isinstance(name, str) and "/" not in name]
+
+    def _produced_files_path(self, ext: extension.GoExtension) -> t.Optional[Path]:
+        if self.build_temp is None:
+            return None
+        return Path(self.build_temp, "go-extension", f"{ext.name}.files.json")
+
+    def _analyzes_sizes(self) -> bool:
+        return bool(self.go_size_report or self.go_size_budget)
+
+    def _strip_debug_info(
+        self, ext: extension.GoExtension, staging: Path, gopy_compiler: compiler.GoPyCompiler, output: Path
+    ) -> None:
+        assert self.go_debug_info is not None
+        debug_dir = Path(self.go_debug_dir or os.path.join("build", "debug"))
+        for artifact in sizes.artifacts(staging):
+            with gopy_compiler.phase(f"{self.go_debug_info} debug info", "strip", artifact=artifact.name):
+                self._unstripped_sizes[output / artifact.name] = artifact.stat().st_size
+                try:
+                    debug_file = sizes.strip_debug_info(
+                        artifact,
+                        self.go_debug_info,
+                        debug_dir / f"{artifact.name}.debug",
+                        command_runner=gopy_compiler.command_runner,
+                    )
+                except OSError as err:
+                    raise errors.DistutilsExecError(f"failed to strip '{ext.original_name}' extension: {err}") from err
+            if debug_file is not None:
+                log.info("split debug information of %s into %s", artifact, debug_file)
+
+    def _analyze_sizes(self, ext: extension.GoExtension, output: Path, gopy_compiler: compiler.GoPyCompiler) -> None:
+        for artifact in sizes.artifacts(output):
+            with gopy_compiler.phase("analyze size", "size", artifact=artifact.name):
+                report = sizes.analyze(
+                    artifact, gopy_compiler.go_command, gopy_compiler.env, command_runner=gopy_compiler.command_runner
+                )
+            report["extension"] = ext.original_name
+            report["unstripped_size"] = self._unstripped_sizes.get(artifact)
+            log.info("%s", sizes.format_report(report))
+            with self._size_lock:
+                self._size_reports.append(report)
+
+    def check_sizes(self) -> None:
+        """Write the size report of built GoExtensions to `go_size_report`, and check them against `go_size_budget`.
+
+        Raises
+        ------
+        distutils.errors.DistutilsError
+            If a shared library is larger than `go_size_budget`.
+        """
+        if self.go_size_report:
+            path = sizes.write_report(self.go_size_report, self._size_reports, self._size_budget)
+            log.info("wrote size report to %s", path)
+        if self._size_budget is None:
+            return
+        over = sizes.over_budget(self._size_reports, self._size_budget)
+        if over:
+            raise errors.DistutilsError(
+                f"shared libraries exceed the size budget of {self._size_budget} bytes: {', '.join(over)}"
+            )
+
+    def _inplace_package_dir(self, ext: extension.GoExtension) -> Path:
+        # Reference: setuptools.command.build_ext.build_ext.copy_extensions_to_source()
+        build_py = self.get_finalized_command("build_py")
+        fullname = str(self.get_ext_fullname(ext.name))
+        modpath = fullname.split(".")
+        package = ".".join(modpath[:-1])
+        package_dir = build_py.get_package_dir(package)
+        # end
+        return Path(package_dir)
+
+    def copy_extensions_to_source(self) -> None:
+        # GoExtensions are placed in source by build_go().
+        extensions = self.extensions
+        self.extensions = [ext for ext in extensions if not isinstance(ext, extension.GoExtension)]
+        try:
+            super().copy_extensions_to_source()
+        finally:
+            self.extensions = extensions
 
     def should_skip_ext(self, ext: Extension) -> bool:
         """Return true if the extension should be skipped.
@@ -82,4 +659,179 @@ class build_ext(_build_ext.build_ext):  # type: ignore
         """
         ext_path = self.get_ext_fullpath(ext.name)
         depends = ext.sources + ext.depends
+        if isinstance(ext, extension.GoExtension):
+            if ext.resolve_depends:
+                depends = depends + self.gopy_compiler.resolve_dependencies(ext.packages)
+            if ext.pgo or self.gopy_compiler.pgo:
+                depends = depends + [ext.pgo or self.gopy_compiler.pgo]
+            if self._read_build_config(ext) != self.gopy_compiler.build_config(ext):
+                return False
+            config = self._build_config_path(ext)
+            if config is not None and config.exists() and os.path.exists(ext_path):
+                # Unchanged files keep their modification times, so the configuration recorded by the build dates it.
+                ext_path = str(config)
         return not (self.force or dep_util.newer_group(depends, ext_path, "newer"))
+
+    def _build_config_path(self, ext: extension.GoExtension) -> t.Optional[Path]:
+        if self.build_temp is None:
+            return None
+        return Path(self.build_temp, "go-extension", f"{ext.name}.json")
+
+    def _read_build_config(self, ext: extension.GoExtension) -> t.Optional[str]:
+        """Return the configuration `ext` was last built with, recorded by `_write_build_config()`.
+
+        The current configuration is returned if it is not recorded in a build directory.
+        """
+        path = self._build_config_path(ext)
+        if path is None:
+            return self.gopy_compiler.build_config(ext)
+        try:
+            return path.read_text()
+        except OSError:
+            return None
+
+    def _write_build_config(self, ext: extension.GoExtension) -> None:
+        path = self._build_config_path(ext)
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(self.gopy_compiler.build_config(ext))
+
+
+def _facade_modules(modules: t.Sequence[str]) -> list[str]:
+    """Return modules re-exported by a facade of a bundle, which are those of its Go packages and `go`."""
+    return list(dict.fromkeys(["go", *modules]))
+
+
+def _write_lazy_init(
+    output: Path, modules: t.Sequence[str], runtime: bool = False, metrics: bool = False, handles: bool = False
+) -> None:
+    """Write `__init__.py` loading `modules` of the package on first attribute access.
+
+    If `runtime` is true, the Go runtime is started by `init()` of `_runtime.py` before the first module is loaded.
+    If `metrics` is true, calls of Go functions are recorded by `_metrics.py` from then on,
+    and if `handles` is true, Go objects are made context managers by `_handles.py`.
+    """
+    imports = (
+        (_RUNTIME_IMPORT if runtime else "")
+        + (_METRICS_IMPORT if metrics else "")
+        + (_HANDLES_IMPORT if handles else "")
+    )
+    start = (
+        ("        init()\n" if runtime else "")
+        + ("        _instrument()\n" if metrics else "")
+        + ("        _track()\n" if handles else "")
+    )
+    _write_text(
+        output / "__init__.py",
+        templates.render(
+            "lazy_init.py.in", modules=repr(sorted(modules)), imports="\n" + imports if imports else "", start=start
+        ),
+    )
+
+
+def _write_runtime(output: Path, settings: t.Mapping[str, str], lazy: bool) -> None:
+    """Write `_runtime.py` starting the Go runtime of the package with `settings`.
+
+    Unless `lazy`, `__init__.py` written by gopy is prefixed to start the runtime by it when imported.
+    """
+    _write_text(
+        output / "_runtime.py",
+        templates.render("runtime.py.in", settings=repr(dict(settings)), setters=repr(bindings.RUNTIME_SETTERS)),
+    )
+    init = output / "__init__.py"
+    if lazy:
+        return
+    content = init.read_text() if init.exists() else ""
+    prefix = _RUNTIME_INIT.format(runtime_import=_RUNTIME_IMPORT)
+    if not content.startswith(prefix):
+        _write_text(init, prefix + content)
+
+
+def _write_metrics(output: Path, lazy: bool, runtime: bool) -> None:
+    """Write `_metrics.py` recording calls of Go functions of the package, and exporting profiles.
+
+    Unless `lazy`, `__init__.py` written by gopy is suffixed to record calls when imported.
+    If `runtime` is true, the Go runtime is started by `init()` of `_runtime.py` before calls are recorded.
+    """
+    _write_text(
+        output / "_metrics.py",
+        templates.render(
+            "metrics.py.in",
+            heap_stats=repr(bindings.HEAP_STATS),
+            gopy_helpers=repr(bindings.GOPY_HELPERS),
+            runtime_start=_RUNTIME_START if runtime else "",
+        ),
+    )
+    if not lazy:
+        _append_init(output, _METRICS_INIT.format(metrics_import=_METRICS_IMPORT))
+
+
+def _write_handles(output: Path, lazy: bool, runtime: bool) -> None:
+    """Write `_handles.py` reporting and releasing handles of Go objects of the package.
+
+    Unless `lazy`, `__init__.py` written by gopy is suffixed to make Go objects context managers when imported.
+    If `runtime` is true, the Go runtime is started by `init()` of `_runtime.py` before then.
+    """
+    _write_text(
+        output / "_handles.py",
+        templates.render(
+            "handles.py.in", handle_stats=repr(bindings.HANDLE_STATS), runtime_start=_RUNTIME_START if runtime else ""
+        ),
+    )
+    if not lazy:
+        _append_init(output, _HANDLES_INIT.format(handles_import=_HANDLES_IMPORT))
+
+
+def _append_init(output: Path, suffix: str) -> None:
+    """Append `suffix` to `__init__.py` of the package unless it is already there."""
+    init = output / "__init__.py"
+    content = init.read_text() if init.exists() else ""
+    if suffix not in content:
+        _write_text(init, content + suffix)
+
+
+def _write_text(path: Path, content: str) -> None:
+    if not path.exists() or path.read_text() != content:
+        if path.exists():
+            path.unlink()  # It may be hardlinked to the inplace copy.
+        path.write_text(content)
+
+
+def _link_tree(src: Path, dst: Path, files: t.Iterable[str]) -> None:
+    """Place `files` under `src` in `dst` by hardlinks, reflinks or copies, whichever the filesystem supports.
+
+    Files are replaced rather than written in place, so that those hardlinked between `src` and `dst` stay intact,
+    and those with the same content are left untouched, keeping their modification times.
+    """
+    for name in sorted(files):
+        target = dst / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _link_file(src / name, target)
+
+
+def _link_file(src: Path, dst: Path) -> None:
+    if dst.exists():
+        if os.path.samefile(src, dst) or cache._same_content(src, dst):
+            return
+        dst.unlink()
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    if not _reflink(src, dst):
+        shutil.copy2(src, dst)
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        return False
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            return False
+    shutil.copystat(src, dst)
+    return True
@@ -0,0 +1,155 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+import codecs
+import collections
+import os
+import shutil
+import tempfile
+import typing as t
+from pathlib import Path
+
+# Characters of the end of a log kept in memory to be shown on failure.
+TAIL_SIZE = 1 << 14  # 16 KiB
+# Bytes of a log kept in memory before it is spooled to a temporary file.
+SPOOL_SIZE = 1 << 20  # 1 MiB
+
+
+class BuildLog:
+    """Bounded, streaming log of the commands of a build and their output.
+
+    The whole log is written to a temporary file, held in memory until it exceeds `spool_size` bytes,
+    and the last `tail_size` characters are kept in a ring buffer to be shown without reading it back.
+
+    Examples
+    --------
+    >>> build_log = BuildLog(tail_size=8)
+    >>> build_log.command(["echo", "hello"])
+    >>> build_log.write("hello\\n")
+    >>> build_log.getvalue()
+    'echo hello\\nhello\\n'
+    >>> build_log.tail()
+    'hello\\n'
+    >>> build_log.summary()
+    '1 commands, 1 lines of output (6 bytes)'
+    """
+
+    tail_size: int
+    spool_size: int
+    size: int
+    lines: int
+    commands: int
+
+    def __init__(self, tail_size: int = TAIL_SIZE, spool_size: int = SPOOL_SIZE) -> None:
+        """
+        Parameters
+        ----------
+        tail_size : int
+            Characters of the end of the log kept in memory.
+        spool_size : int
+            Bytes of the log kept in memory before it is spooled to a temporary file.
+        """
+        self.tail_size = tail_size
+        self.spool_size = spool_size
+        self.size = 0
+        self.lines = 0
+        self.commands = 0
+        self._file: t.Optional[t.IO[bytes]] = None
+        self._tail: collections.deque[str] = collections.deque()
+        self._tail_length = 0
+        self._written = 0
+        self._newline = True
+
+    def __bool__(self) -> bool:
+        return self._written > 0
+
+    def command(self, cmd: t.Sequence[str]) -> None:
+        """Record a command, on its own line."""
+        self.commands += 1
+        self._append(("" if self._newline else "\n") + " ".join(cmd) + "\n")
+
+    def write(self, text: str) -> None:
+        """Record output of a command. Used as `on_output` of `go_extension.runner.Runner.run()`."""
+        if not text:
+            return
+        self.size += len(text.encode(errors="replace"))
+        self.lines += text.count("\n")
+        self._append(text)
+
+    def extend(self, other: "BuildLog") -> None:
+        """Append the log of a build run by another compiler, like a clone, and close it."""
+        self.commands += other.commands
+        self.size += other.size
+        self.lines += other.lines
+        if other:
+            assert other._file is not None
+            if not self._newline:
+                self._append("\n")
+            other._file.seek(0)
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            while True:
+                data = other._file.read(1 << 16)
+                self._append(decoder.decode(data, final=not data))
+                if not data:
+                    break
+        other.close()
+
+    def getvalue(self) -> str:
+        """Return the whole log."""
+        if self._file is None:
+            return ""
+        self._file.seek(0)
+        value = self._file.read().decode(errors="replace")
+        self._file.seek(0, os.SEEK_END)
+        return value
+
+    def tail(self) -> str:
+        """Return the end of the log, starting at a line if it is truncated."""
+        text = "".join(self._tail)
+        size = self.tail_size
+        if len(text) > size:
+            text = text[-size:]
+            if "\n" in text[:-1]:
+                start = text.index("\n") + 1
+                text = text[start:]
+        return text
+
+    def summary(self) -> str:
+        """Return a one-line summary of the log."""
+        return f"{self.commands} commands, {self.lines} lines of output ({self.size} bytes)"
+
+    def save(self, path: t.Optional[str | os.PathLike[str]] = None) -> Path:
+        """Write the whole log to `path`, or to a new temporary file if None, and return the path."""
+        if path is None:
+            fd, name = tempfile.mkstemp(prefix="go-extension-", suffix=".log")
+            os.close(fd)
+            path = name
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with target.open("wb") as f:
+            if self._file is not None:
+                self._file.seek(0)
+                shutil.copyfileobj(self._file, f)
+                self._file.seek(0, os.SEEK_END)
+        return target
+
+    def close(self) -> None:
+        """Discard the log."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._tail.clear()
+        self._tail_length = 0
+        self._written = 0
+        self._newline = True
+
+    def _append(self, text: str) -> None:
+        if not text:
+            return
+        if self._file is None:
+            self._file = t.cast(t.IO[bytes], tempfile.SpooledTemporaryFile(max_size=self.spool_size))
+        self._file.write(text.encode(errors="replace"))
+        self._written += len(text)
+        self._newline = text.endswith("\n")
+        self._tail.append(text)
+        self._tail_length += len(text)
+        while len(self._tail) > 1 and self._tail_length - len(self._tail[0]) >= self.tail_size:
+            self._tail_length -= len(self._tail.popleft())
@@ -0,0 +1,305 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+import hashlib
+import os
+import shutil
+import tempfile
+import typing as t
+from pathlib import Path
+from setuptools._distutils import errors
+
+CACHE_DIR_ENV = "GO_EXTENSION_CACHE_DIR"
+CACHE_MAX_SIZE_ENV = "GO_EXTENSION_CACHE_MAX_SIZE"
+DEFAULT_MAX_SIZE = 1 << 30  # 1 GiB
+# The directory of build cache entries in the cache directory, which holds other state of go-extension as well.
+BUILDS_DIR = "builds"
+
+Snapshot = dict[str, tuple[int, int]]
+
+
+class BuildCache:
+    """Content-addressed cache of build artifacts.
+
+    Each entry is a directory named after the hash of the build inputs
+    and holds the files the build wrote into its output directory.
+    Entries are evicted in least-recently-used order once the total size exceeds `max_size`.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> cache = BuildCache(tempfile.mkdtemp())
+    >>> key = cache.key([b"main.go", b"package main"])
+    >>> cache.restore(key, tempfile.mkdtemp())
+    False
+    """
+
+    root: Path
+    max_size: int
+
+    def __init__(self, root: str | os.PathLike[str], max_size: int = DEFAULT_MAX_SIZE) -> None:
+        """
+        Parameters
+        ----------
+        root : str | os.PathLike[str]
+            A directory to store cache entries in, and nothing else, since any directory in it may be evicted.
+        max_size : int
+            The maximum total size of cache entries in bytes.
+        """
+        self.root = Path(root)
+        self.max_size = max_size
+
+    @classmethod
+    def from_env(cls) -> t.Optional["BuildCache"]:
+        """Create a BuildCache configured by environment variables.
+
+        `GO_EXTENSION_CACHE_DIR` sets the cache location
+        (default: `$XDG_CACHE_HOME/go-extension` or `~/.cache/go-extension`), whose `builds` holds the entries,
+        and `GO_EXTENSION_CACHE_MAX_SIZE` sets the size cap in bytes (default: 1 GiB).
+        The cache is disabled if either is set to an empty string or the size cap is 0.
+
+        Returns
+        -------
+        go_extension.cache.BuildCache | None
+
+        Raises
+        ------
+        distutils.errors.DistutilsOptionError
+            If `GO_EXTENSION_CACHE_MAX_SIZE` is not an integer.
+        """
+        root = cache_root()
+        value = os.environ.get(CACHE_MAX_SIZE_ENV, str(DEFAULT_MAX_SIZE))
+        try:
+            max_size = int(value or 0)
+        except ValueError:
+            raise errors.DistutilsOptionError(
+                f"{CACHE_MAX_SIZE_ENV} must be an integer number of bytes, not {value!r}"
+            ) from None
+        if root is None or max_size <= 0:
+            return None
+        return cls(root / BUILDS_DIR, max_size)
+
+    def key(self, inputs: t.Iterable[bytes]) -> str:
+        """Return a cache key hashing `inputs`.
+
+        Parameters
+        ----------
+        inputs : Iterable[bytes]
+            Everything the build output depends on.
+
+        Returns
+        -------
+        str
+        """
+        digest = hashlib.sha256()
+        for item in inputs:
+            digest.update(len(item).to_bytes(8, "little"))
+            digest.update(item)
+        return digest.hexdigest()
+
+    def restore(self, key: str, output: str | os.PathLike[str]) -> bool:
+        """Copy the files of the entry `key` into `output`.
+
+        Parameters
+        ----------
+        key : str
+            A cache key.
+        output : str | os.PathLike[str]
+            An output directory to restore files into.
+
+        Returns
+        -------
+        bool
+            True if the entry exists and was restored.
+        """
+        entry = self.root / key
+        if not entry.is_dir():
+            return False
+        for src in sorted(entry.rglob("*")):
+            if src.is_file():
+                dst = Path(output, src.relative_to(entry))
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                # A file is replaced rather than truncated, as it may be a shared library loaded by a process.
+                tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+                shutil.copy(src, tmp)
+                os.replace(tmp, dst)
+        os.utime(entry)
+        return True
+
+    def store(self, key: str, output: str | os.PathLike[str], files: t.Iterable[str]) -> None:
+        """Store `files` in `output` as the entry `key` and evict old entries.
+
+        Parameters
+        ----------
+        key : str
+            A cache key.
+        output : str | os.PathLike[str]
+            The output directory of the build.
+        files : Iterable[str]
+            Paths of the files to store, relative to `output`.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=".tmp-", dir=self.root))
+        try:
+            for name in files:
+                dst = tmp / name
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(Path(output, name), dst)
+            os.replace(tmp, self.root / key)
+        except OSError:
+            # Another process stored the same entry first.
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache fits in `max_size`."""
+        if not self.root.is_dir():
+            return
+        entries = [entry for entry in self.root.iterdir() if entry.is_dir() and not entry.name.startswith(".")]
+        sizes = {entry: _tree_size(entry) for entry in entries}
+        total = sum(sizes.values())
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+
+def cache_root() -> t.Optional[Path]:
+    """Return the cache directory of go-extension set by `GO_EXTENSION_CACHE_DIR`, or None if disabled."""
+    root = os.environ.get(CACHE_DIR_ENV, str(user_cache_dir() / "go-extension"))
+    return Path(root) if root else None
+
+
+def user_cache_dir() -> Path:
+    """Return the user cache directory."""
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+
+
+def snapshot(directory: str | os.PathLike[str]) -> Snapshot:
+    """Return modification time and size of each file under `directory`.
+
+    Parameters
+    ----------
+    directory : str | os.PathLike[str]
+
+    Returns
+    -------
+    dict[str, tuple[int, int]]
+        A mapping of a relative path to its (st_mtime_ns, st_size).
+    """
+    root = Path(directory)
+    if not root.is_dir():
+        return {}
+    result: Snapshot = {}
+    for path in root.rglob("*"):
+        if path.is_file():
+            stat = path.stat()
+            result[path.relative_to(root).as_posix()] = (stat.st_mtime_ns, stat.st_size)
+    return result
+
+
+def stat_files(paths: t.Iterable[str]) -> Snapshot:
+    """Return modification time and size of each of `paths`, or (-1, -1) if missing.
+
+    Parameters
+    ----------
+    paths : Iterable[str]
+        Paths of files or directories.
+
+    Returns
+    -------
+    dict[str, tuple[int, int]]
+        A mapping of a path to its (st_mtime_ns, st_size).
+    """
+    result: Snapshot = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            result[path] = (-1, -1)
+        else:
+            result[path] = (stat.st_mtime_ns, stat.st_size)
+    return result
+
+
+def changed_files(directory: str | os.PathLike[str], before: Snapshot) -> list[str]:
+    """Return relative paths of files under `directory` created or modified since `before`.
+
+    Parameters
+    ----------
+    directory : str | os.PathLike[str]
+    before : dict[str, tuple[int, int]]
+        A snapshot taken by `snapshot()`.
+
+    Returns
+    -------
+    list[str]
+    """
+    after = snapshot(directory)
+    return sorted(name for name, stat in after.items() if before.get(name) != stat)
+
+
+def replace_changed(src: str | os.PathLike[str], dst: str | os.PathLike[str]) -> list[str]:
+    """Move files under `src` whose content differs from that in `dst` into `dst`.
+
+    Each file is replaced by an atomic rename, so `src` should be on the same filesystem as `dst`.
+    Files with the same content are left untouched in both directories.
+
+    Parameters
+    ----------
+    src : str | os.PathLike[str]
+    dst : str | os.PathLike[str]
+
+    Returns
+    -------
+    list[str]
+        Sorted relative paths of created or changed files.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> src, dst = Path(tempfile.mkdtemp()), Path(tempfile.mkdtemp())
+    >>> _ = (src / "go.py").write_text("same")
+    >>> _ = (dst / "go.py").write_text("same")
+    >>> _ = (src / "hello.py").write_text("new")
+    >>> replace_changed(src, dst)
+    ['hello.py']
+    """
+    src_root, dst_root = Path(src), Path(dst)
+    changed = []
+    for path in sorted(src_root.rglob("*")):
+        if not path.is_file():
+            continue
+        name = path.relative_to(src_root).as_posix()
+        target = dst_root / name
+        if target.is_file() and _same_content(path, target):
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(path, target)
+        changed.append(name)
+    return changed
+
+
+def relocate(directory: str | os.PathLike[str], old: str | os.PathLike[str], new: str | os.PathLike[str]) -> None:
+    """Replace path `old` with `new` in text files under `directory`, like commands recorded in generated code."""
+    old_bytes, new_bytes = os.fsencode(old), os.fsencode(new)
+    for path in Path(directory).rglob("*"):
+        if path.is_file():
+            content = path.read_bytes()
+            if old_bytes in content and b"\0" not in content:
+                path.write_bytes(content.replace(old_bytes, new_bytes))
+
+
+def _same_content(a: Path, b: Path) -> bool:
+    if a.stat().st_size != b.stat().st_size:
+        return False
+    with a.open("rb") as fa, b.open("rb") as fb:
+        while True:
+            chunk = fa.read(1 << 16)
+            if chunk != fb.read(1 << 16):
+                return False
+            if not chunk:
+                return True
+
+
+def _tree_size(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.rglob("*") if path.is_file())
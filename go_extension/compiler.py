@@ -1,10 +1,52 @@
 # Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+import contextlib
+import copy
+import json
 import os
+import shlex
 import sys
 import shutil
-from setuptools._distutils import spawn, log
+import subprocess
+import sysconfig
+import tempfile
+import time
+import typing as t
+from concurrent import futures
+from pathlib import Path
+from setuptools._distutils import errors, log
 
-from go_extension import extension, exceptions
+from go_extension import bindings, buildlog, cache, daemon, extension, exceptions, profiling, runner, toolchain
+
+GOPY_PACKAGE = "github.com/go-python/gopy"
+GOIMPORTS_PACKAGE = "golang.org/x/tools/cmd/goimports"
+# Environment variables affecting the output of `gopy build`.
+_BUILD_ENV_VARS = ("GOFLAGS", "GOOS", "GOARCH", "CC", "CXX", "CGO_CFLAGS", "CGO_LDFLAGS")
+# Flags cgo uses if `CGO_CFLAGS` or `CGO_LDFLAGS` is not set.
+_CGO_DEFAULT_FLAGS = "-g -O2"
+# A main package importing Go packages, compiled by `GoPyCompiler.prewarm()` in the same way as by gopy.
+_PREWARM_MAIN = """\
+// Generated by go-extension to compile Go packages of GoExtensions into the Go build cache.
+package main
+
+import "C"
+
+import (
+{imports})
+
+func main() {{}}
+"""
+# Fields of `go list -json` output listing files of a package.
+_GO_LIST_FILE_FIELDS = (
+    "GoFiles",
+    "CgoFiles",
+    "CFiles",
+    "CXXFiles",
+    "HFiles",
+    "SFiles",
+    "SwigFiles",
+    "SysoFiles",
+    "EmbedFiles",
+)
 
 
 class GoPyCompiler:
@@ -17,11 +59,32 @@ class GoPyCompiler:
     """
 
     go_command: str = "go"
+    make_command: str = "make"
     verbose: bool = False
     dry_run: bool = False
     force: bool = False
     inplace: bool = False
+    workers: int = 1
+    capture_output: bool = False
+    offline: bool = False
+    gopy_version: str = "latest"
+    goimports_version: str = "latest"
     env: dict[str, str] = dict()
+    captured: buildlog.BuildLog
+    build_cache: t.Optional[cache.BuildCache] = None
+    tools: dict[str, toolchain.Tool]
+    profile: t.Optional[profiling.BuildProfile] = None
+    command_runner: runner.Runner
+    timeout: t.Optional[float] = None
+    build_flags: list[str]
+    cgo_cflags: list[str]
+    cgo_ldflags: list[str]
+    pgo: t.Optional[str] = None
+    python: str = sys.executable
+    daemon_socket: t.Optional[str] = None
+    cwd: t.Optional[str] = None
+    _dependencies: dict[str, list[str]]
+    _unresolved: set[str]
 
     def __init__(
         self,
@@ -30,12 +93,66 @@ class GoPyCompiler:
         dry_run: bool = False,
         force: bool = False,
         inplace: bool = False,
+        workers: int = 1,
+        capture_output: bool = False,
+        use_cache: bool = True,
+        gocache: t.Optional[str] = None,
+        gomodcache: t.Optional[str] = None,
+        goflags: t.Optional[str] = None,
+        offline: bool = False,
+        goproxy: t.Optional[str] = None,
+        gopy_version: str = "latest",
+        goimports_version: str = "latest",
+        timeout: t.Optional[float] = None,
+        build_flags: t.Sequence[str] = (),
+        cgo_cflags: t.Sequence[str] = (),
+        cgo_ldflags: t.Sequence[str] = (),
+        pgo: t.Optional[str] = None,
+        daemon_socket: t.Optional[str] = None,
+        cwd: t.Optional[str] = None,
     ) -> None:
         """
         Parameters
         ----------
         go_command : str
             The Golang executable command. used as `go mod`, `go get`, etc...
+        workers : int
+            The maximum number of extensions built concurrently.
+        capture_output : bool
+            If true, spawned commands and their output are streamed into `captured`, a bounded log,
+            instead of being written to the terminal.
+        use_cache : bool
+            If true, outputs of `build()` are cached in `go_extension.cache.BuildCache.from_env()`.
+        gocache : str | None
+            The Go build cache directory (`GOCACHE`).
+            Defaults to `GOCACHE` in the environment or `go-build` in the user cache directory.
+        gomodcache : str | None
+            The Go module cache directory (`GOMODCACHE`). Defaults to that of Go, like `$GOPATH/pkg/mod`.
+        goflags : str | None
+            Flags passed to every `go` command (`GOFLAGS`). Defaults to `GOFLAGS` in the environment.
+        offline : bool
+            If true, the network is never used.
+            Modules are loaded from `vendor` if `vendor/modules.txt` exists,
+            otherwise from `goproxy` or the module cache.
+        goproxy : str | None
+            The module proxy (`GOPROXY`). A local directory is used as a `file://` proxy.
+        gopy_version, goimports_version : str
+            Versions of gopy and goimports to install if missing.
+            Pinned versions are installed in a versioned directory in the cache, regardless of `PATH`.
+        timeout : float | None
+            Timeout of each spawned command in seconds, or None for no timeout.
+        build_flags : Sequence[str]
+            Flags of `go build` compiling every extension, like `-trimpath` or `-ldflags=-s -w`.
+        cgo_cflags, cgo_ldflags : Sequence[str]
+            Flags added to `CGO_CFLAGS` and `CGO_LDFLAGS` for every extension.
+        pgo : str | None
+            A CPU profile for profile-guided optimization of every extension (Go1.21 or above).
+        daemon_socket : str | None
+            The Unix socket of a build server to delegate builds and `go list` to (see `go_extension.daemon`).
+            Defaults to `go_extension.daemon.socket_path()`, which is None unless set in the environment.
+        cwd : str | None
+            The working directory of spawned commands, which relative paths are resolved against.
+            Defaults to that of this process.
         other parameters : bool
             See distutils.ccompiler.CCompiler.__init__().
 
@@ -45,36 +162,344 @@ class GoPyCompiler:
         self.dry_run = dry_run
         self.force = force
         self.inplace = inplace
+        self.workers = max(1, int(workers))
+        self.capture_output = capture_output
+        self.captured = buildlog.BuildLog()
+        self.build_cache = cache.BuildCache.from_env() if use_cache else None
+        self.tools = {}
+        self._dependencies = {}
+        self._unresolved = set()
         self.env = os.environ.copy()
         self.env["LD_LIBRATY_PATH"] = (self.env.get("LD_LIBRATY_PATH", "") + ":" + os.curdir).strip(":")
+        user_cache_dir = cache.user_cache_dir()
+        self.env["GOCACHE"] = os.path.abspath(gocache or self.env.get("GOCACHE") or user_cache_dir / "go-build")
+        if gomodcache is not None:
+            self.env["GOMODCACHE"] = os.path.abspath(gomodcache)
+        if goflags is not None:
+            self.env["GOFLAGS"] = goflags
+        self.offline = offline
+        self.timeout = timeout
+        self.build_flags = list(build_flags)
+        self.cgo_cflags = list(cgo_cflags)
+        self.cgo_ldflags = list(cgo_ldflags)
+        self.pgo = pgo
+        if daemon_socket is None:
+            socket_path = daemon.socket_path()
+            daemon_socket = None if socket_path is None else str(socket_path)
+        self.daemon_socket = daemon_socket
+        self.cwd = cwd
+        self.command_runner = runner.Runner()
+        self.gopy_version = gopy_version
+        self.goimports_version = goimports_version
+        if goproxy is not None:
+            self.env["GOPROXY"] = _proxy_url(goproxy)
+        if offline:
+            if goproxy is None:
+                self.env["GOPROXY"] = "off"
+            self.env["GOSUMDB"] = "off"
+            goflags = self.env.get("GOFLAGS", "")
+            if "-mod=" not in goflags:
+                mod = (
+                    "-mod=vendor" if os.path.isfile(self._path(os.path.join("vendor", "modules.txt"))) else "-mod=mod"
+                )
+                self.env["GOFLAGS"] = f"{goflags} {mod}".strip()
+
+    def clone(self, **kwargs: t.Any) -> "GoPyCompiler":
+        """Return a shallow copy of this compiler with attributes overridden by `kwargs`.
+
+        The copy has its own `captured` log, so it can be used from another thread.
+        """
+        clone = copy.copy(self)
+        clone.captured = buildlog.BuildLog(self.captured.tail_size, self.captured.spool_size)
+        for key, value in kwargs.items():
+            setattr(clone, key, value)
+        return clone
+
+    def resolve_dependencies(self, packages: t.Sequence[str]) -> list[str]:
+        """Return local files the Go packages depend on, found by `go list -deps -json`.
+
+        Files of the packages, of their transitive imports in the main module or in locally replaced modules,
+        and `go.mod`/`go.sum` of the main module are listed.
+        Results are memoised per package, so `go list` runs once for packages shared by many extensions.
+        If `go list` fails, no files are listed for the packages,
+        and the failure is memoised as well until `forget_dependencies()`.
+        Packages are resolved by the build server listening on `daemon_socket` if it is running,
+        which keeps them resolved across builds (see `go_extension.daemon`).
+
+        Parameters
+        ----------
+        packages : Sequence[str]
+            Go packages.
+
+        Returns
+        -------
+        list[str]
+            Sorted paths, relative to `cwd` if under it.
+        """
+        missing = [
+            pkg for pkg in dict.fromkeys(packages) if pkg not in self._dependencies and pkg not in self._unresolved
+        ]
+        if missing and self.daemon_socket is not None and not self.dry_run:
+            delegated = daemon.delegate_resolve(self, missing)
+            if delegated is not None:
+                dependencies, unresolved = delegated
+                self._dependencies.update(dependencies)
+                self._unresolved.update(unresolved)
+                missing = []
+        if missing:
+            resolved = self._go_list_dependencies(missing)
+            if resolved is None:
+                self._unresolved.update(missing)
+            else:
+                self._dependencies.update(resolved)
+        files: set[str] = set()
+        for pkg in packages:
+            files.update(self._dependencies.get(pkg, []))
+        return sorted(files)
+
+    def forget_dependencies(self) -> None:
+        """Drop memoised results of `resolve_dependencies()`, including failures, to list files again."""
+        self._dependencies.clear()
+        self._unresolved.clear()
+
+    def _go_list_dependencies(self, packages: list[str]) -> t.Optional[dict[str, list[str]]]:
+        cmd = [self._executable("go"), "list", "-deps", "-json"] + packages
+        try:
+            with self.phase("go list", "spawn"):
+                proc = subprocess.run(
+                    cmd, env=self.env, cwd=self.cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+                )
+        except OSError as err:
+            log.warn("failed to resolve dependencies of %s: %s", packages, err)
+            return None
+        if proc.returncode:
+            log.warn("failed to resolve dependencies of %s:\n%s", packages, proc.stderr.strip())
+            return None
+        decoder = json.JSONDecoder()
+        listed: dict[str, dict[str, t.Any]] = {}
+        text = proc.stdout.strip()
+        while text:
+            info, end = decoder.raw_decode(text)
+            listed[info["ImportPath"]] = info
+            text = text[end:].lstrip()
+        dependencies: dict[str, list[str]] = {pkg: [] for pkg in packages}
+        for pkg, info in listed.items():
+            if info.get("Standard"):
+                continue
+            files: set[str] = set()
+            for path in [pkg] + info.get("Deps", []):
+                files.update(_local_package_files(listed.get(path), self.cwd))
+            go_mod = (info.get("Module") or {}).get("GoMod")
+            if go_mod:
+                go_sum = os.path.join(os.path.dirname(go_mod), "go.sum")
+                files.update(_relative_path(path, self.cwd) for path in (go_mod, go_sum))
+            dependencies[pkg] = sorted(files)
+        return dependencies
+
+    def package_names(self, packages: t.Sequence[str]) -> dict[str, str]:
+        """Return names of Go packages, which gopy uses as names of their Python modules.
+
+        Parameters
+        ----------
+        packages : Sequence[str]
+            Go packages.
+
+        Returns
+        -------
+        dict[str, str]
+            A mapping of an import path to its package name.
+            The last element of the import path is used if `go list` fails.
+        """
+        names = {pkg: pkg.rstrip("/").rsplit("/", 1)[-1] for pkg in packages}
+        cmd = [self._executable("go"), "list", "-f", "{{.ImportPath}} {{.Name}}"] + list(packages)
+        try:
+            proc = subprocess.run(
+                cmd, env=self.env, cwd=self.cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            )
+        except OSError:
+            return names
+        if proc.returncode:
+            log.warn("failed to list names of %s:\n%s", packages, proc.stderr.strip())
+            return names
+        for line in proc.stdout.splitlines():
+            path, name = line.split()
+            names[path] = name
+        return names
+
+    def prewarm(self, exts: t.Sequence[extension.GoExtension], directory: str | os.PathLike[str]) -> float:
+        """Download modules and compile the Go packages of `exts` with their dependencies into the Go build cache.
+
+        Run before building `exts`, so that their builds reuse the shared dependencies
+        instead of compiling them again or racing to fill the cache.
+        Extensions are grouped by their build flags, and the union of the packages of each group
+        is compiled once by `go build -buildmode=c-shared` of a generated main package importing them,
+        as gopy does, so that the compiled packages match those of gopy in the cache.
+        A failure is logged as a warning, and leaves the builds to compile the packages themselves.
+
+        Parameters
+        ----------
+        exts : Sequence[go_extension.extension.GoExtension]
+            GoExtension objects to be built.
+        directory : str | os.PathLike[str]
+            A directory in the main module to write the main packages in.
+
+        Returns
+        -------
+        float
+            Estimated seconds saved, compared to each extension compiling the dependencies from a cold cache.
+        """
+        if self.dry_run or not exts:
+            return 0.0
+        go = self._executable("go")
+        groups: dict[str, list[extension.GoExtension]] = {}
+        for ext in exts:
+            flags = self.go_build_flags(ext) if self._uses_makefile(ext) else []
+            env = self.build_env(ext)
+            key = json.dumps([flags] + [env.get(name, "") for name in ("GOFLAGS", "CGO_CFLAGS", "CGO_LDFLAGS")])
+            groups.setdefault(key, []).append(ext)
+        saved = 0.0
+        with self.phase("prewarm", "prewarm"):
+            if not self.offline:
+                try:
+                    self.spawn([go, "mod", "download"])
+                except errors.DistutilsExecError as err:
+                    log.warn("failed to download Go modules: %s", err)
+            for i, group in enumerate(groups.values()):
+                packages = list(dict.fromkeys(pkg for ext in group for pkg in ext.packages))
+                main = Path(directory, f"prewarm{i}")
+                main.mkdir(parents=True, exist_ok=True)
+                (main / "main.go").write_text(
+                    _PREWARM_MAIN.format(imports="".join(f'\t_ "{pkg}"\n' for pkg in packages))
+                )
+                flags = self.go_build_flags(group[0]) if self._uses_makefile(group[0]) else []
+                output = main / f"prewarm{sysconfig.get_config_var('SHLIB_SUFFIX') or '.so'}"
+                builder = self.clone(env=self.build_env(group[0]))
+                before = builder.count_go_cache()
+                started = time.perf_counter()
+                try:
+                    builder.spawn(
+                        [
+                            go,
+                            "build",
+                            "-buildmode=c-shared",
+                            *flags,
+                            "-o",
+                            str(output),
+                            str(main.resolve()),
+                        ]
+                    )
+                except errors.DistutilsExecError as err:
+                    log.warn("failed to compile %s into the Go build cache: %s", ", ".join(packages), err)
+                    continue
+                finally:
+                    self.captured.extend(builder.captured)
+                elapsed = time.perf_counter() - started
+                after = builder.count_go_cache()
+                new_entries = None if before is None or after is None else max(0, after - before)
+                # An estimate, not a measurement: without prewarming, each extension would compile
+                # what is missing from the cache itself, taking about as long as the prewarm did.
+                group_saved = elapsed * (len(group) - 1) if new_entries != 0 else 0.0
+                saved += group_saved
+                log.info(
+                    "compiled %d Go packages of %d extensions with their dependencies in %.1fs%s, "
+                    "saving an estimated %.1fs of cold builds",
+                    len(packages),
+                    len(group),
+                    elapsed,
+                    "" if new_entries is None else f" ({new_entries} new Go build cache entries)",
+                    group_saved,
+                )
+        return saved
 
     def install_build_tools(self) -> None:
         """Install gopy and goimports.
 
+        Resolved executables are stored in `tools` and used by spawned commands.
+        Probes of the toolchain are memoised (see `go_extension.toolchain.probe()`),
+        so calling this for every extension is cheap.
+
         Raises
         ------
         go_extension.exceptions.GoNotFoundError
-            If `go` command not found.
+            If `go` command not found or older than Go1.16.
         """
-        if not shutil.which(self.go_command):
-            # ToDo: should check go version
+        go = toolchain.probe_go(self.go_command, self.env)
+        if go is None or go.version_info < (1, 16):
             raise exceptions.GoNotFoundError("Go1.16 or above is required to build this extension.")
-        if not _gopy_is_installed():
-            log.info("Installing gopy...")
-            cmd = [self.go_command, "install", "github.com/go-python/gopy@latest"]
-            self.spawn(cmd)
-        if not _goimports_is_installed():
-            log.info("Installing goimports...")
-            cmd = [
-                self.go_command,
-                "install",
-                "golang.org/x/tools/cmd/goimports@latest",
-            ]
-            self.spawn(cmd)
-
-    def generate(self, ext: extension.GoExtension, output: str | os.PathLike[str]) -> None:
+        self.tools = {"go": go}
+        build_tools = (
+            ("gopy", GOPY_PACKAGE, self.gopy_version, _gopy_is_installed),
+            ("goimports", GOIMPORTS_PACKAGE, self.goimports_version, _goimports_is_installed),
+        )
+        for name, package, version, is_installed in build_tools:
+            env = self._build_tool_env(go, name, version)
+            # Pinned versions run from their own directory, never another version found in `PATH`.
+            command = name if version == "latest" else os.path.join(env["GOBIN"], name)
+            installed = is_installed(env, go) if command == name else toolchain.probe(command, env, go) is not None
+            if not installed:
+                log.info("Installing %s...", name)
+                self._install_build_tool(go, f"{package}@{version}", env)
+                toolchain.forget(command)
+            tool = toolchain.probe(command, env, go)
+            if tool is not None:
+                self.tools[name] = tool
+        self._expose_build_tools()
+
+    def _expose_build_tools(self) -> None:
+        """Make `PATH` of `env` find the resolved `go` and `goimports`, which gopy runs by name.
+
+        Only the directories of build tools installed by `go install`, like a pinned version or `GOBIN`,
+        are prepended. The directory of `go` is shared with other commands, like `/usr/bin`,
+        so `PATH` is not reordered for it and a warning is logged instead.
+        """
+        for name, tool in self.tools.items():
+            found = shutil.which(name, path=self.env.get("PATH"))
+            if found is not None and os.path.realpath(found) == os.path.realpath(tool.path):
+                continue
+            if name == "go":
+                log.warn("gopy runs `go` found in PATH (%s), not %s", found, tool.path)
+                continue
+            self.env["PATH"] = os.pathsep.join(filter(None, [os.path.dirname(tool.path), self.env.get("PATH")]))
+
+    def _build_tool_env(self, go: toolchain.Tool, name: str, version: str) -> dict[str, str]:
+        """Return environment to find and install a build tool in.
+
+        Pinned versions are installed in their own directory in the cache,
+        so they are built once per machine and Go version.
+        The directory is prepended to `PATH`, so `go install` still finds git, gcc and other commands.
+        """
+        if version == "latest":
+            return self.env
+        root = cache.cache_root() or cache.user_cache_dir() / "go-extension"
+        bindir = str(root / "tools" / (go.version or "go") / f"{name}@{version}")
+        return dict(self.env, PATH=os.pathsep.join(filter(None, [bindir, self.env.get("PATH")])), GOBIN=bindir)
+
+    def _install_build_tool(self, go: toolchain.Tool, package: str, env: dict[str, str]) -> None:
+        # `go install pkg@version` runs outside the main module, where `-mod=vendor` is not allowed.
+        goflags = " ".join(flag for flag in env.get("GOFLAGS", "").split() if not flag.startswith("-mod="))
+        installer = self.clone(env=dict(env, GOFLAGS=goflags))
+        try:
+            installer.spawn([go.path, "install", package])
+        finally:
+            self.captured.extend(installer.captured)
+
+    def _path(self, path: str) -> str:
+        """Return `path` relative to `cwd` as a path relative to the current directory, or an absolute one."""
+        return os.path.join(self.cwd, path) if self.cwd is not None else path
+
+    def _executable(self, name: str) -> str:
+        """Return the resolved path of `name` in `tools`, or the command name if not resolved."""
+        if name in self.tools:
+            return self.tools[name].path
+        return self.go_command if name == "go" else name
+
+    def generate(self, ext: extension.GoExtension, output: str | os.PathLike[str]) -> list[str]:
         """Generate (C)Python language bindings for Go.
 
+        Bindings are generated into a staging directory,
+        and only files whose content changed replace those in `output`,
+        so modification times of unchanged files are kept.
+
         Parameters
         ----------
         ext : go_extension.extension.GoExtension
@@ -82,26 +507,43 @@ class GoPyCompiler:
         output : str | os.PathLike[str]
             An output directory for bindings.
 
+        Returns
+        -------
+        list[str]
+            Paths of created or changed files, relative to `output`.
+
         See also
         --------
         https://github.com/go-python/gopy
 
         """
         self.install_build_tools()
-        cmd: list[str] = [
-            "gopy",
-            "gen",
-            f"-name={ext._compiled_name}",
-            "-no-make",
-            "-rename",
-            f"-vm={sys.executable}",
-            f"-output={output}",
-        ] + ext.packages
-        self.spawn(cmd)
+        if self.dry_run:
+            self.spawn(self._gopy_command("gen", ext, output))
+            return []
+        root = Path(output)
+        root.parent.mkdir(parents=True, exist_ok=True)
+        # A sibling of `output`, so that files are moved by atomic renames.
+        staging = Path(tempfile.mkdtemp(prefix=f".{root.name}-", dir=root.parent))
+        try:
+            self.spawn(self._gopy_command("gen", ext, staging))
+            with self.phase("update generated files", "copy"):
+                cache.relocate(staging, staging, root)
+                changed = cache.replace_changed(staging, root)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        if changed:
+            log.info("updated %d generated files of '%s': %s", len(changed), ext.original_name, ", ".join(changed))
+        else:
+            log.info("generated files of '%s' are unchanged", ext.original_name)
+        return changed
 
     def build(self, ext: extension.GoExtension, output: str | os.PathLike[str]) -> None:
         """Generate and compile (C)Python language bindings for Go.
 
+        The build is delegated to the build server listening on `daemon_socket` if it is running
+        (see `go_extension.daemon`).
+
         Parameters
         ----------
         ext : go_extension.extension.GoExtension
@@ -113,17 +555,322 @@ class GoPyCompiler:
         --------
         https://github.com/go-python/gopy
         """
+        if self.daemon_socket is not None and not self.dry_run and daemon.delegate_build(self, ext, output):
+            return
+        self.install_build_tools()
+        builder = self.clone(env=self.build_env(ext))
+        try:
+            builder._build(ext, output)
+        finally:
+            self.captured.extend(builder.captured)
+
+    def build_interpreters(
+        self, ext: extension.GoExtension, interpreters: t.Sequence[str], output: str | os.PathLike[str]
+    ) -> dict[str, Path]:
+        """Build `ext` for each of Python `interpreters` into a subdirectory of `output` named by its ABI tag.
+
+        The first build compiles the Go packages into the Go build cache.
+        The others run concurrently, at most `workers` at the same time, and reuse it,
+        so only the cgo glue, which includes headers of each interpreter, and its CPython wrapper are compiled again.
+
+        Parameters
+        ----------
+        ext : go_extension.extension.GoExtension
+            A GoExtension object to build.
+        interpreters : Sequence[str]
+            Commands or paths of Python interpreters, like `python3.10`.
+            Interpreters of the same ABI are built once.
+        output : str | os.PathLike[str]
+            A directory to create output directories in.
+
+        Returns
+        -------
+        dict[str, pathlib.Path]
+            A mapping of an ABI tag, like `cpython-311-x86_64-linux-gnu`, to its output directory.
+
+        Raises
+        ------
+        distutils.errors.DistutilsExecError
+            If an interpreter is not found or a build fails.
+        """
         self.install_build_tools()
-        cmd: list[str] = [
-            "gopy",
-            "build",
+        pythons: dict[str, str] = {}
+        for command in interpreters:
+            python = toolchain.probe_python(command)
+            if python is None:
+                raise errors.DistutilsExecError(f"Python interpreter {command!r} not found")
+            pythons.setdefault(python.abi_tag, python.path)
+        outputs = {tag: Path(output, tag) for tag in pythons}
+        if not pythons:
+            return outputs
+        first, *others = pythons
+        builder = self.clone(python=pythons[first])
+        try:
+            builder.build(ext, outputs[first])
+        finally:
+            self.captured.extend(builder.captured)
+        if not others:
+            return outputs
+        workers = min(self.workers, len(others))
+        log.info(
+            "building '%s' extension for %d more interpreters with %d workers", ext.original_name, len(others), workers
+        )
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            jobs = {executor.submit(self._build_captured, ext, pythons[tag], outputs[tag]): tag for tag in others}
+            try:
+                for job in futures.as_completed(jobs):
+                    job.result()
+            except BaseException as err:
+                for job in jobs:
+                    job.cancel()
+                if isinstance(err, KeyboardInterrupt):
+                    # Commands of running jobs are in their own process group and did not receive Ctrl-C.
+                    runner.kill_all()
+                raise
+        return outputs
+
+    def _build_captured(self, ext: extension.GoExtension, python: str, output: Path) -> None:
+        builder = self.clone(python=python, capture_output=True)
+        started = time.perf_counter()
+        try:
+            builder.build(ext, output)
+        except Exception:
+            builder.log_captured(f"'{ext.original_name}' extension for {python}", time.perf_counter() - started, True)
+            raise
+        builder.log_captured(f"'{ext.original_name}' extension for {python}", time.perf_counter() - started)
+
+    def log_captured(
+        self,
+        description: str,
+        elapsed: float,
+        failed: bool = False,
+        log_file: t.Optional[str | os.PathLike[str]] = None,
+    ) -> None:
+        """Log a build whose output was captured, and discard `captured`.
+
+        A successful build is logged as a one-line summary.
+        The whole log of a failed build is saved to `log_file`, or to a temporary file if None,
+        and its tail is logged with the path.
+
+        Parameters
+        ----------
+        description : str
+            What was built, like `'hello' extension`.
+        elapsed : float
+            Seconds the build took.
+        failed : bool
+            If true, the build failed.
+        log_file : str | os.PathLike[str] | None
+            A file to save the log of a failed build to.
+        """
+        try:
+            if failed:
+                path = self.captured.save(log_file)
+                log.error(
+                    "failed to build %s after %.1fs: %s, last output:\n%s\nfull log: %s",
+                    description,
+                    elapsed,
+                    self.captured.summary(),
+                    self.captured.tail().rstrip("\n"),
+                    path,
+                )
+            else:
+                log.info("built %s in %.1fs: %s", description, elapsed, self.captured.summary())
+        finally:
+            self.captured.close()
+
+    def _build(self, ext: extension.GoExtension, output: str | os.PathLike[str]) -> None:
+        if self._uses_makefile(ext):
+            # Bindings are modified or compiled with flags `GOFLAGS` can not hold between generation and compilation,
+            # which the Makefile written by `gopy gen` runs.
+            cmd = self._gopy_command("gen", ext, output, makefile=True)
+        else:
+            cmd = self._gopy_command("build", ext, output)
+        if self.build_cache is None or self.dry_run:
+            self._compile(ext, cmd, output)
+            return
+        sources = self._source_files(ext)
+        if not sources or (ext.resolve_depends and not self._unresolved.isdisjoint(ext.packages)):
+            # A cache key without all Go sources would restore a stale build after they change.
+            log.info("not caching '%s' extension: not all of its Go source files are known", ext.original_name)
+            self._compile(ext, cmd, output)
+            return
+        key = self.build_cache.key(self._build_inputs(ext, cmd, sources))
+        with self.phase("restore from build cache", "cache"):
+            restored = not self.force and self.build_cache.restore(key, output)
+        if restored:
+            log.info("restored '%s' extension from build cache", ext.original_name)
+            return
+        before = cache.snapshot(output)
+        self._compile(ext, cmd, output)
+        with self.phase("store in build cache", "cache"):
+            self.build_cache.store(key, output, cache.changed_files(output, before))
+
+    def go_build_flags(self, ext: extension.GoExtension) -> list[str]:
+        """Return flags of `go build` compiling `ext`: `build_flags`, those of `ext` and `-pgo`.
+
+        Parameters
+        ----------
+        ext : go_extension.extension.GoExtension
+
+        Returns
+        -------
+        list[str]
+        """
+        flags = self.build_flags + ext.go_build_flags
+        pgo = ext.pgo or self.pgo
+        if pgo:
+            flags.append(f"-pgo={os.path.abspath(self._path(pgo))}")
+        return flags
+
+    def build_env(self, ext: extension.GoExtension) -> dict[str, str]:
+        """Return environment to build `ext` in, with its cgo flags and Go build flags.
+
+        Go build flags are added to `GOFLAGS` unless `ext` is compiled by the Makefile of gopy.
+
+        Parameters
+        ----------
+        ext : go_extension.extension.GoExtension
+
+        Returns
+        -------
+        dict[str, str]
+        """
+        env = dict(self.env)
+        cgo_flags = {"CGO_CFLAGS": self.cgo_cflags + ext.cgo_cflags, "CGO_LDFLAGS": self.cgo_ldflags + ext.cgo_ldflags}
+        for name, flags in cgo_flags.items():
+            if flags:
+                env[name] = " ".join(filter(None, [env.get(name, _CGO_DEFAULT_FLAGS), *flags]))
+        build_flags = self.go_build_flags(ext)
+        if build_flags and not self._uses_makefile(ext):
+            env["GOFLAGS"] = " ".join(filter(None, [env.get("GOFLAGS"), *build_flags]))
+        return env
+
+    def build_config(self, ext: extension.GoExtension) -> str:
+        """Return the configuration of `ext` other than its sources, which requires a rebuild if changed.
+
+        Parameters
+        ----------
+        ext : go_extension.extension.GoExtension
+
+        Returns
+        -------
+        str
+        """
+        config = {
+            "go_build_flags": self.go_build_flags(ext),
+            "cgo_cflags": self.cgo_cflags + ext.cgo_cflags,
+            "cgo_ldflags": self.cgo_ldflags + ext.cgo_ldflags,
+            "bindings": bindings.fingerprint(ext),
+        }
+        return json.dumps(config, sort_keys=True)
+
+    def _uses_makefile(self, ext: extension.GoExtension) -> bool:
+        return bindings.needs_postprocess(ext) or any(
+            any(c.isspace() for c in flag) for flag in self.go_build_flags(ext)
+        )
+
+    def _gopy_command(
+        self, subcommand: str, ext: extension.GoExtension, output: str | os.PathLike[str], makefile: bool = False
+    ) -> list[str]:
+        return [
+            self._executable("gopy"),
+            subcommand,
             f"-name={ext._compiled_name}",
-            "-no-make",
+            *([] if makefile else ["-no-make"]),
             "-rename",
-            f"-vm={sys.executable}",
+            f"-vm={self.python}",
             f"-output={output}",
         ] + ext.packages
+
+    def _compile(self, ext: extension.GoExtension, cmd: list[str], output: str | os.PathLike[str]) -> None:
+        """Run `cmd` of `gopy build`, or of `gopy gen` followed by post-processing and `make build`."""
+        if cmd[1] == "build":
+            self.spawn_go_build(cmd)
+            return
+        self.spawn(cmd)
+        if not self.dry_run:
+            with self.phase("postprocess bindings", "generate"):
+                bindings.postprocess(ext, output)
+        gobuild = shlex.join([self._executable("go"), "build", *self.go_build_flags(ext)])
+        self.spawn_go_build([self.make_command, "-C", str(output), "build", f"GOBUILD={gobuild}"])
+
+    def spawn_go_build(self, cmd: list[str]) -> None:
+        """Spawn `cmd` compiling Go code and report usage of the Go build cache if `count_go_cache()` counts it."""
+        before = self.count_go_cache()
         self.spawn(cmd)
+        if self.dry_run or before is None:
+            return
+        after = go_cache_entries(self.env["GOCACHE"])
+        log.info(
+            "Go build cache %s: %d new entries, %d entries in total",
+            self.env["GOCACHE"],
+            max(0, after - before),
+            after,
+        )
+
+    def count_go_cache(self) -> t.Optional[int]:
+        """Return the number of entries in the Go build cache, or None unless `verbose` or profiling.
+
+        Counting scans the whole cache, which takes long for a large one, so it is done only to be reported.
+        """
+        if not self.verbose and self.profile is None:
+            return None
+        return go_cache_entries(self.env["GOCACHE"])
+
+    def _source_files(self, ext: extension.GoExtension) -> list[str]:
+        """Return existing files of `sources`, `depends` and the resolved dependencies of `ext`."""
+        files = ext.sources + ext.depends
+        if ext.resolve_depends:
+            files += self.resolve_dependencies(ext.packages)
+        return sorted(path for path in set(files) if os.path.isfile(self._path(path)))
+
+    def _build_inputs(self, ext: extension.GoExtension, cmd: list[str], sources: list[str]) -> t.Iterator[bytes]:
+        """Yield everything the output of `cmd` depends on, with `sources` of `ext`, used as a build cache key."""
+        for arg in cmd:
+            if not arg.startswith("-output="):
+                yield arg.encode()
+        python = toolchain.probe_python(self.python)
+        if python is None:
+            yield str(sysconfig.get_config_var("EXT_SUFFIX")).encode()
+            yield str(sys.implementation.cache_tag).encode()
+        else:
+            yield python.ext_suffix.encode()
+            yield python.cache_tag.encode()
+        yield self.build_config(ext).encode()
+        for name in ("go", "gopy"):
+            yield self._tool_fingerprint(name).encode()
+        for name in sorted(self.env):
+            if name in _BUILD_ENV_VARS or name.startswith("CGO_"):
+                yield f"{name}={self.env[name]}".encode()
+        depends = sources + ["go.mod", "go.sum"]
+        if ext.pgo or self.pgo:
+            depends.append(t.cast(str, ext.pgo or self.pgo))
+        for path in sorted(set(depends)):
+            if os.path.isfile(self._path(path)):
+                yield path.encode()
+                yield Path(self._path(path)).read_bytes()
+
+    def _tool_fingerprint(self, name: str) -> str:
+        tool = self.tools.get(name)
+        if tool is None:
+            return name
+        if tool.version_info:
+            return f"{name} {tool.version}"
+        # Development builds have no version.
+        stat = os.stat(tool.path)
+        return f"{name} {tool.path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def phase(self, name: str, category: str, **args: t.Any) -> t.ContextManager[None]:
+        """Return a context recording a build phase in `profile`, or doing nothing if not profiling.
+
+        See also
+        --------
+        go_extension.profiling.BuildProfile.phase
+        """
+        if self.profile is None:
+            return contextlib.nullcontext()
+        return self.profile.phase(name, category, **args)
 
     def spawn(self, cmd: list[str]) -> None:
         """Run another program, specified as a command list 'cmd', in a new process.
@@ -133,12 +880,109 @@ class GoPyCompiler:
         cmd : list[str]
             A list of arguments for the new process.
         """
-        spawn.spawn(cmd, verbose=self.verbose, dry_run=self.dry_run, env=self.env)
+        with self.phase(" ".join([os.path.basename(cmd[0])] + cmd[1:2]), "spawn"):
+            runner.run_sync(self.spawn_async(cmd))
+
+    async def spawn_async(self, cmd: list[str]) -> None:
+        """Run another program, specified as a command list 'cmd', in a new process asynchronously.
+
+        Output is streamed into `captured` if `capture_output` is true, otherwise to stdout.
+        The command is killed if it exceeds `timeout` or the task is cancelled.
+        Commands can be run concurrently by `asyncio.gather()`, limited by `command_runner.max_concurrency`.
+
+        Parameters
+        ----------
+        cmd : list[str]
+            A list of arguments for the new process.
+
+        Raises
+        ------
+        distutils.errors.DistutilsExecError
+            If the command fails.
+        go_extension.exceptions.CommandTimeoutError
+            If the command does not exit within `timeout`.
+        """
+        if self.capture_output:
+            self.captured.command(cmd)
+        else:
+            log.info(subprocess.list2cmdline(cmd))
+        if self.dry_run:
+            return
+        executable = self.tools[cmd[0]].path if cmd[0] in self.tools else cmd[0]
+        try:
+            result = await self.command_runner.run(
+                [executable] + cmd[1:],
+                env=self.env,
+                timeout=self.timeout,
+                on_output=self.captured.write if self.capture_output else _write_stdout,
+                keep_output=False,
+                cwd=self.cwd,
+            )
+        except OSError as err:
+            raise errors.DistutilsExecError(f"command {cmd[0]!r} failed: {err.args[-1]}") from err
+        if result.returncode:
+            raise errors.DistutilsExecError(f"command {cmd[0]!r} failed with exit code {result.returncode}")
+
+
+def _write_stdout(text: str) -> None:
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def _proxy_url(goproxy: str) -> str:
+    """Return `goproxy` as a GOPROXY value, converting a local directory to a `file://` URL."""
+    if os.path.isdir(goproxy):
+        return Path(goproxy).resolve().as_uri()
+    return goproxy
+
+
+def go_cache_entries(gocache: str | os.PathLike[str]) -> int:
+    """Return the number of entries in a Go build cache directory.
+
+    Parameters
+    ----------
+    gocache : str | os.PathLike[str]
+        A `GOCACHE` directory.
+
+    Returns
+    -------
+    int
+    """
+    entries = 0
+    try:
+        subdirs = [entry.path for entry in os.scandir(gocache) if entry.is_dir()]
+    except OSError:
+        return 0
+    for subdir in subdirs:
+        with os.scandir(subdir) as it:
+            entries += sum(1 for entry in it if entry.name.endswith("-a"))
+    return entries
+
+
+def _local_package_files(info: t.Optional[dict[str, t.Any]], start: t.Optional[str] = None) -> list[str]:
+    """Return files of a package listed by `go list -json` unless it is in the standard library or module cache.
+
+    Paths are relative to `start`, or to the current directory if None, if under it.
+    """
+    if info is None or info.get("Standard"):
+        return []
+    module = info.get("Module")
+    if module is not None and not module.get("Main") and not (module.get("Replace") or {}).get("Dir"):
+        return []
+    files: list[str] = []
+    for field in _GO_LIST_FILE_FIELDS:
+        files.extend(_relative_path(os.path.join(info["Dir"], name), start) for name in info.get(field, []))
+    return files
+
+
+def _relative_path(path: str, start: t.Optional[str] = None) -> str:
+    relpath = os.path.relpath(path, start or os.curdir)
+    return path if relpath.startswith(os.pardir) else relpath
 
 
-def _gopy_is_installed() -> bool:
-    return bool(shutil.which("gopy"))
+def _gopy_is_installed(env: t.Mapping[str, str], go: toolchain.Tool) -> bool:
+    return toolchain.probe("gopy", env, go) is not None
 
 
-def _goimports_is_installed() -> bool:
-    return bool(shutil.which("goimports"))
+def _goimports_is_installed(env: t.Mapping[str, str], go: toolchain.Tool) -> bool:
+    return toolchain.probe("goimports", env, go) is not None
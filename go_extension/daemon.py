@@ -0,0 +1,464 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+"""Long-lived local build server keeping the toolchain and Go package metadata warm between builds.
+
+Start it in the project root and keep it running while editing::
+
+    $ python -m go_extension.daemon serve
+
+The server is opt-in: `GoPyCompiler` delegates builds and `go list` to it
+only if `GO_EXTENSION_DAEMON_SOCKET` is set or build_ext is run with `--go-daemon`,
+and spawns commands by itself if no server is running.
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import functools
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import typing as t
+from pathlib import Path
+from setuptools._distutils import errors, log
+
+from go_extension import cache, extension, profiling
+
+if t.TYPE_CHECKING:
+    from go_extension import compiler
+
+SOCKET_ENV = "GO_EXTENSION_DAEMON_SOCKET"
+SOCKET_FILE = "daemon.sock"
+# Attributes of GoPyCompiler sent to the server along with its environment.
+_COMPILER_ATTRIBUTES = (
+    "go_command",
+    "make_command",
+    "verbose",
+    "force",
+    "offline",
+    "gopy_version",
+    "goimports_version",
+    "timeout",
+    "build_flags",
+    "cgo_cflags",
+    "cgo_ldflags",
+    "pgo",
+    "python",
+)
+_EXTENSION_ATTRIBUTES = (
+    "sources",
+    "depends",
+    "resolve_depends",
+    "lazy",
+    "release_gil",
+    "buffer_protocol",
+    "go_build_flags",
+    "cgo_cflags",
+    "cgo_ldflags",
+    "pgo",
+    "go_runtime",
+    "instrument",
+    "handle_registry",
+)
+# Functions of distutils' log whose messages are sent to the client of a request.
+_LOG_FUNCTIONS = ("debug", "info", "warn", "error")
+_recorded = threading.local()
+
+
+def socket_path() -> t.Optional[Path]:
+    """Return the socket of the build server set by `GO_EXTENSION_DAEMON_SOCKET`, or None if not set or empty."""
+    return Path(os.environ[SOCKET_ENV]) if os.environ.get(SOCKET_ENV) else None
+
+
+def default_socket_path() -> Path:
+    """Return the socket the build server listens on unless given.
+
+    It is `socket_path()` if set, otherwise `daemon.sock` in the cache directory (see `go_extension.cache`).
+    """
+    path = socket_path()
+    if path is not None:
+        return path
+    root = cache.cache_root() or cache.user_cache_dir() / "go-extension"
+    return root / SOCKET_FILE
+
+
+class BuildServer:
+    """Server building GoExtensions and resolving their dependencies on behalf of `GoPyCompiler`.
+
+    Compilers are kept per working directory and configuration of clients, at most `max_compilers`
+    of the most recently used, so toolchain probes and Go package dependencies resolved by `go list`
+    are reused across builds.
+    Files the packages depend on are polled every `poll_interval` seconds,
+    and dependencies are resolved again once they change.
+    Requests are served concurrently, and commands run in the working directory of each client.
+    Log messages and build profiles are sent back to the client.
+    """
+
+    path: Path
+    poll_interval: float
+    max_compilers: int
+
+    def __init__(self, path: str | os.PathLike[str], poll_interval: float = 1.0, max_compilers: int = 8) -> None:
+        """
+        Parameters
+        ----------
+        path : str | os.PathLike[str]
+            The Unix socket to listen on.
+        poll_interval : float
+            Interval in seconds to check files the Go packages depend on.
+        max_compilers : int
+            The number of configurations to keep compilers of. The least recently used one is dropped first.
+        """
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self.max_compilers = max(1, max_compilers)
+        self._compilers: collections.OrderedDict[str, "compiler.GoPyCompiler"] = collections.OrderedDict()
+        self._watched: dict[str, cache.Snapshot] = {}
+        self._lock = threading.Lock()
+        self._stopped: t.Optional[asyncio.Event] = None
+
+    async def serve(self, started: t.Optional[threading.Event] = None) -> None:
+        """Serve requests until a `shutdown` request.
+
+        Parameters
+        ----------
+        started : threading.Event | None
+            Set once the server is listening.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with contextlib.suppress(FileNotFoundError):
+            self.path.unlink()  # Left by a server which did not exit cleanly.
+        _record_logs()
+        self._stopped = asyncio.Event()
+        server = await asyncio.start_unix_server(self._handle, path=str(self.path))
+        log.info("go-extension build server listening on %s", self.path)
+        if started is not None:
+            started.set()
+        watcher = asyncio.create_task(self._watch())
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            watcher.cancel()
+            with contextlib.suppress(FileNotFoundError):
+                self.path.unlink()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = json.loads(await reader.readline())
+            op = request.get("op")
+            loop = asyncio.get_running_loop()
+            if op == "ping":
+                response: dict[str, t.Any] = {"ok": True, "pid": os.getpid()}
+            elif op == "build":
+                response = await loop.run_in_executor(None, self._build, request)
+            elif op == "resolve":
+                response = await loop.run_in_executor(None, self._resolve, request)
+            elif op == "shutdown":
+                response = {"ok": True}
+                assert self._stopped is not None
+                self._stopped.set()
+            else:
+                response = {"ok": False, "error": f"unknown request {op!r}", "output": ""}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+        except (ConnectionError, ValueError) as err:
+            log.warn("bad request to build server: %s", err)
+        finally:
+            writer.close()
+
+    def _build(self, request: dict[str, t.Any]) -> dict[str, t.Any]:
+        with _recording_logs() as logs:
+            gopy_compiler = self._compiler(request)
+            profile = profiling.BuildProfile() if request.get("profile") else None
+            builder = gopy_compiler.clone(capture_output=True, profile=profile)
+            ext = _extension_from_dict(request["extension"])
+            response: dict[str, t.Any] = {"ok": True}
+            try:
+                builder.build(ext, request["output"])
+            except Exception as err:
+                response = {"ok": False, "error": str(err)}
+            finally:
+                self._watch_dependencies(request["key"], gopy_compiler)
+        response.update(output=builder.captured.getvalue(), logs=logs)
+        if profile is not None:
+            response["phases"] = profile.phases
+        return response
+
+    def _resolve(self, request: dict[str, t.Any]) -> dict[str, t.Any]:
+        with _recording_logs() as logs:
+            gopy_compiler = self._compiler(request)
+            packages = list(request["packages"])
+            gopy_compiler.resolve_dependencies(packages)
+            self._watch_dependencies(request["key"], gopy_compiler)
+        return {
+            "ok": True,
+            "dependencies": {
+                pkg: gopy_compiler._dependencies[pkg] for pkg in packages if pkg in gopy_compiler._dependencies
+            },
+            "unresolved": [pkg for pkg in packages if pkg in gopy_compiler._unresolved],
+            "logs": logs,
+        }
+
+    def _compiler(self, request: dict[str, t.Any]) -> "compiler.GoPyCompiler":
+        """Return the compiler of the configuration of `request`, created if missing, with fresh dependencies."""
+        from go_extension.compiler import GoPyCompiler  # go_extension.compiler imports this module.
+
+        key = request["key"]
+        with self._lock:
+            gopy_compiler = self._compilers.get(key)
+            if gopy_compiler is None:
+                gopy_compiler = GoPyCompiler(use_cache=False, cwd=request["cwd"])
+                gopy_compiler.daemon_socket = None
+                gopy_compiler.env = dict(request["env"])
+                for name, value in request["compiler"].items():
+                    setattr(gopy_compiler, name, value)
+                build_cache = request["build_cache"]
+                gopy_compiler.build_cache = None if build_cache is None else cache.BuildCache(*build_cache)
+                self._compilers[key] = gopy_compiler
+                while len(self._compilers) > self.max_compilers:
+                    evicted, _ = self._compilers.popitem(last=False)
+                    self._watched.pop(evicted, None)
+            self._compilers.move_to_end(key)
+            self._refresh(key, gopy_compiler)
+        return gopy_compiler
+
+    def _watch_dependencies(self, key: str, gopy_compiler: "compiler.GoPyCompiler") -> None:
+        files = {gopy_compiler._path(path) for paths in gopy_compiler._dependencies.values() for path in paths}
+        # Directories are watched as well, so that new files in packages are noticed.
+        files |= {os.path.dirname(path) or os.curdir for path in files}
+        snapshot = cache.stat_files(files)
+        with self._lock:
+            if key in self._compilers:
+                self._watched[key] = snapshot
+
+    def _refresh(self, key: str, gopy_compiler: "compiler.GoPyCompiler") -> bool:
+        """Drop resolved dependencies of `gopy_compiler` if files they list changed."""
+        watched = self._watched.get(key)
+        if watched is None or cache.stat_files(watched) == watched:
+            return False
+        log.info("Go sources changed; resolving dependencies again")
+        gopy_compiler.forget_dependencies()
+        self._watched.pop(key, None)
+        return True
+
+    async def _watch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await loop.run_in_executor(None, self._poll)
+
+    def _poll(self) -> None:
+        """Resolve dependencies of changed packages ahead of the next build."""
+        with self._lock:
+            changed = []
+            for key, gopy_compiler in self._compilers.items():
+                packages = list(gopy_compiler._dependencies)
+                if self._refresh(key, gopy_compiler):
+                    changed.append((key, gopy_compiler, packages))
+        for key, gopy_compiler, packages in changed:
+            if gopy_compiler.cwd is not None and os.path.isdir(gopy_compiler.cwd):
+                gopy_compiler.resolve_dependencies(packages)
+                self._watch_dependencies(key, gopy_compiler)
+
+
+def delegate_build(
+    gopy_compiler: "compiler.GoPyCompiler", ext: extension.GoExtension, output: str | os.PathLike[str]
+) -> bool:
+    """Build `ext` by the server listening on `gopy_compiler.daemon_socket`.
+
+    Output of the commands, log messages and, if `gopy_compiler.profile` is set, build phases of the server
+    are passed on to `gopy_compiler`.
+
+    Parameters
+    ----------
+    gopy_compiler : go_extension.compiler.GoPyCompiler
+        The compiler whose configuration is used by the server.
+    ext : go_extension.extension.GoExtension
+        A GoExtension object to build.
+    output : str | os.PathLike[str]
+        An output directory for bindings.
+
+    Returns
+    -------
+    bool
+        False if no server is available, in which case the caller builds `ext` by itself.
+
+    Raises
+    ------
+    distutils.errors.DistutilsExecError
+        If the build fails.
+    """
+    request = _compiler_request(gopy_compiler, "build")
+    request["extension"] = _extension_to_dict(ext)
+    request["output"] = os.path.abspath(output)
+    request["profile"] = gopy_compiler.profile is not None
+    started = time.perf_counter()
+    response = _request(gopy_compiler.daemon_socket, request)
+    if response is None:
+        return False
+    _replay_logs(response)
+    if gopy_compiler.profile is not None:
+        gopy_compiler.profile.merge(response.get("phases", []), started)
+    output_text = str(response.get("output", ""))
+    if gopy_compiler.capture_output:
+        if output_text:
+            gopy_compiler.captured.write(output_text)
+    elif output_text:
+        sys.stdout.write(output_text)
+        sys.stdout.flush()
+    if not response.get("ok"):
+        raise errors.DistutilsExecError(f"build server failed to build '{ext.original_name}': {response.get('error')}")
+    log.info("built '%s' extension by build server", ext.original_name)
+    return True
+
+
+def delegate_resolve(
+    gopy_compiler: "compiler.GoPyCompiler", packages: t.Sequence[str]
+) -> t.Optional[tuple[dict[str, list[str]], list[str]]]:
+    """Resolve dependencies of Go `packages` by the server listening on `gopy_compiler.daemon_socket`.
+
+    See `go_extension.compiler.GoPyCompiler.resolve_dependencies()`.
+
+    Parameters
+    ----------
+    gopy_compiler : go_extension.compiler.GoPyCompiler
+        The compiler whose configuration is used by the server.
+    packages : Sequence[str]
+        Go packages.
+
+    Returns
+    -------
+    tuple[dict[str, list[str]], list[str]] | None
+        Files each package depends on and packages `go list` failed for,
+        or None if no server is available, in which case the caller resolves them by itself.
+    """
+    request = _compiler_request(gopy_compiler, "resolve")
+    request["packages"] = list(packages)
+    response = _request(gopy_compiler.daemon_socket, request)
+    if response is None or not response.get("ok"):
+        return None
+    _replay_logs(response)
+    dependencies = {str(pkg): [str(path) for path in paths] for pkg, paths in response["dependencies"].items()}
+    return dependencies, [str(pkg) for pkg in response["unresolved"]]
+
+
+def ping(path: t.Optional[str | os.PathLike[str]]) -> t.Optional[int]:
+    """Return the process ID of the server listening on `path`, or None if not running."""
+    response = _request(path, {"op": "ping"})
+    return int(response["pid"]) if response is not None and response.get("ok") else None
+
+
+def shutdown(path: t.Optional[str | os.PathLike[str]]) -> bool:
+    """Stop the server listening on `path` and return whether it was running."""
+    return _request(path, {"op": "shutdown"}) is not None
+
+
+def _compiler_request(gopy_compiler: "compiler.GoPyCompiler", op: str) -> dict[str, t.Any]:
+    """Return a request of `op` carrying the configuration of `gopy_compiler` and its working directory."""
+    config = {name: getattr(gopy_compiler, name) for name in _COMPILER_ATTRIBUTES}
+    build_cache = gopy_compiler.build_cache
+    cache_config = None if build_cache is None else [os.path.abspath(build_cache.root), build_cache.max_size]
+    cwd = os.path.abspath(gopy_compiler.cwd or os.curdir)
+    key = {"cwd": cwd, "env": gopy_compiler.env, "compiler": config, "build_cache": cache_config}
+    return {
+        "op": op,
+        "key": json.dumps(key, sort_keys=True),
+        "cwd": cwd,
+        "env": gopy_compiler.env,
+        "compiler": config,
+        "build_cache": cache_config,
+    }
+
+
+def _request(path: t.Optional[str | os.PathLike[str]], request: dict[str, t.Any]) -> t.Optional[dict[str, t.Any]]:
+    """Send `request` and return the response, or None if no server is available."""
+    if path is None or not hasattr(socket, "AF_UNIX"):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(os.fspath(path))
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except OSError as err:
+        log.debug("build server on %s is not available: %s", path, err)
+        return None
+    if not line:
+        log.warn("build server on %s closed the connection", path)
+        return None
+    return dict(json.loads(line))
+
+
+def _record_logs() -> None:
+    """Make distutils' log record messages of threads serving a request, instead of writing them."""
+    for name in _LOG_FUNCTIONS:
+        function = getattr(log, name)
+        if not hasattr(function, "__wrapped__"):
+            setattr(log, name, _recorder(name, function))
+
+
+def _recorder(name: str, function: t.Callable[..., None]) -> t.Callable[..., None]:
+    @functools.wraps(function)
+    def record(msg: str, *args: t.Any) -> None:
+        records = getattr(_recorded, "logs", None)
+        if records is None:
+            function(msg, *args)
+        else:
+            records.append([name, msg % args if args else msg])
+
+    return record
+
+
+@contextlib.contextmanager
+def _recording_logs() -> t.Iterator[list[list[str]]]:
+    """Record log messages of the calling thread in the yielded list, as pairs of a log function and a message."""
+    logs: list[list[str]] = []
+    _recorded.logs = logs
+    try:
+        yield logs
+    finally:
+        del _recorded.logs
+
+
+def _replay_logs(response: dict[str, t.Any]) -> None:
+    for name, message in response.get("logs", []):
+        if name in _LOG_FUNCTIONS:
+            getattr(log, name)("%s", message)
+
+
+def _extension_to_dict(ext: extension.GoExtension) -> dict[str, t.Any]:
+    data = {name: getattr(ext, name) for name in _EXTENSION_ATTRIBUTES}
+    data["sources"] = [os.path.abspath(path) for path in ext.sources]
+    data["depends"] = [os.path.abspath(path) for path in ext.depends]
+    return {"name": ext.original_name, "packages": ext.packages, **data}
+
+
+def _extension_from_dict(data: dict[str, t.Any]) -> extension.GoExtension:
+    return extension.GoExtension(**data)
+
+
+def main(argv: t.Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m go_extension.daemon", description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=("serve", "status", "stop"))
+    parser.add_argument("--socket", type=Path, default=default_socket_path(), help="Unix socket of the server")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between checks of Go sources")
+    parser.add_argument("--max-compilers", type=int, default=8, help="number of build configurations kept warm")
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        log.set_verbosity(log.INFO)
+        with contextlib.suppress(KeyboardInterrupt):
+            asyncio.run(BuildServer(args.socket, args.poll_interval, args.max_compilers).serve())
+        return 0
+    if args.command == "status":
+        pid = ping(args.socket)
+        print(f"running (pid {pid}) on {args.socket}" if pid is not None else "not running")
+        return 0 if pid is not None else 1
+    return 0 if shutdown(args.socket) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,14 @@
 # Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from setuptools._distutils import errors
 
 
 class GoNotFoundError(Exception):
     """If `go` command not found."""
 
     pass
+
+
+class CommandTimeoutError(errors.DistutilsExecError):  # type: ignore
+    """If a command does not exit within its timeout."""
+
+    pass
@@ -2,6 +2,9 @@
 from setuptools import extension
 import typing as t
 
+# Settings of the Go runtime a GoExtension can be built with.
+RUNTIME_SETTINGS = ("GOMAXPROCS", "GOGC", "GOMEMLIMIT")
+
 
 class GoExtension(extension.Extension):  # type: ignore
     """Extension written in Go language.
@@ -25,6 +28,17 @@ class GoExtension(extension.Extension):  # type: ignore
     name: str
     sources: list[str]
     depends: list[str]
+    resolve_depends: bool
+    lazy: bool
+    release_gil: list[str]
+    buffer_protocol: bool
+    go_build_flags: list[str]
+    cgo_cflags: list[str]
+    cgo_ldflags: list[str]
+    pgo: t.Optional[str]
+    go_runtime: t.Optional[dict[str, str]]
+    instrument: bool
+    handle_registry: bool
 
     def __init__(
         self,
@@ -32,6 +46,17 @@ class GoExtension(extension.Extension):  # type: ignore
         packages: t.Sequence[str],
         sources: t.Optional[list[str]] = None,
         *args: t.Any,
+        resolve_depends: bool = True,
+        lazy: bool = False,
+        release_gil: t.Sequence[str] = (),
+        buffer_protocol: bool = False,
+        go_build_flags: t.Sequence[str] = (),
+        cgo_cflags: t.Sequence[str] = (),
+        cgo_ldflags: t.Sequence[str] = (),
+        pgo: t.Optional[str] = None,
+        go_runtime: t.Optional[t.Mapping[str, str | int]] = None,
+        instrument: bool = False,
+        handle_registry: bool = False,
         **kwargs: t.Any,
     ) -> None:
         """
@@ -48,6 +73,37 @@ class GoExtension(extension.Extension):  # type: ignore
         sources : list[str] | None
             Source files of GoExtension (optional).
             This is used just to judge whether sources have been updated.
+        resolve_depends : bool
+            If true, files the Go packages depend on are resolved by `go list`
+            and also used to judge whether sources have been updated.
+        lazy : bool
+            If true, the generated package loads its Go modules on first attribute access
+            instead of starting the Go runtime when imported.
+        release_gil : Sequence[str]
+            Patterns (fnmatch) of Go functions like `pkg.Func` or `pkg.Type.Method`
+            called with the GIL released, so that other Python threads run meanwhile.
+            They must not call back into Python.
+        buffer_protocol : bool
+            If true, Go slices of bytes, float64 and int64 get `from_buffer()`,
+            which copies a C-contiguous buffer like bytes, array.array or a NumPy array at once.
+        go_build_flags : Sequence[str]
+            Flags of `go build`, like `-trimpath`, `-ldflags=-s -w`, `-gcflags=-B` or `-tags=netgo`.
+        cgo_cflags, cgo_ldflags : Sequence[str]
+            Flags added to `CGO_CFLAGS` and `CGO_LDFLAGS`, like `-O3`.
+        pgo : str | None
+            A CPU profile for profile-guided optimization (Go1.21 or above).
+        go_runtime : Mapping[str, str | int] | None
+            If not None, the generated package starts the Go runtime by `init()` with these settings
+            (`GOMAXPROCS`, `GOGC` and `GOMEMLIMIT`), overridden by the environment,
+            can change them by `configure()`, and raises `ForkedRuntimeError` on calls into Go
+            in a process forked after the runtime started.
+        instrument : bool
+            If true, the generated package records the number of calls and latencies of its Go functions,
+            returned by `metrics()`, and writes pprof CPU and heap profiles of the Go runtime on demand.
+        handle_registry : bool
+            If true, handles of Go objects held by Python are stored in a compact free-list based registry
+            counting them, returned by `handle_stats()` of the generated package,
+            and Go objects are released at once by `release()` or at the end of a `with` block.
         *args, **kwargs : Any
             The same parameters as setuptools.extension.Extension.
         """
@@ -59,6 +115,22 @@ class GoExtension(extension.Extension):  # type: ignore
         )
         self._original_name = str(name)
         self._packages = [str(pkg) for pkg in packages]
+        self.resolve_depends = resolve_depends
+        self.lazy = lazy
+        self.release_gil = list(release_gil)
+        self.buffer_protocol = buffer_protocol
+        self.go_build_flags = list(go_build_flags)
+        self.cgo_cflags = list(cgo_cflags)
+        self.cgo_ldflags = list(cgo_ldflags)
+        self.pgo = pgo
+        self.instrument = instrument
+        self.handle_registry = handle_registry
+        self.go_runtime = None
+        if go_runtime is not None:
+            unknown = sorted(set(go_runtime) - set(RUNTIME_SETTINGS))
+            if unknown:
+                raise ValueError(f"unknown Go runtime settings: {', '.join(unknown)}")
+            self.go_runtime = {setting: str(value) for setting, value in go_runtime.items()}
 
     @property
     def packages(self) -> list[str]:
@@ -0,0 +1,184 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import typing as t
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+REPORT_FILE = "build-profile.json"
+TRACE_FILE = "build-trace.json"
+
+
+class BuildProfile:
+    """Recorder of time spent in each build phase.
+
+    Each phase records wall time and CPU time of child processes
+    (`resource.getrusage(RUSAGE_CHILDREN)`, not available on Windows).
+    Child process usage is accumulated per process, so phases running concurrently in other threads
+    are included in each other's CPU time.
+    The peak RSS of child processes is only known for the whole process, so it is reported once per build.
+
+    Examples
+    --------
+    >>> profile = BuildProfile()
+    >>> with profile.phase("gopy build", "spawn", extension="hello_go"):
+    ...     pass
+    >>> [(phase["name"], phase["extension"]) for phase in profile.report()["phases"]]
+    [('gopy build', 'hello_go')]
+    """
+
+    phases: list[dict[str, t.Any]]
+
+    def __init__(self) -> None:
+        self.phases = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def phase(self, name: str, category: str, **args: t.Any) -> t.Iterator[None]:
+        """Record a phase of the build.
+
+        Arguments of enclosing phases in the same thread, like `extension`, are inherited.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase, like `gopy build`.
+        category : str
+            The kind of the phase, like `spawn` or `build_go`.
+        **args : Any
+            Additional information of the phase.
+        """
+        context = getattr(self._local, "context", {})
+        args = {**context, **args}
+        self._local.context = args
+        start = time.perf_counter()
+        usage = _children_usage()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            end_usage = _children_usage()
+            self._local.context = context
+            phase = {
+                "name": name,
+                "category": category,
+                **args,
+                "start": start - self._origin,
+                "wall": end - start,
+                "cpu_children": None if usage is None or end_usage is None else end_usage[0] - usage[0],
+                "thread": threading.get_ident(),
+            }
+            with self._lock:
+                self.phases.append(phase)
+
+    def merge(self, phases: t.Iterable[dict[str, t.Any]], started: float) -> None:
+        """Add phases recorded by another profile, like that of the build server, to this one.
+
+        Arguments of enclosing phases in the calling thread are inherited, as if the phases were recorded in it.
+
+        Parameters
+        ----------
+        phases : Iterable[dict[str, Any]]
+            `phases` of the other profile.
+        started : float
+            `time.perf_counter()` of this process when the other profile started.
+        """
+        context = getattr(self._local, "context", {})
+        offset = started - self._origin
+        thread = threading.get_ident()
+        merged = [{**context, **phase, "start": phase["start"] + offset, "thread": thread} for phase in phases]
+        with self._lock:
+            self.phases.extend(merged)
+
+    def report(self) -> dict[str, t.Any]:
+        """Return phases, total wall time per phase name and per extension, and the peak RSS of child processes.
+
+        Returns
+        -------
+        dict[str, Any]
+        """
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase["start"])
+        by_name: dict[str, float] = {}
+        by_extension: dict[str, float] = {}
+        for phase in phases:
+            by_name[phase["name"]] = by_name.get(phase["name"], 0.0) + phase["wall"]
+            if phase["category"] == "build_go":
+                by_extension[phase["extension"]] = by_extension.get(phase["extension"], 0.0) + phase["wall"]
+        usage = _children_usage()
+        return {
+            "phases": phases,
+            "total_by_name": by_name,
+            "total_by_extension": by_extension,
+            "max_rss_children_kb": None if usage is None else usage[1],
+        }
+
+    def trace_events(self) -> dict[str, t.Any]:
+        """Return phases in Chrome trace event format, viewable in chrome://tracing or Perfetto.
+
+        Returns
+        -------
+        dict[str, Any]
+        """
+        with self._lock:
+            phases = list(self.phases)
+        events = []
+        for phase in phases:
+            events.append(
+                {
+                    "name": phase["name"],
+                    "cat": phase["category"],
+                    "ph": "X",
+                    "ts": phase["start"] * 1e6,
+                    "dur": phase["wall"] * 1e6,
+                    "pid": os.getpid(),
+                    "tid": phase["thread"],
+                    "args": {
+                        key: value
+                        for key, value in phase.items()
+                        if key not in ("name", "category", "start", "wall", "thread")
+                    },
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, directory: str | os.PathLike[str]) -> tuple[Path, Path]:
+        """Write the JSON report and the Chrome trace event file into `directory`.
+
+        Parameters
+        ----------
+        directory : str | os.PathLike[str]
+
+        Returns
+        -------
+        tuple[pathlib.Path, pathlib.Path]
+            Paths of the report and the trace event file.
+        """
+        root = Path(directory)
+        root.mkdir(parents=True, exist_ok=True)
+        report, trace = root / REPORT_FILE, root / TRACE_FILE
+        report.write_text(json.dumps(self.report(), indent=2))
+        trace.write_text(json.dumps(self.trace_events()))
+        return report, trace
+
+
+def _children_usage() -> t.Optional[tuple[float, int]]:
+    """Return CPU seconds and peak RSS in KiB of terminated child processes.
+
+    The peak RSS is the largest of any child process so far, not of the children since a point in time.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    max_rss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return usage.ru_utime + usage.ru_stime, max_rss
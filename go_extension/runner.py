@@ -0,0 +1,263 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+import asyncio
+import codecs
+import collections
+import concurrent.futures
+import contextlib
+import os
+import signal
+import threading
+import typing as t
+
+from go_extension import exceptions
+
+_T = t.TypeVar("_T")
+_CHUNK_SIZE = 1 << 16
+# Commands running in any thread of this process, killed by `kill_all()`.
+_running: set[asyncio.subprocess.Process] = set()
+_running_lock = threading.Lock()
+
+
+class CommandResult:
+    """Result of a command run by `Runner`."""
+
+    cmd: list[str]
+    returncode: int
+    output: str
+
+    def __init__(self, cmd: list[str], returncode: int, output: str) -> None:
+        self.cmd = cmd
+        self.returncode = returncode
+        self.output = output
+
+
+class Runner:
+    """Asyncio-based engine running commands as subprocesses.
+
+    stdout and stderr of a command are merged and streamed to `on_output` as they arrive.
+    A command exceeding its timeout, or whose task is cancelled, is killed.
+    Commands run in their own process group, so Ctrl-C in a terminal does not reach them;
+    use `kill_all()` when KeyboardInterrupt is raised while other threads run commands.
+    At most `max_concurrency` commands run at the same time,
+    counted across every thread and event loop using this runner (`run_sync()` starts a new loop each call).
+
+    Examples
+    --------
+    >>> runner = Runner(max_concurrency=2)
+    >>> async def main() -> list[str]:
+    ...     results = await asyncio.gather(runner.run(["echo", "a"]), runner.run(["echo", "b"]))
+    ...     return [result.output for result in results]
+    >>> asyncio.run(main())
+    ['a\\n', 'b\\n']
+    """
+
+    max_concurrency: t.Optional[int]
+    timeout: t.Optional[float]
+
+    def __init__(self, max_concurrency: t.Optional[int] = None, timeout: t.Optional[float] = None) -> None:
+        """
+        Parameters
+        ----------
+        max_concurrency : int | None
+            The maximum number of commands running at the same time, or None for no limit.
+        timeout : float | None
+            The default timeout of a command in seconds, or None for no timeout.
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._slots = None if max_concurrency is None else _Slots(max_concurrency)
+
+    async def run(
+        self,
+        cmd: list[str],
+        env: t.Optional[t.Mapping[str, str]] = None,
+        timeout: t.Optional[float] = None,
+        on_output: t.Optional[t.Callable[[str], None]] = None,
+        keep_output: bool = True,
+        cwd: t.Optional[str | os.PathLike[str]] = None,
+    ) -> CommandResult:
+        """Run a command and wait for it to exit.
+
+        Parameters
+        ----------
+        cmd : list[str]
+            A list of arguments for the new process.
+        env : Mapping[str, str] | None
+            Environment of the new process. Defaults to that of this process.
+        timeout : float | None
+            Timeout in seconds. Defaults to `self.timeout`.
+        on_output : Callable[[str], None] | None
+            Called with each chunk of output.
+        keep_output : bool
+            If false, output is only passed to `on_output`, and `output` of the result is empty,
+            so that memory does not grow with verbose commands.
+        cwd : str | os.PathLike[str] | None
+            Working directory of the new process. Defaults to that of this process.
+
+        Returns
+        -------
+        go_extension.runner.CommandResult
+
+        Raises
+        ------
+        go_extension.exceptions.CommandTimeoutError
+            If the command does not exit within the timeout.
+        OSError
+            If the command can not be started.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        async with self._semaphore():
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                env=None if env is None else dict(env),
+                cwd=cwd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                # Its own process group, so that its children are killed together.
+                start_new_session=os.name == "posix",
+            )
+            chunks: list[str] = []
+            with _running_lock:
+                _running.add(proc)
+            try:
+                await asyncio.wait_for(self._read(proc, chunks if keep_output else None, on_output), timeout)
+            except asyncio.TimeoutError:
+                await _kill(proc)
+                raise exceptions.CommandTimeoutError(f"command {cmd[0]!r} timed out after {timeout} seconds")
+            except BaseException:
+                await _kill(proc)
+                raise
+            finally:
+                with _running_lock:
+                    _running.discard(proc)
+        return CommandResult(cmd, t.cast(int, proc.returncode), "".join(chunks))
+
+    def run_sync(
+        self,
+        cmd: list[str],
+        env: t.Optional[t.Mapping[str, str]] = None,
+        timeout: t.Optional[float] = None,
+        on_output: t.Optional[t.Callable[[str], None]] = None,
+        keep_output: bool = True,
+        cwd: t.Optional[str | os.PathLike[str]] = None,
+    ) -> CommandResult:
+        """Run a command and wait for it to exit, blocking the calling thread.
+
+        See `run()` for parameters.
+        """
+        return run_sync(self.run(cmd, env=env, timeout=timeout, on_output=on_output, keep_output=keep_output, cwd=cwd))
+
+    async def _read(
+        self,
+        proc: asyncio.subprocess.Process,
+        chunks: t.Optional[list[str]],
+        on_output: t.Optional[t.Callable[[str], None]],
+    ) -> None:
+        assert proc.stdout is not None
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            data = await proc.stdout.read(_CHUNK_SIZE)
+            text = decoder.decode(data, final=not data)
+            if text:
+                if chunks is not None:
+                    chunks.append(text)
+                if on_output is not None:
+                    on_output(text)
+            if not data:
+                break
+        await proc.wait()
+
+    def _semaphore(self) -> t.AsyncContextManager[t.Any]:
+        if self._slots is None:
+            return contextlib.nullcontext()
+        return self._slots
+
+
+class _Slots:
+    """Semaphore shared by coroutines of every thread and event loop.
+
+    `asyncio.Semaphore` is bound to one event loop, and `threading.BoundedSemaphore` blocks the loop.
+    Waiters are woken in order in their own loop.
+    """
+
+    def __init__(self, value: int) -> None:
+        self._value = value
+        self._lock = threading.Lock()
+        self._waiters: collections.deque[tuple[asyncio.AbstractEventLoop, asyncio.Future[None]]]
+        self._waiters = collections.deque()
+
+    async def __aenter__(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return
+            waiter: asyncio.Future[None] = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except BaseException:
+            with self._lock:
+                if (loop, waiter) in self._waiters:
+                    self._waiters.remove((loop, waiter))
+                    raise
+            # The slot was handed over while this waiter was being cancelled.
+            self._release()
+            raise
+
+    async def __aexit__(self, *exc_info: t.Any) -> None:
+        self._release()
+
+    def _release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(_wake, waiter)
+                    return
+                except RuntimeError:  # The loop of the waiter is closed.
+                    continue
+            self._value += 1
+
+
+def _wake(waiter: asyncio.Future[None]) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+def run_sync(coro: t.Coroutine[t.Any, t.Any, _T]) -> _T:
+    """Run a coroutine to completion from synchronous code, even if an event loop is running in this thread."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+def kill_all() -> None:
+    """Kill every command running in this process, with its process group.
+
+    Call this when KeyboardInterrupt is raised in the main thread while other threads run commands,
+    as those commands do not receive Ctrl-C and would keep running until they exit.
+    """
+    with _running_lock:
+        procs = list(_running)
+    for proc in procs:
+        _signal(proc)
+
+
+async def _kill(proc: asyncio.subprocess.Process) -> None:
+    if proc.returncode is None:
+        _signal(proc)
+        await proc.wait()
+
+
+def _signal(proc: asyncio.subprocess.Process) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except ProcessLookupError:
+        pass
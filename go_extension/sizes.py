@@ -0,0 +1,348 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+import json
+import os
+import re
+import struct
+import typing as t
+from pathlib import Path
+
+from go_extension import runner
+
+# Ways to handle debug information of built shared libraries.
+DEBUG_INFO_MODES = ("keep", "strip", "split")
+# Suffixes of shared libraries of Python extensions.
+ARTIFACT_SUFFIXES = (".so", ".pyd", ".dylib")
+# Symbol types of `go tool nm` not occupying space in the file: undefined and BSS.
+_NO_SPACE_TYPES = frozenset("UbB")
+_SIZE = re.compile(r"^\s*(?P<number>\d+(?:\.\d+)?)\s*(?P<unit>[KMG]?)(?:i?B)?\s*$", re.IGNORECASE)
+_SHT_NOBITS = 8
+
+
+def parse_size(text: str) -> int:
+    """Parse a size in bytes, optionally with a binary suffix `K`, `M` or `G`.
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    int
+
+    Raises
+    ------
+    ValueError
+        If `text` is not a size.
+
+    Examples
+    --------
+    >>> parse_size("512"), parse_size("20M"), parse_size("1.5 GiB")
+    (512, 20971520, 1610612736)
+    """
+    match = _SIZE.match(text)
+    if match is None:
+        raise ValueError(f"invalid size: {text!r}")
+    scale = 1 << (10 * " KMG".index(match.group("unit").upper() or " "))
+    return int(float(match.group("number")) * scale)
+
+
+def artifacts(directory: str | os.PathLike[str]) -> list[Path]:
+    """Return shared libraries in `directory`, not recursively."""
+    root = Path(directory)
+    if not root.is_dir():
+        return []
+    return sorted(path for path in root.iterdir() if path.is_file() and path.suffix in ARTIFACT_SUFFIXES)
+
+
+def elf_sections(path: str | os.PathLike[str]) -> t.Optional[dict[str, int]]:
+    """Return sizes of sections of an ELF file in bytes, or None if it is not ELF.
+
+    Sections occupying no space in the file, like `.bss`, are omitted.
+
+    Parameters
+    ----------
+    path : str | os.PathLike[str]
+
+    Returns
+    -------
+    dict[str, int] | None
+    """
+    with open(path, "rb") as f:
+        ident = f.read(16)
+        if len(ident) < 16 or ident[:4] != b"\x7fELF" or ident[4] not in (1, 2) or ident[5] not in (1, 2):
+            return None
+        is64, endian = ident[4] == 2, "<" if ident[5] == 1 else ">"
+        if is64:
+            f.seek(0x28)
+            (shoff,) = struct.unpack(endian + "Q", f.read(8))
+            f.seek(0x3A)
+        else:
+            f.seek(0x20)
+            (shoff,) = struct.unpack(endian + "I", f.read(4))
+            f.seek(0x2E)
+        shentsize, shnum, shstrndx = struct.unpack(endian + "HHH", f.read(6))
+        if shoff == 0 or shnum == 0 or shstrndx >= shnum:
+            return {}
+        header = struct.Struct(endian + ("IIQQQQ" if is64 else "IIIIII"))
+        headers = []
+        for i in range(shnum):
+            f.seek(shoff + i * shentsize)
+            name, type_, _, _, offset, size = header.unpack(f.read(header.size))
+            headers.append((name, type_, offset, size))
+        _, _, strtab_offset, strtab_size = headers[shstrndx]
+        f.seek(strtab_offset)
+        strtab = f.read(strtab_size)
+    sections: dict[str, int] = {}
+    for name, type_, _, size in headers[1:]:
+        if type_ == _SHT_NOBITS:
+            continue
+        end = strtab.index(b"\0", name)
+        section = strtab[name:end].decode(errors="replace")
+        sections[section] = sections.get(section, 0) + size
+    return sections
+
+
+def debug_size(sections: t.Mapping[str, int]) -> int:
+    """Return the total size of DWARF sections, compressed (`.zdebug_*`) or not.
+
+    Examples
+    --------
+    >>> debug_size({".text": 100, ".debug_info": 30, ".zdebug_line": 10})
+    40
+    """
+    return sum(size for name, size in sections.items() if name.startswith((".debug", ".zdebug")))
+
+
+def go_symbols(
+    path: str | os.PathLike[str],
+    go_command: str = "go",
+    env: t.Optional[t.Mapping[str, str]] = None,
+    command_runner: t.Optional[runner.Runner] = None,
+) -> list[tuple[str, str, int]]:
+    """Return `(name, type, size)` of symbols of a binary built by Go, largest first, by `go tool nm -size`.
+
+    Symbols occupying no space in the file, and all symbols of a binary without a symbol table
+    (like one linked with `-ldflags=-s`), are omitted.
+
+    Parameters
+    ----------
+    path : str | os.PathLike[str]
+    go_command : str
+        The Go executable.
+    env : Mapping[str, str] | None
+        Environment of `go`.
+    command_runner : go_extension.runner.Runner | None
+
+    Returns
+    -------
+    list[tuple[str, str, int]]
+    """
+    command_runner = command_runner or runner.Runner()
+    result = command_runner.run_sync([go_command, "tool", "nm", "-size", "-sort", "size", os.fspath(path)], env=env)
+    if result.returncode:
+        return []
+    symbols = []
+    for line in result.output.splitlines():
+        fields = line.split(maxsplit=3)
+        if len(fields) != 4 or not fields[1].isdigit() or fields[2] in _NO_SPACE_TYPES:
+            continue
+        size = int(fields[1])
+        if size:
+            symbols.append((fields[3], fields[2], size))
+    return symbols
+
+
+def package_of(symbol: str) -> str:
+    """Return the Go package a symbol belongs to.
+
+    Symbols of C code are grouped as `(C)`, and those generated by the linker as `(go)`.
+
+    Examples
+    --------
+    >>> package_of("github.com/foo/bar.(*Baz).Qux")
+    'github.com/foo/bar'
+    >>> package_of("type:*encoding/json.Decoder")
+    'encoding/json'
+    >>> package_of("go:itab.*os.File,io.Writer")
+    '(go)'
+    >>> package_of("_cgo_topofstack")
+    '(C)'
+    """
+    if symbol.startswith(("type:", "type.")):
+        # Type descriptors are named `type:T` since Go1.20, and `type.T` before.
+        package = package_of(symbol[5:].lstrip("*[]"))
+        return "(go)" if package == "(C)" else package
+    if symbol.startswith(("go:", "go.")):
+        return "(go)"
+    head = re.split(r"[\[(]", symbol, maxsplit=1)[0]
+    dot = head.find(".", head.rfind("/") + 1)
+    if dot <= 0:
+        return "(C)"
+    return head[:dot]
+
+
+def analyze(
+    path: str | os.PathLike[str],
+    go_command: str = "go",
+    env: t.Optional[t.Mapping[str, str]] = None,
+    top: int = 20,
+    command_runner: t.Optional[runner.Runner] = None,
+) -> dict[str, t.Any]:
+    """Return a size report of a shared library built by Go.
+
+    Parameters
+    ----------
+    path : str | os.PathLike[str]
+        The shared library.
+    go_command : str
+        The Go executable, whose `go tool nm` lists symbols.
+    env : Mapping[str, str] | None
+        Environment of `go`.
+    top : int
+        The number of the largest packages and symbols to report.
+    command_runner : go_extension.runner.Runner | None
+
+    Returns
+    -------
+    dict[str, Any]
+        `path`, `size` (bytes), `sections` (bytes per section, empty if not ELF),
+        `debug_size` (bytes of DWARF sections, None if not ELF),
+        `packages` (the largest packages by the total size of their symbols) and `symbols` (the largest symbols).
+    """
+    sections = elf_sections(path)
+    symbols = go_symbols(path, go_command, env, command_runner)
+    packages: dict[str, list[int]] = {}
+    for name, _, size in symbols:
+        package = packages.setdefault(package_of(name), [0, 0])
+        package[0] += size
+        package[1] += 1
+    largest = sorted(packages.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        "path": os.fspath(path),
+        "size": os.path.getsize(path),
+        "sections": sections or {},
+        "debug_size": None if sections is None else debug_size(sections),
+        "packages": [{"package": name, "size": size, "symbols": count} for name, (size, count) in largest],
+        "symbols": [{"name": name, "type": type_, "size": size} for name, type_, size in symbols[:top]],
+    }
+
+
+def over_budget(reports: t.Iterable[t.Mapping[str, t.Any]], budget: int) -> list[str]:
+    """Return paths of reported artifacts larger than `budget` bytes.
+
+    Examples
+    --------
+    >>> over_budget([{"path": "a.so", "size": 10}, {"path": "b.so", "size": 30}], 20)
+    ['b.so']
+    """
+    return [report["path"] for report in reports if report["size"] > budget]
+
+
+def write_report(
+    path: str | os.PathLike[str], reports: t.Sequence[t.Mapping[str, t.Any]], budget: t.Optional[int] = None
+) -> Path:
+    """Write reports of artifacts to a JSON file.
+
+    Parameters
+    ----------
+    path : str | os.PathLike[str]
+        The JSON file.
+    reports : Sequence[Mapping[str, Any]]
+        Reports returned by `analyze()`, with `extension` added.
+    budget : int | None
+        The size budget of an artifact in bytes.
+
+    Returns
+    -------
+    pathlib.Path
+    """
+    report = {
+        "budget": budget,
+        "over_budget": [] if budget is None else over_budget(reports, budget),
+        "total_size": sum(report["size"] for report in reports),
+        "artifacts": sorted(reports, key=lambda report: str(report["path"])),
+    }
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(json.dumps(report, indent=2) + "\n")
+    return target
+
+
+def strip_debug_info(
+    path: str | os.PathLike[str],
+    mode: str,
+    debug_file: t.Optional[str | os.PathLike[str]] = None,
+    objcopy: str = "objcopy",
+    command_runner: t.Optional[runner.Runner] = None,
+) -> t.Optional[Path]:
+    """Remove DWARF sections from a shared library in place, by `objcopy`.
+
+    Parameters
+    ----------
+    path : str | os.PathLike[str]
+        The shared library.
+    mode : str
+        `keep` does nothing, `strip` discards the debug information,
+        and `split` moves it into `debug_file`, linked from the library by `.gnu_debuglink`.
+    debug_file : str | os.PathLike[str] | None
+        The file to split the debug information into. Defaults to `path` with `.debug` appended.
+    objcopy : str
+        The objcopy executable.
+    command_runner : go_extension.runner.Runner | None
+
+    Returns
+    -------
+    pathlib.Path | None
+        The debug file if split.
+
+    Raises
+    ------
+    ValueError
+        If `mode` is unknown.
+    OSError
+        If objcopy fails.
+    """
+    if mode not in DEBUG_INFO_MODES:
+        raise ValueError(f"debug info mode must be one of {', '.join(DEBUG_INFO_MODES)}, not {mode!r}")
+    if mode == "keep":
+        return None
+    command_runner = command_runner or runner.Runner()
+    library = os.fspath(path)
+    commands = [[objcopy, "--strip-debug", library]]
+    split = None
+    if mode == "split":
+        split = Path(debug_file) if debug_file is not None else Path(library + ".debug")
+        split.parent.mkdir(parents=True, exist_ok=True)
+        commands = [
+            [objcopy, "--only-keep-debug", library, os.fspath(split)],
+            [objcopy, "--strip-debug", f"--add-gnu-debuglink={split}", library],
+        ]
+    for cmd in commands:
+        result = command_runner.run_sync(cmd)
+        if result.returncode:
+            raise OSError(f"{' '.join(cmd)} failed with exit code {result.returncode}: {result.output.strip()}")
+    return split
+
+
+def format_report(report: t.Mapping[str, t.Any], packages: int = 3) -> str:
+    """Return a one-line summary of a report returned by `analyze()`.
+
+    Examples
+    --------
+    >>> format_report({"path": "_hello.so", "size": 3 << 20, "debug_size": 1 << 20,
+    ...                "packages": [{"package": "runtime", "size": 1 << 20, "symbols": 2000}]})
+    '_hello.so: 3.0 MiB (debug info 1.0 MiB), largest packages: runtime 1.0 MiB'
+    """
+    text = f"{Path(report['path']).name}: {_format_size(report['size'])}"
+    if report.get("debug_size") is not None:
+        text += f" (debug info {_format_size(report['debug_size'])})"
+    largest = [f"{package['package']} {_format_size(package['size'])}" for package in report["packages"][:packages]]
+    if largest:
+        text += ", largest packages: " + ", ".join(largest)
+    return text
+
+
+def _format_size(size: int) -> str:
+    if size < 1 << 20:
+        return f"{size / (1 << 10):.1f} KiB"
+    return f"{size / (1 << 20):.1f} MiB"
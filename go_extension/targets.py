@@ -0,0 +1,145 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+import os
+import shlex
+import typing as t
+
+# Memory a concurrent build is assumed to use at most, to limit the number of builds.
+BUILD_MEMORY = 1 << 30  # 1 GiB
+
+
+class Target:
+    """Platform to cross-compile GoExtensions for.
+
+    Examples
+    --------
+    >>> target = Target.parse("linux/arm64 CC=aarch64-linux-gnu-gcc")
+    >>> target
+    Target('linux', 'arm64', {'CC': 'aarch64-linux-gnu-gcc'})
+    >>> target.tag
+    'linux-arm64'
+    >>> target.env["GOARCH"]
+    'arm64'
+    """
+
+    goos: str
+    goarch: str
+    extra_env: dict[str, str]
+    python: t.Optional[str]
+
+    def __init__(self, goos: str, goarch: str, extra_env: t.Optional[t.Mapping[str, str]] = None) -> None:
+        """
+        Parameters
+        ----------
+        goos, goarch : str
+            `GOOS` and `GOARCH` of the target.
+        extra_env : Mapping[str, str] | None
+            Environment variables of the toolchain for the target, like `CC` or `CGO_CFLAGS`.
+            `PYTHON` is not an environment variable but the interpreter gopy takes Python headers from.
+        """
+        self.goos = goos
+        self.goarch = goarch
+        self.extra_env = dict(extra_env or {})
+        self.python = self.extra_env.pop("PYTHON", None)
+
+    def __repr__(self) -> str:
+        return f"Target({self.goos!r}, {self.goarch!r}, {self.extra_env!r})"
+
+    @classmethod
+    def parse(cls, spec: str) -> "Target":
+        """Parse a target like `GOOS/GOARCH [NAME=VALUE ...]`.
+
+        Parameters
+        ----------
+        spec : str
+
+        Returns
+        -------
+        go_extension.targets.Target
+
+        Raises
+        ------
+        ValueError
+            If `spec` is malformed.
+        """
+        platform, *assignments = shlex.split(spec)
+        goos, sep, goarch = platform.partition("/")
+        if not (goos and sep and goarch):
+            raise ValueError(f"target must be GOOS/GOARCH, not {platform!r}")
+        extra_env = {}
+        for assignment in assignments:
+            name, sep, value = assignment.partition("=")
+            if not (name and sep):
+                raise ValueError(f"environment of target {platform!r} must be NAME=VALUE, not {assignment!r}")
+            extra_env[name] = value
+        return cls(goos, goarch, extra_env)
+
+    @property
+    def tag(self) -> str:
+        """The name of the artifact directory of the target, like `linux-arm64`."""
+        return f"{self.goos}-{self.goarch}"
+
+    @property
+    def env(self) -> dict[str, str]:
+        """Environment variables to build for the target."""
+        return {"GOOS": self.goos, "GOARCH": self.goarch, "CGO_ENABLED": "1", **self.extra_env}
+
+
+def parse_targets(text: str) -> list[Target]:
+    """Parse targets separated by newlines or commas.
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    list[go_extension.targets.Target]
+
+    Examples
+    --------
+    >>> [target.tag for target in parse_targets("linux/amd64, linux/arm64")]
+    ['linux-amd64', 'linux-arm64']
+    """
+    return [Target.parse(spec) for line in text.splitlines() for spec in line.split(",") if spec.strip()]
+
+
+def concurrency(jobs: int, workers: t.Optional[int] = None, memory: int = BUILD_MEMORY) -> int:
+    """Return the number of builds to run at the same time.
+
+    It is limited by `workers` (default: the number of CPUs), the number of CPUs
+    and the available memory divided by `memory`, and is at least 1.
+
+    Parameters
+    ----------
+    jobs : int
+        The number of builds.
+    workers : int | None
+        The requested number of concurrent builds.
+    memory : int
+        Memory a build uses in bytes.
+
+    Returns
+    -------
+    int
+    """
+    cpus = os.cpu_count() or 1
+    limit = min(jobs, workers or cpus, cpus)
+    available = available_memory()
+    if available is not None:
+        limit = min(limit, available // memory)
+    return max(1, limit)
+
+
+def available_memory() -> t.Optional[int]:
+    """Return the memory available for new processes in bytes, or None if unknown."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
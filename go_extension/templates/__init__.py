@@ -0,0 +1,59 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+"""Templates of the code generated by go-extension.
+
+`*.py.in` are Python modules written next to the bindings, and `*.go.in` and `*.c.in` are code added to the
+bindings generated by gopy. Placeholders are of `string.Template`, like `${marker}`.
+"""
+
+import functools
+import string
+from importlib import resources
+
+
+@functools.lru_cache(maxsize=None)
+def load(template: str) -> string.Template:
+    """Return `template` of this package.
+
+    Parameters
+    ----------
+    template : str
+        The file name of the template, like `runtime.py.in`.
+
+    Returns
+    -------
+    string.Template
+    """
+    return string.Template(resources.files(__name__).joinpath(template).read_text(encoding="utf-8"))
+
+
+def render(template: str, **values: object) -> str:
+    """Return `template` with its placeholders substituted by `values`.
+
+    Parameters
+    ----------
+    template : str
+        The file name of the template, like `runtime.py.in`.
+    **values : object
+        Values of the placeholders, converted by `str()`.
+
+    Returns
+    -------
+    str
+
+    Raises
+    ------
+    KeyError
+        If a placeholder is not given.
+
+    Examples
+    --------
+    >>> print(render("facade.py.in", bundle="pkg._bundle", module="hello"))
+    # Generated by go-extension: an alias of pkg._bundle.hello.
+    import sys
+    <BLANKLINE>
+    from pkg._bundle import hello as _module
+    <BLANKLINE>
+    sys.modules[__name__] = _module
+    <BLANKLINE>
+    """
+    return load(template).substitute(values)
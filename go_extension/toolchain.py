@@ -0,0 +1,277 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import threading
+import typing as t
+from pathlib import Path
+
+from go_extension import cache
+
+TOOLCHAIN_CACHE_FILE = "toolchain.json"
+
+_probed: dict[tuple[str, str], t.Optional["Tool"]] = {}
+_interpreters: dict[str, "Interpreter"] = {}
+_INTERPRETER_CODE = (
+    "import sys, sysconfig; print(sysconfig.get_config_var('EXT_SUFFIX')); print(sys.implementation.cache_tag)"
+)
+_lock = threading.Lock()
+
+
+class Tool:
+    """Executable of the build toolchain resolved by `probe_go()` or `probe()`.
+
+    Examples
+    --------
+    >>> go = Tool("go", "/usr/local/go/bin/go", "go1.18.2")
+    >>> go.version_info
+    (1, 18, 2)
+    """
+
+    name: str
+    path: str
+    version: str
+
+    def __init__(self, name: str, path: str, version: str) -> None:
+        """
+        Parameters
+        ----------
+        name : str
+            The command name, like `go` or `gopy`.
+        path : str
+            The absolute path of the executable.
+        version : str
+            The version reported by the executable, or empty if unknown.
+        """
+        self.name = name
+        self.path = path
+        self.version = version
+
+    def __repr__(self) -> str:
+        return f"Tool({self.name!r}, {self.path!r}, {self.version!r})"
+
+    @property
+    def version_info(self) -> tuple[int, ...]:
+        """Numeric components of `version`, empty if unknown."""
+        match = re.search(r"(\d+(?:\.\d+)*)", self.version)
+        return tuple(int(part) for part in match.group(1).split(".")) if match else ()
+
+
+class Interpreter:
+    """Python interpreter to build extensions for, resolved by `probe_python()`.
+
+    Examples
+    --------
+    >>> python = Interpreter("/usr/bin/python3.11", ".cpython-311-x86_64-linux-gnu.so", "cpython-311")
+    >>> python.abi_tag
+    'cpython-311-x86_64-linux-gnu'
+    """
+
+    path: str
+    ext_suffix: str
+    cache_tag: str
+
+    def __init__(self, path: str, ext_suffix: str, cache_tag: str) -> None:
+        """
+        Parameters
+        ----------
+        path : str
+            The absolute path of the executable.
+        ext_suffix : str
+            The file name suffix of extension modules (`EXT_SUFFIX`), like `.cpython-311-x86_64-linux-gnu.so`.
+        cache_tag : str
+            `sys.implementation.cache_tag`, like `cpython-311`.
+        """
+        self.path = path
+        self.ext_suffix = ext_suffix
+        self.cache_tag = cache_tag
+
+    def __repr__(self) -> str:
+        return f"Interpreter({self.path!r}, {self.ext_suffix!r}, {self.cache_tag!r})"
+
+    @property
+    def abi_tag(self) -> str:
+        """The ABI part of `ext_suffix`, like `cpython-311-x86_64-linux-gnu`."""
+        return self.ext_suffix.strip(".").rsplit(".", 1)[0]
+
+
+def probe_python(command: str) -> t.Optional[Interpreter]:
+    """Resolve a Python interpreter to its absolute path and ABI. Results are memoised per process.
+
+    Parameters
+    ----------
+    command : str
+        The command name or path of the interpreter.
+
+    Returns
+    -------
+    go_extension.toolchain.Interpreter | None
+        None if the command is not found or fails.
+    """
+    path = shutil.which(command)
+    if path is None:
+        return None
+    path = os.path.abspath(path)
+    with _lock:
+        if path in _interpreters:
+            return _interpreters[path]
+    if os.path.realpath(path) == os.path.realpath(sys.executable):
+        ext_suffix, cache_tag = str(sysconfig.get_config_var("EXT_SUFFIX")), str(sys.implementation.cache_tag)
+    else:
+        lines = _run([path, "-c", _INTERPRETER_CODE]).splitlines()
+        if len(lines) != 2:
+            return None
+        ext_suffix, cache_tag = lines
+    interpreter = Interpreter(path, ext_suffix, cache_tag)
+    with _lock:
+        _interpreters[path] = interpreter
+    return interpreter
+
+
+def probe_go(command: str = "go", env: t.Optional[t.Mapping[str, str]] = None) -> t.Optional[Tool]:
+    """Resolve the Go executable to its absolute path and version reported by `go env GOVERSION`.
+
+    Parameters
+    ----------
+    command : str
+        The Go command name or path.
+    env : Mapping[str, str] | None
+        See `probe()`.
+
+    Returns
+    -------
+    go_extension.toolchain.Tool | None
+        None if the command is not found.
+    """
+    return _probe(command, env, None)
+
+
+def probe(name: str, env: t.Optional[t.Mapping[str, str]], go: Tool) -> t.Optional[Tool]:
+    """Resolve a command built by Go to its absolute path and module version reported by `go version -m`.
+
+    Results are memoised per process.
+    Versions are also stored on disk (see `go_extension.cache.cache_root()`)
+    and reused while the executable keeps the same modification time and size.
+
+    Parameters
+    ----------
+    name : str
+        The command name or path.
+    env : Mapping[str, str] | None
+        Environment to search the command in `PATH` and in the `go install` directory.
+        Defaults to `os.environ`.
+    go : go_extension.toolchain.Tool
+        The Go executable.
+
+    Returns
+    -------
+    go_extension.toolchain.Tool | None
+        None if the command is not found.
+    """
+    return _probe(name, env, go)
+
+
+def _probe(name: str, env: t.Optional[t.Mapping[str, str]], go: t.Optional[Tool]) -> t.Optional[Tool]:
+    env = os.environ if env is None else env
+    search_path = search_path_of(env)
+    key = (name, search_path)
+    with _lock:
+        if key in _probed:
+            return _probed[key]
+    path = shutil.which(name, path=search_path)
+    tool = None
+    if path is not None:
+        path = os.path.abspath(path)
+        tool = Tool(os.path.basename(name), path, _version(path, go))
+    with _lock:
+        _probed[key] = tool
+    return tool
+
+
+def forget(name: t.Optional[str] = None) -> None:
+    """Drop memoised probes of `name`, or of all commands if None."""
+    with _lock:
+        for key in list(_probed):
+            if name is None or key[0] == name:
+                del _probed[key]
+
+
+def install_dir(env: t.Mapping[str, str]) -> str:
+    """Return the directory `go install` places executables in.
+
+    Parameters
+    ----------
+    env : Mapping[str, str]
+
+    Returns
+    -------
+    str
+    """
+    if env.get("GOBIN"):
+        return env["GOBIN"]
+    gopath = env.get("GOPATH", "").split(os.pathsep)[0] or os.path.join(os.path.expanduser("~"), "go")
+    return os.path.join(gopath, "bin")
+
+
+def search_path_of(env: t.Mapping[str, str]) -> str:
+    """Return `PATH` of `env` followed by the `go install` directory."""
+    return os.pathsep.join(filter(None, [env.get("PATH", os.defpath), install_dir(env)]))
+
+
+def _version(path: str, go: t.Optional[Tool]) -> str:
+    stat = os.stat(path)
+    stamp = [stat.st_mtime_ns, stat.st_size]
+    versions = _load_versions()
+    cached = versions.get(path)
+    if cached is not None and cached.get("stamp") == stamp:
+        return str(cached["version"])
+    if go is None:
+        version = _run([path, "env", "GOVERSION"])
+    else:
+        match = re.search(r"^\s*mod\s+\S+\s+(\S+)", _run([go.path, "version", "-m", path]), re.MULTILINE)
+        version = match.group(1) if match else ""
+    if version:
+        versions[path] = {"stamp": stamp, "version": version}
+        _dump_versions(versions)
+    return version
+
+
+def _run(cmd: list[str]) -> str:
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    except OSError:
+        return ""
+    return proc.stdout.strip() if proc.returncode == 0 else ""
+
+
+def _cache_file() -> t.Optional[Path]:
+    root = cache.cache_root()
+    return root / TOOLCHAIN_CACHE_FILE if root is not None else None
+
+
+def _load_versions() -> dict[str, dict[str, t.Any]]:
+    path = _cache_file()
+    if path is None or not path.is_file():
+        return {}
+    try:
+        return dict(json.loads(path.read_text()))
+    except (OSError, ValueError):
+        return {}
+
+
+def _dump_versions(versions: dict[str, dict[str, t.Any]]) -> None:
+    path = _cache_file()
+    if path is None:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=path.parent, delete=False) as f:
+            json.dump(versions, f)
+        os.replace(f.name, path)
+    except OSError:
+        pass
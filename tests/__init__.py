@@ -1 +1,9 @@
 # Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+import atexit
+import os
+import shutil
+import tempfile
+
+# Tests never write to the cache directory of the user.
+os.environ["GO_EXTENSION_CACHE_DIR"] = _cache_dir = tempfile.mkdtemp(prefix="go-extension-tests-")
+atexit.register(shutil.rmtree, _cache_dir, ignore_errors=True)
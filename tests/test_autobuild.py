@@ -0,0 +1,127 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase, mock
+import doctest
+import importlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from go_extension import autobuild, compiler, extension
+from tests import utils
+
+
+class TestGoExtensionFinder(TestCase):
+    go_module_name: str = "github.com/huisint/go-extension-python"
+    pkg: str = "tests/go_src"
+    output: Path = Path("tests", "autobuild_go")
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        utils.create_go_pkg(self.pkg)
+        self.ext = extension.GoExtension("tests.autobuild_go", [f"{self.go_module_name}/{self.pkg}"])
+        self.finder = self.new_finder()
+        build_patcher = mock.patch("go_extension.compiler.GoPyCompiler.build", autospec=True, side_effect=self.build)
+        self.build_mock = build_patcher.start()
+        self.addCleanup(build_patcher.stop)
+
+    def tearDown(self) -> None:
+        utils.clean_up_go_pkg(self.pkg)
+        shutil.rmtree(self.output, ignore_errors=True)
+        sys.modules.pop("tests.autobuild_go", None)
+        self.tmp.cleanup()
+
+    def new_finder(self) -> autobuild.GoExtensionFinder:
+        finder = autobuild.GoExtensionFinder(gopy_compiler=compiler.GoPyCompiler(), state_dir=self.tmp.name)
+        finder.register(self.ext)
+        return finder
+
+    def build(self, gopy_compiler: compiler.GoPyCompiler, ext: extension.GoExtension, output: Path) -> None:
+        output.mkdir(parents=True, exist_ok=True)
+        (output / "__init__.py").write_text("BUILT = True\n")
+        (output / "_go.so").write_bytes(os.urandom(16))
+
+    def edit(self, content: str) -> None:
+        main = Path(self.pkg, "main.go")
+        # Modification times are advanced explicitly, as edits in a test may be within their resolution.
+        stat = main.stat()
+        main.write_text(content)
+        os.utime(main, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    def test_ensure_fresh(self) -> None:
+        self.assertTrue(self.finder.ensure_fresh("tests.autobuild_go"))
+        self.assertTrue(os.path.exists(self.output / "_go.so"))
+        with mock.patch("go_extension.compiler.subprocess.run", wraps=subprocess.run) as run_mock:
+            self.assertFalse(self.finder.ensure_fresh("tests.autobuild_go"))
+        run_mock.assert_not_called()
+        self.assertEqual(self.build_mock.call_count, 1)
+
+    def test_touched(self) -> None:
+        self.finder.ensure_fresh("tests.autobuild_go")
+        self.edit(Path(self.pkg, "main.go").read_text())
+        self.assertFalse(self.finder.is_fresh("tests.autobuild_go"))
+        self.assertFalse(self.finder.ensure_fresh("tests.autobuild_go"))
+        self.assertTrue(self.finder.is_fresh("tests.autobuild_go"))
+        self.assertEqual(self.build_mock.call_count, 1)
+
+    def test_changed(self) -> None:
+        self.finder.ensure_fresh("tests.autobuild_go")
+        self.edit(Path(self.pkg, "main.go").read_text() + "\n\nfunc Hello() {}\n")
+        self.assertTrue(self.finder.ensure_fresh("tests.autobuild_go"))
+        self.assertEqual(self.build_mock.call_count, 2)
+
+    def test_new_file(self) -> None:
+        self.finder.ensure_fresh("tests.autobuild_go")
+        time.sleep(0.01)
+        Path(self.pkg, "hello.go").write_text("package pkggo_src\n\nfunc Hello() {}\n")
+        self.assertTrue(self.finder.ensure_fresh("tests.autobuild_go"))
+        self.assertEqual(self.build_mock.call_count, 2)
+
+    def test_options_changed(self) -> None:
+        self.finder.ensure_fresh("tests.autobuild_go")
+        self.ext.cgo_cflags = ["-O3"]
+        self.assertTrue(self.finder.ensure_fresh("tests.autobuild_go"))
+        self.assertEqual(self.build_mock.call_count, 2)
+
+    def test_state_reused(self) -> None:
+        self.finder.ensure_fresh("tests.autobuild_go")
+        finder = self.new_finder()
+        self.assertTrue(finder.is_fresh("tests.autobuild_go"))
+        self.assertFalse(finder.ensure_fresh("tests.autobuild_go"))
+        self.assertEqual(self.build_mock.call_count, 1)
+
+    def test_up_to_date_without_state(self) -> None:
+        self.build(compiler.GoPyCompiler(), self.ext, self.output)
+        self.assertFalse(self.finder.ensure_fresh("tests.autobuild_go"))
+        self.build_mock.assert_not_called()
+
+    def test_fast(self) -> None:
+        self.finder.ensure_fresh("tests.autobuild_go")
+        start = time.perf_counter()
+        for _ in range(1000):
+            self.finder.ensure_fresh("tests.autobuild_go")
+        self.assertLess((time.perf_counter() - start) / 1000, 1e-3)
+
+    def test_install(self) -> None:
+        finder = autobuild.install([self.ext])
+        try:
+            self.assertIs(sys.meta_path[0], finder)
+            self.assertIs(autobuild.install([]), finder)
+            module = importlib.import_module("tests.autobuild_go")
+            self.assertTrue(module.BUILT)
+        finally:
+            autobuild.uninstall()
+        self.assertFalse(any(isinstance(f, autobuild.GoExtensionFinder) for f in sys.meta_path))
+
+    def test_failure(self) -> None:
+        self.build_mock.side_effect = OSError("gopy not found")
+        with self.assertRaises(ImportError):
+            self.finder.ensure_fresh("tests.autobuild_go")
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(autobuild))
+    return tests
@@ -0,0 +1,150 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase
+from pathlib import Path
+import doctest
+import tempfile
+
+from setuptools._distutils import errors
+
+from go_extension import bindings, extension
+
+BUILD_PY = """\
+from pybindgen import retval, param, Module
+mod = Module('_go')
+mod.add_function('hello_Sum', retval('double'), [param('int64_t', 'h')])
+mod.add_function('hello_Callback', None, [param('int64_t', 'fn')])
+mod.add_function('hello_Point_Norm', retval('double'), [param('int64_t', '_handle')])
+mod.generate(open('go.c', 'w'))
+"""
+
+
+class Test_release_gil(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.build_py = Path(self.tmp.name, "build.py")
+        self.build_py.write_text(BUILD_PY)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_patterns(self) -> None:
+        released = bindings.release_gil(self.build_py, ["hello.Sum", "hello.Point.*"])
+        self.assertEqual(released, ["hello_Sum", "hello_Point_Norm"])
+        lines = self.build_py.read_text().splitlines()
+        self.assertTrue(lines[2].endswith("[param('int64_t', 'h')], unblock_threads=True)"))
+        self.assertNotIn("unblock_threads", lines[3])
+        self.assertTrue(lines[4].endswith(", unblock_threads=True)"))
+
+    def test_idempotent(self) -> None:
+        bindings.release_gil(self.build_py, ["hello.Sum"])
+        content = self.build_py.read_text()
+        self.assertEqual(bindings.release_gil(self.build_py, ["hello.Sum"]), [])
+        self.assertEqual(self.build_py.read_text(), content)
+
+
+class Test_add_buffer_protocol(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = Path(self.tmp.name)
+        (self.output / "build.py").write_text(BUILD_PY)
+        (self.output / "go.go").write_text('package main\n\nimport "C"\n')
+        (self.output / "go.py").write_text("class Slice_byte:\n    pass\n")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_add_buffer_protocol(self) -> None:
+        bindings.add_buffer_protocol(self.output, "go")
+        go_code = (self.output / "go.go").read_text()
+        for slice_ in bindings.BUFFER_SLICES:
+            self.assertIn(f"//export {slice_}_from_buffer", go_code)
+        lines = (self.output / "build.py").read_text().splitlines()
+        wrappers = [i for i, line in enumerate(lines) if line.startswith("mod.add_custom_function_wrapper(")]
+        self.assertEqual(len(wrappers), len(bindings.BUFFER_SLICES))
+        self.assertLess(max(wrappers), lines.index("mod.generate(open('go.c', 'w'))"))
+        compile("\n".join(lines), "build.py", "exec")
+        self.assertIn("from . import _go as _go_extension_module", (self.output / "go.py").read_text())
+
+    def test_idempotent(self) -> None:
+        bindings.add_buffer_protocol(self.output, "go")
+        contents = [path.read_text() for path in sorted(self.output.iterdir())]
+        bindings.add_buffer_protocol(self.output, "go")
+        self.assertEqual([path.read_text() for path in sorted(self.output.iterdir())], contents)
+
+
+class Test_add_runtime_setters(TestCase):
+    def test_add_runtime_setters(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            go_file = Path(tmp, "go.go")
+            go_file.write_text('package main\n\nimport "C"\n')
+            bindings.add_runtime_setters(tmp, "go")
+            content = go_file.read_text()
+            bindings.add_runtime_setters(tmp, "go")
+            self.assertEqual(go_file.read_text(), content)
+        for setter in bindings.RUNTIME_SETTERS.values():
+            self.assertEqual(content.count(f"//export {setter}\n"), 1)
+
+
+class Test_add_profiling(TestCase):
+    def test_add_profiling(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            go_file = Path(tmp, "go.go")
+            go_file.write_text('package main\n\nimport "C"\n')
+            bindings.add_profiling(tmp, "go")
+            content = go_file.read_text()
+            bindings.add_profiling(tmp, "go")
+            self.assertEqual(go_file.read_text(), content)
+        self.assertEqual(content.count("//export GoExtension_WriteHeapProfile\n"), 1)
+
+
+class Test_replace_handle_registry(TestCase):
+    def test_replace_handle_registry(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            go_file = Path(tmp, "go.go")
+            go_file.write_text(
+                "func handleFromPtr_Point(p interface{}) CGoHandle {\n"
+                '    return CGoHandle(gopyh.Register("hello.Point", p))\n}\n'
+                "func ptrFromHandle_Point(h CGoHandle) *Point {\n"
+                '    p := gopyh.VarFromHandle((gopyh.CGoHandle)(h), "hello.Point")\n'
+                "    return p.(*Point)\n}\n"
+                "func DecRef(handle CGoHandle) {\n    gopyh.DecRef(gopyh.CGoHandle(handle))\n}\n"
+                "func NumHandles() int {\n    return gopyh.NumHandles()\n}\n"
+            )
+            self.assertEqual(bindings.replace_handle_registry(tmp, "go"), 4)
+            content = go_file.read_text()
+            self.assertEqual(bindings.replace_handle_registry(tmp, "go"), 0)
+            self.assertEqual(go_file.read_text(), content)
+        self.assertIn('goExtensionVarFromHandle((gopyh.CGoHandle)(h), "hello.Point")', content)
+        self.assertNotIn("gopyh.DecRef(", content)
+        self.assertEqual(content.count("//export GoExtension_ReadHandleStats\n"), 1)
+
+    def test_missing_calls(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            go_file = Path(tmp, "go.go")
+            go_file.write_text("func DecRef(handle CGoHandle) {\n    gopyh.DecRef(gopyh.CGoHandle(handle))\n}\n")
+            content = go_file.read_text()
+            with self.assertRaisesRegex(errors.DistutilsExecError, "gopyh.Register, gopyh.VarFromHandle"):
+                bindings.replace_handle_registry(tmp, "go")
+            self.assertEqual(go_file.read_text(), content)
+
+
+class Test_fingerprint(TestCase):
+    def test_options(self) -> None:
+        plain = extension.GoExtension("hello_go", ["example.com/hello"])
+        released = extension.GoExtension("hello_go", ["example.com/hello"], release_gil=["hello.Sum"])
+        self.assertFalse(bindings.needs_postprocess(plain))
+        self.assertNotEqual(bindings.fingerprint(plain), bindings.fingerprint(released))
+        configured = extension.GoExtension("hello_go", ["example.com/hello"], go_runtime={})
+        self.assertTrue(bindings.needs_postprocess(configured))
+        self.assertNotEqual(bindings.fingerprint(plain), bindings.fingerprint(configured))
+        instrumented = extension.GoExtension("hello_go", ["example.com/hello"], instrument=True)
+        self.assertTrue(bindings.needs_postprocess(instrumented))
+        self.assertNotEqual(bindings.fingerprint(plain), bindings.fingerprint(instrumented))
+        registry = extension.GoExtension("hello_go", ["example.com/hello"], handle_registry=True)
+        self.assertTrue(bindings.needs_postprocess(registry))
+        self.assertNotEqual(bindings.fingerprint(plain), bindings.fingerprint(registry))
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(bindings))
+    return tests
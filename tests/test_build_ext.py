@@ -1,11 +1,17 @@
 # Copyright (c) 2021 Shuhei Nitta. All rights reserved.
-from unittest import TestCase, mock
+from unittest import TestCase, mock, skipIf
 import doctest
+import json
 import os
 import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
 from setuptools import dist, extension as setuptools_ext
+from setuptools._distutils import errors
 
-from go_extension import build_ext, extension
+from go_extension import bindings, build_ext, compiler, daemon, extension, profiling, templates
 from tests import utils
 
 
@@ -27,6 +33,148 @@ class Testbuild_ext_build_extension(TestCase):
         build_ext_mock.assert_called_once()
 
 
+class Testbuild_ext_run(TestCase):
+    @mock.patch.object(build_ext.build_ext.__bases__[0], "run")
+    def test_go_caches(self, run_mock: mock.Mock) -> None:
+        distr = dist.Distribution()
+        distr.command_options["build_ext"] = {
+            "go_cache": ("setup.cfg", "/tmp/gocache"),
+            "go_modcache": ("setup.cfg", "/tmp/gomodcache"),
+            "go_flags": ("setup.cfg", "-mod=vendor"),
+        }
+        command = distr.get_command_obj("build_ext")
+        self.assertIsInstance(command, build_ext.build_ext)
+        command.run()
+        run_mock.assert_called_once()
+        self.assertEqual(command.gopy_compiler.env["GOCACHE"], "/tmp/gocache")
+        self.assertEqual(command.gopy_compiler.env["GOMODCACHE"], "/tmp/gomodcache")
+        self.assertEqual(command.gopy_compiler.env["GOFLAGS"], "-mod=vendor")
+
+    @mock.patch.object(build_ext.build_ext.__bases__[0], "run")
+    def test_build_flags(self, run_mock: mock.Mock) -> None:
+        distr = dist.Distribution()
+        distr.command_options["build_ext"] = {
+            "go_build_flags": ("setup.cfg", '-trimpath -ldflags="-s -w"'),
+            "cgo_cflags": ("setup.cfg", "-O3 -march=native"),
+            "go_pgo": ("setup.cfg", "default.pgo"),
+        }
+        command = distr.get_command_obj("build_ext")
+        command.run()
+        self.assertEqual(command.gopy_compiler.build_flags, ["-trimpath", "-ldflags=-s -w"])
+        self.assertEqual(command.gopy_compiler.cgo_cflags, ["-O3", "-march=native"])
+        self.assertEqual(command.gopy_compiler.cgo_ldflags, [])
+        self.assertEqual(command.gopy_compiler.pgo, "default.pgo")
+
+    @mock.patch.object(build_ext.build_ext.__bases__[0], "run")
+    def test_go_daemon(self, run_mock: mock.Mock) -> None:
+        command = build_ext.build_ext(dist.Distribution())
+        with mock.patch.dict(os.environ, {daemon.SOCKET_ENV: ""}):
+            command.run()
+            self.assertIsNone(command.gopy_compiler.daemon_socket)
+            command.go_daemon = True
+            command.run()
+            self.assertEqual(command.gopy_compiler.daemon_socket, str(daemon.default_socket_path()))
+
+    @mock.patch.object(build_ext.build_ext.__bases__[0], "run")
+    def test_go_profile(self, run_mock: mock.Mock) -> None:
+        command = build_ext.build_ext(dist.Distribution())
+        with tempfile.TemporaryDirectory() as tmp:
+            command.go_profile = tmp
+            command.run()
+            self.assertTrue(os.path.exists(os.path.join(tmp, profiling.REPORT_FILE)))
+            self.assertTrue(os.path.exists(os.path.join(tmp, profiling.TRACE_FILE)))
+
+
+class Testbuild_ext_build_extensions(TestCase):
+    def setUp(self) -> None:
+        self.command = build_ext.build_ext(dist.Distribution())
+        self.command.gopy_compiler = compiler.GoPyCompiler(workers=4)
+        self.command.extensions = [extension.GoExtension(f"tests.go{i}", ["example.com/pkg"]) for i in range(3)]
+
+    @mock.patch("go_extension.build_ext.build_ext.build_go")
+    def test_parallel(self, build_go_mock: mock.Mock) -> None:
+        self.command.build_extensions()
+        self.assertEqual(build_go_mock.call_count, 3)
+        built = {call.args[0].original_name for call in build_go_mock.call_args_list}
+        self.assertSetEqual(built, {"tests.go0", "tests.go1", "tests.go2"})
+        for call in build_go_mock.call_args_list:
+            self.assertIsNot(call.args[1], self.command.gopy_compiler)
+            self.assertTrue(call.args[1].capture_output)
+
+    @mock.patch("go_extension.build_ext.build_ext.build_go")
+    def test_serial(self, build_go_mock: mock.Mock) -> None:
+        self.command.gopy_compiler.workers = 1
+        self.command.build_extensions()
+        self.assertEqual(build_go_mock.call_count, 3)
+        for call in build_go_mock.call_args_list:
+            self.assertEqual(len(call.args), 1)
+
+    @mock.patch("go_extension.build_ext.build_ext.build_go")
+    def test_parallel_failure(self, build_go_mock: mock.Mock) -> None:
+        build_go_mock.side_effect = errors.DistutilsExecError("gopy failed")
+        with self.assertRaises(errors.DistutilsExecError):
+            self.command.build_extensions()
+
+    @mock.patch("go_extension.runner.kill_all")
+    @mock.patch("go_extension.build_ext.build_ext.build_go")
+    def test_parallel_interrupt(self, build_go_mock: mock.Mock, kill_all_mock: mock.Mock) -> None:
+        build_go_mock.side_effect = KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            self.command.build_extensions()
+        kill_all_mock.assert_called_once_with()
+
+    @mock.patch("go_extension.build_ext.build_ext.build_go")
+    def test_quiet(self, build_go_mock: mock.Mock) -> None:
+        self.command.gopy_compiler.workers = 1
+        self.command.go_quiet = True
+        with mock.patch("go_extension.compiler.log.info") as info_mock:
+            self.command.build_extensions()
+        self.assertEqual(build_go_mock.call_count, 3)
+        for call in build_go_mock.call_args_list:
+            self.assertTrue(call.args[1].capture_output)
+        summaries = [call.args for call in info_mock.call_args_list if call.args[0].startswith("built %s")]
+        self.assertEqual(len(summaries), 3)
+
+    def test_failure_log(self) -> None:
+        def build_go(ext: extension.GoExtension, gopy_compiler: compiler.GoPyCompiler) -> None:
+            gopy_compiler.captured.command(["gopy", "build"])
+            gopy_compiler.captured.write("".join(f"line {i}\n" for i in range(10000)))
+            raise errors.DistutilsExecError("gopy failed")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            self.command.build_temp = tmp
+            with mock.patch.object(self.command, "build_go", build_go), mock.patch(
+                "go_extension.compiler.log.error"
+            ) as error_mock, self.assertRaises(errors.DistutilsExecError):
+                self.command._build_go_captured(self.command.extensions[0])
+            path = Path(tmp, "go-extension", "tests.go0.log")
+            self.assertEqual(len(path.read_text().splitlines()), 10001)
+            self.assertIn(path, error_mock.call_args.args)
+            tail = error_mock.call_args.args[4]
+            self.assertTrue(tail.endswith("line 9999"))
+            self.assertLess(len(tail), 20000)
+
+    @mock.patch("go_extension.build_ext.build_ext.build_go")
+    @mock.patch("go_extension.compiler.GoPyCompiler.prewarm", return_value=1.5)
+    def test_prewarm(self, prewarm_mock: mock.Mock, build_go_mock: mock.Mock) -> None:
+        self.command.go_prewarm = True
+        with mock.patch.object(
+            self.command, "should_skip_ext", side_effect=lambda ext: ext.original_name == "tests.go0"
+        ):
+            self.command.build_extensions()
+        prewarmed = [ext.original_name for ext in prewarm_mock.call_args.args[0]]
+        self.assertEqual(prewarmed, ["tests.go1", "tests.go2"])
+        self.assertEqual(build_go_mock.call_count, 3)
+
+    def test_parallel_workers(self) -> None:
+        self.command.parallel = None
+        self.assertEqual(self.command._parallel_workers(), 1)
+        self.command.parallel = 3
+        self.assertEqual(self.command._parallel_workers(), 3)
+        self.command.parallel = True
+        self.assertEqual(self.command._parallel_workers(), os.cpu_count() or 1)
+
+
 class Testbuild_ext_build_go(TestCase):
     go_module_name = "github.com/huisint/go-extension-python"
     command: build_ext.build_ext
@@ -54,6 +202,113 @@ class Testbuild_ext_build_go(TestCase):
         self.command.build_go(self.ext)
         should_skip_ext_mock.assert_called_once()
 
+    @mock.patch("go_extension.compiler.GoPyCompiler.resolve_dependencies")
+    def test_should_skip_ext_resolved_depends(self, resolve_dependencies_mock: mock.Mock) -> None:
+        ext_path = self.command.get_ext_fullpath(self.ext.name)
+        os.makedirs(os.path.dirname(ext_path))
+        with open(ext_path, "w"):
+            pass
+        os.utime(ext_path, (0, 0))
+        resolve_dependencies_mock.return_value = []
+        self.assertTrue(self.command.should_skip_ext(self.ext))
+        resolve_dependencies_mock.return_value = ["tests/go_src/main.go"]
+        self.assertFalse(self.command.should_skip_ext(self.ext))
+        resolve_dependencies_mock.assert_called_with(self.ext.packages)
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.resolve_dependencies")
+    def test_should_skip_ext_build_config(self, resolve_dependencies_mock: mock.Mock) -> None:
+        resolve_dependencies_mock.return_value = []
+        ext_path = self.command.get_ext_fullpath(self.ext.name)
+        os.makedirs(os.path.dirname(ext_path))
+        with open(ext_path, "w"):
+            pass
+        with tempfile.TemporaryDirectory() as tmp:
+            self.command.build_temp = tmp
+            self.assertFalse(self.command.should_skip_ext(self.ext))
+            self.command._write_build_config(self.ext)
+            self.assertTrue(self.command.should_skip_ext(self.ext))
+            self.ext.go_build_flags = ["-trimpath"]
+            self.assertFalse(self.command.should_skip_ext(self.ext))
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+    @mock.patch("go_extension.compiler.GoPyCompiler.spawn")
+    def test_inplace_single_pass(self, spawn_mock: mock.Mock, install_build_tools_mock: mock.Mock) -> None:
+        def gopy(cmd: list[str]) -> None:
+            output = next(arg.split("=", 1)[1] for arg in cmd if arg.startswith("-output="))
+            os.makedirs(output, exist_ok=True)
+            for name in ("_go.so", "go.py"):
+                with open(os.path.join(output, name), "w") as f:
+                    f.write(name)
+
+        spawn_mock.side_effect = gopy
+        inplaced_pkg = os.path.join(*self.ext.original_name.split("."))
+        self.command.gopy_compiler.inplace = True
+        self.command.gopy_compiler.build_cache = None
+        try:
+            self.command.build_go(self.ext)
+            spawn_mock.assert_called_once()
+            self.assertEqual(spawn_mock.call_args.args[0][:2], ["gopy", "build"])
+            for name in ("_go.so", "go.py"):
+                built = os.path.join(os.path.dirname(self.command.get_ext_fullpath(self.ext.name)), name)
+                self.assertTrue(os.path.samefile(built, os.path.join(inplaced_pkg, name)))
+        finally:
+            shutil.rmtree(inplaced_pkg, ignore_errors=True)
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build")
+    def test_inplace_produced_files(self, build_mock: mock.Mock) -> None:
+        def gopy(ext: extension.GoExtension, output: Path) -> None:
+            output.mkdir(parents=True, exist_ok=True)
+            (output / "_go.so").write_text("so")
+
+        build_mock.side_effect = gopy
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.command.build_temp = tmp.name
+        self.command.gopy_compiler.inplace = True
+        inplaced_pkg = Path(*self.ext.original_name.split("."))
+        output = Path(self.command.get_ext_fullpath(self.ext.name)).parent
+        output.mkdir(parents=True, exist_ok=True)
+        (output / "user.py").write_text("copied by build_py")
+        try:
+            self.command.build_go(self.ext)
+            with mock.patch.object(self.command, "should_skip_ext", return_value=True):
+                shutil.rmtree(inplaced_pkg)
+                self.command.build_go(self.ext)
+            self.assertEqual(sorted(path.name for path in inplaced_pkg.iterdir()), ["_go.so"])
+        finally:
+            shutil.rmtree(inplaced_pkg, ignore_errors=True)
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build")
+    def test_inplace_unchanged_files(self, build_mock: mock.Mock) -> None:
+        builds = iter(["first", "second"])
+
+        def gopy(ext: extension.GoExtension, output: Path) -> None:
+            output.mkdir(parents=True, exist_ok=True)
+            (output / "_go.so").write_text(next(builds))
+            (output / "go.py").write_text(f"# {output}\n")
+
+        build_mock.side_effect = gopy
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.command.build_temp = tmp.name
+        self.command.gopy_compiler.inplace = True
+        self.command.force = True
+        inplaced_pkg = Path(*self.ext.original_name.split("."))
+        output = Path(self.command.get_ext_fullpath(self.ext.name)).parent
+        try:
+            self.command.build_go(self.ext)
+            for path in (output / "go.py", output / "_go.so", inplaced_pkg / "go.py", inplaced_pkg / "_go.so"):
+                os.utime(path, (0, 0))
+            self.command.build_go(self.ext)
+            self.assertEqual((output / "go.py").read_text(), f"# {output}\n")
+            self.assertEqual((output / "go.py").stat().st_mtime, 0)
+            self.assertEqual((inplaced_pkg / "go.py").stat().st_mtime, 0)
+            self.assertEqual((inplaced_pkg / "_go.so").read_text(), "second")
+            self.assertNotEqual((inplaced_pkg / "_go.so").stat().st_mtime, 0)
+            self.assertEqual(sorted(path.name for path in output.parent.iterdir()), ["go"])
+        finally:
+            shutil.rmtree(inplaced_pkg, ignore_errors=True)
+
     def test_inplace(self) -> None:
         inplaced_pkg = os.path.join(*self.ext.original_name.split("."))
         self.command.gopy_compiler.inplace = True
@@ -64,6 +319,639 @@ class Testbuild_ext_build_go(TestCase):
             shutil.rmtree(inplaced_pkg, ignore_errors=True)
 
 
+class Testbuild_ext_build_go_bundle(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.command = build_ext.build_ext(dist.Distribution())
+        self.command.build_lib = self.tmp.name
+        self.command.go_bundle = "gobundle_test"
+        self.command.extensions = [
+            extension.GoExtension("facade_a", ["example.com/m/hello", "example.com/m/shared"]),
+            extension.GoExtension("facade_b", ["example.com/m/shared"]),
+        ]
+
+    def tearDown(self) -> None:
+        for name in ("gobundle_test", "facade_a", "facade_b"):
+            for module in list(sys.modules):
+                if module == name or module.startswith(name + "."):
+                    del sys.modules[module]
+        self.tmp.cleanup()
+
+    def fake_build_go(self, ext: extension.GoExtension) -> None:
+        output = Path(self.tmp.name, ext.original_name)
+        output.mkdir(parents=True)
+        (output / "__init__.py").write_text("")
+        for module in ("go", "hello", "shared"):
+            (output / f"{module}.py").write_text(f"NAME = {module!r}\n")
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.package_names")
+    @mock.patch("go_extension.build_ext.build_ext.build_go")
+    def test_bundle(self, build_go_mock: mock.Mock, package_names_mock: mock.Mock) -> None:
+        build_go_mock.side_effect = self.fake_build_go
+        package_names_mock.side_effect = lambda packages: {pkg: pkg.rsplit("/", 1)[-1] for pkg in packages}
+        self.command.build_extensions()
+        build_go_mock.assert_called_once()
+        bundle = build_go_mock.call_args.args[0]
+        self.assertEqual(bundle.original_name, "gobundle_test")
+        self.assertListEqual(bundle.packages, ["example.com/m/hello", "example.com/m/shared"])
+        sys.path.insert(0, self.tmp.name)
+        try:
+            import facade_a.hello
+            import facade_b
+            import gobundle_test.shared
+        finally:
+            sys.path.remove(self.tmp.name)
+        self.assertEqual(facade_a.hello.NAME, "hello")
+        self.assertIs(facade_b.shared, gobundle_test.shared)
+        self.assertFalse(hasattr(facade_b, "hello"))
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.package_names")
+    def test_get_outputs(self, package_names_mock: mock.Mock) -> None:
+        package_names_mock.side_effect = lambda packages: {pkg: pkg.rsplit("/", 1)[-1] for pkg in packages}
+        outputs = [os.path.relpath(path, self.tmp.name) for path in self.command.get_outputs()]
+        self.assertListEqual(
+            outputs,
+            [
+                os.path.relpath(self.command.get_ext_fullpath("gobundle_test._go"), self.tmp.name),
+                os.path.join("facade_a", "__init__.py"),
+                os.path.join("facade_a", "go.py"),
+                os.path.join("facade_a", "hello.py"),
+                os.path.join("facade_a", "shared.py"),
+                os.path.join("facade_b", "__init__.py"),
+                os.path.join("facade_b", "go.py"),
+                os.path.join("facade_b", "shared.py"),
+            ],
+        )
+
+
+@skipIf(sys.platform == "win32", "resource is not available on Windows")
+class Testbuild_ext_lazy(TestCase):
+    # A stand-in for a gopy wrapper module, whose import starts the Go runtime and allocates its heap.
+    heavy_module = "import sys\nHEAP = b'x' * (64 << 20)\nsys.go_runtime_started = True\nNAME = 'hello'\n"
+    heavy_rss = 64 << 20
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.command = build_ext.build_ext(dist.Distribution())
+        self.command.build_lib = self.tmp.name
+        self.command.gopy_compiler.build_cache = None
+        self.ext = extension.GoExtension("lazy_go", ["example.com/m/hello"], lazy=True)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def fake_build(self, ext: extension.GoExtension, output: Path) -> None:
+        output.mkdir(parents=True, exist_ok=True)
+        (output / "__init__.py").write_text("from . import hello\n")
+        (output / "build.py").write_text("raise RuntimeError\n")
+        (output / "go.py").write_text("NAME = 'go'\n")
+        (output / "hello.py").write_text(self.heavy_module)
+
+    def import_stats(self, statement: str) -> tuple[int, bool]:
+        """Return the growth of the peak RSS in bytes by `statement` in a new interpreter, and if Go started."""
+        code = (
+            "import resource, sys\n"
+            "before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+            f"{statement}\n"
+            "after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+            "print(after - before, hasattr(sys, 'go_runtime_started'))\n"
+        )
+        # Linux carries the peak RSS of a process over fork and exec, so the statement runs in a process
+        # started by a small interpreter instead of this test runner.
+        launcher = "import subprocess, sys; subprocess.run([sys.executable, '-c', sys.argv[1]], check=True)"
+        proc = subprocess.run(
+            [sys.executable, "-c", launcher, code], cwd=self.tmp.name, stdout=subprocess.PIPE, text=True
+        )
+        growth, started = proc.stdout.split()
+        # `ru_maxrss` is in bytes on macOS and in kilobytes elsewhere.
+        return int(growth) * (1 if sys.platform == "darwin" else 1024), started == "True"
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build")
+    def test_lazy(self, build_mock: mock.Mock) -> None:
+        build_mock.side_effect = self.fake_build
+        self.command.build_go(self.ext)
+        lazy_rss, lazy_started = self.import_stats("import lazy_go\nfrom lazy_go import hello")
+        eager_rss, eager_started = self.import_stats("import lazy_go.hello")
+        self.assertLess(lazy_rss, self.heavy_rss // 2)
+        self.assertFalse(lazy_started)
+        self.assertGreater(eager_rss, self.heavy_rss // 2)
+        self.assertTrue(eager_started)
+        code = "import lazy_go; assert 'hello' in dir(lazy_go); print(lazy_go.hello.NAME, lazy_go.go.NAME)"
+        proc = subprocess.run([sys.executable, "-c", code], cwd=self.tmp.name, stdout=subprocess.PIPE, text=True)
+        self.assertEqual(proc.stdout.split(), ["hello", "go"])
+
+
+class Testbuild_ext_runtime(TestCase):
+    go_source = (
+        'package main\n\nimport "C"\nimport (\n    "runtime"\n    "runtime/debug"\n)\n'
+        "\n//export GetMaxProcs\nfunc GetMaxProcs() C.longlong { return C.longlong(runtime.GOMAXPROCS(0)) }\n"
+        "\n//export GetMemoryLimit\nfunc GetMemoryLimit() C.longlong { return C.longlong(debug.SetMemoryLimit(-1)) }\n"
+        "\nfunc main() {}\n"
+    )
+    # A stand-in for the extension module built by gopy, whose import starts the Go runtime.
+    go_module = (
+        "import ctypes\n"
+        "__file__ = {library!r}\n"
+        "_library = ctypes.CDLL(__file__)\n"
+        "_library.GetMemoryLimit.restype = ctypes.c_longlong\n"
+        "def max_procs():\n    return _library.GetMaxProcs()\n"
+        "def memory_limit():\n    return _library.GetMemoryLimit()\n"
+    )
+    tempdir: str
+    library: Path
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.tempdir = tempfile.mkdtemp()
+        Path(cls.tempdir, "go.mod").write_text("module example.com/runtime\n\ngo 1.19\n")
+        Path(cls.tempdir, "main.go").write_text(cls.go_source)
+        Path(cls.tempdir, "runtime.go").write_text(
+            'package main\n\nimport "C"\nimport (\n    "runtime"\n    "runtime/debug"\n)\n'
+            + "\n"
+            + templates.render("runtime.go.in", marker="test")
+        )
+        cls.library = Path(cls.tempdir, "_go.so")
+        subprocess.run(
+            ["go", "build", "-buildmode=c-shared", "-o", cls.library.name, "."], cwd=cls.tempdir, check=True
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree(cls.tempdir)
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.command = build_ext.build_ext(dist.Distribution())
+        self.command.build_lib = self.tmp.name
+        self.command.gopy_compiler.build_cache = None
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def fake_build(self, ext: extension.GoExtension, output: Path) -> None:
+        output.mkdir(parents=True, exist_ok=True)
+        (output / "__init__.py").write_text("from . import hello\n")
+        (output / "_go.py").write_text(self.go_module.format(library=str(self.library)))
+        (output / "hello.py").write_text("from . import _go\ndef max_procs():\n    return _go.max_procs()\n")
+
+    def run_python(self, code: str, **env: str) -> list[str]:
+        proc = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=self.tmp.name,
+            env=dict(os.environ, **env),
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True,
+        )
+        return proc.stdout.split()
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build")
+    def test_eager(self, build_mock: mock.Mock) -> None:
+        build_mock.side_effect = self.fake_build
+        ext = extension.GoExtension(
+            "rt_go", ["example.com/m/hello"], go_runtime={"GOMAXPROCS": 3, "GOMEMLIMIT": "64MiB"}
+        )
+        self.command.build_go(ext)
+        self.command.build_go(ext)  # The runtime settings are prefixed to __init__.py once.
+        code = (
+            "import os, rt_go\n"
+            "from rt_go import _go, hello\n"
+            "print(rt_go.started(), _go.max_procs(), _go.memory_limit(), 'GOMAXPROCS' in os.environ)\n"
+            "print(rt_go.configure(GOMAXPROCS=2)['GOMAXPROCS'], hello.max_procs())\n"
+            "pid = os.fork()\n"
+            "if pid == 0:\n"
+            "    try:\n"
+            "        hello.max_procs()\n"
+            "    except rt_go.ForkedRuntimeError:\n"
+            "        os._exit(7)\n"
+            "    os._exit(0)\n"
+            "print(os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]))\n"
+        )
+        self.assertEqual(self.run_python(code), ["True", "3", str(64 << 20), "False", "3", "2", "7"])
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build")
+    def test_lazy(self, build_mock: mock.Mock) -> None:
+        build_mock.side_effect = self.fake_build
+        ext = extension.GoExtension("rt_go", ["example.com/m/hello"], lazy=True, go_runtime={"GOMAXPROCS": 3})
+        self.command.build_go(ext)
+        code = (
+            "import os, sys, rt_go\n"
+            "print(rt_go.started(), 'rt_go._go' in sys.modules, rt_go.configure(GOGC='off'))\n"
+            "pid = os.fork()\n"
+            "if pid == 0:\n"
+            "    os._exit(rt_go.hello.max_procs())\n"
+            "print(os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]), rt_go.started())\n"
+        )
+        self.assertEqual(self.run_python(code, GOMAXPROCS="5"), ["False", "False", "{}", "5", "False"])
+
+    def test_invalid_settings(self) -> None:
+        with self.assertRaises(ValueError):
+            extension.GoExtension("rt_go", ["example.com/m/hello"], go_runtime={"GODEBUG": "madvdontneed=1"})
+
+
+class Testbuild_ext_metrics(TestCase):
+    go_source = (
+        'package main\n\nimport "C"\n'
+        "\n//export Sum\nfunc Sum(n C.longlong) C.longlong {\n"
+        "    var s C.longlong\n    for i := C.longlong(0); i < n; i++ {\n        s += i\n    }\n    return s\n}\n"
+        "\nfunc main() {}\n"
+    )
+    # A stand-in for the extension module built by gopy, whose import starts the Go runtime.
+    go_module = (
+        "import ctypes\n"
+        "__file__ = {library!r}\n"
+        "_library = ctypes.CDLL(__file__)\n"
+        "_library.Sum.restype = ctypes.c_longlong\n"
+        "def hello_Sum(n):\n    return _library.Sum(n)\n"
+        "def DecRef(handle):\n    pass\n"
+    )
+    tempdir: str
+    library: Path
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.tempdir = tempfile.mkdtemp()
+        Path(cls.tempdir, "go.mod").write_text("module example.com/metrics\n\ngo 1.19\n")
+        Path(cls.tempdir, "main.go").write_text(cls.go_source)
+        Path(cls.tempdir, "runtime.go").write_text(
+            'package main\n\nimport "C"\nimport (\n    "runtime"\n    "runtime/debug"\n)\n'
+            + "\n"
+            + templates.render("runtime.go.in", marker="test")
+        )
+        Path(cls.tempdir, "profiling.go").write_text(
+            'package main\n\n// #include <stdlib.h>\nimport "C"\nimport (\n    "os"\n    "runtime"\n'
+            '    "runtime/pprof"\n    "sync"\n    "unsafe"\n)\n'
+            + "\n"
+            + templates.render("profiling.go.in", marker="test")
+        )
+        cls.library = Path(cls.tempdir, "_go.so")
+        subprocess.run(
+            ["go", "build", "-buildmode=c-shared", "-o", cls.library.name, "."], cwd=cls.tempdir, check=True
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree(cls.tempdir)
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.command = build_ext.build_ext(dist.Distribution())
+        self.command.build_lib = self.tmp.name
+        self.command.gopy_compiler.build_cache = None
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def fake_build(self, ext: extension.GoExtension, output: Path) -> None:
+        output.mkdir(parents=True, exist_ok=True)
+        (output / "__init__.py").write_text("from . import hello\n")
+        (output / "_go.py").write_text(self.go_module.format(library=str(self.library)))
+        (output / "hello.py").write_text("from . import _go\ndef Sum(n):\n    return _go.hello_Sum(n)\n")
+
+    def run_python(self, code: str) -> list[str]:
+        proc = subprocess.run(
+            [sys.executable, "-c", code], cwd=self.tmp.name, stdout=subprocess.PIPE, text=True, check=True
+        )
+        return proc.stdout.split()
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build")
+    def test_eager(self, build_mock: mock.Mock) -> None:
+        build_mock.side_effect = self.fake_build
+        ext = extension.GoExtension("m_go", ["example.com/m/hello"], instrument=True)
+        self.command.build_go(ext)
+        self.command.build_go(ext)  # The metrics are suffixed to __init__.py once.
+        code = (
+            "import os, m_go\n"
+            "from m_go import hello\n"
+            "for _ in range(3):\n"
+            "    hello.Sum(1000)\n"
+            "    hello._go.DecRef(0)\n"
+            "result = m_go.metrics()\n"
+            "print(sorted(result['functions']))\n"
+            "sum_ = result['functions']['hello_Sum']\n"
+            "print(sum_['calls'], sum(sum_['histogram'].values()), sum_['total_seconds'] >= sum_['max_seconds'] > 0)\n"
+            "print(result['heap']['heap_sys'] > 0, result['heap']['num_gc'] >= 0)\n"
+            "with m_go.cpu_profile('cpu.pprof'):\n"
+            "    hello.Sum(10 ** 6)\n"
+            "m_go.write_heap_profile('heap.pprof')\n"
+            "print(os.path.getsize('cpu.pprof') > 0, os.path.getsize('heap.pprof') > 0)\n"
+            "try:\n"
+            "    m_go.stop_cpu_profile()\n"
+            "except OSError as err:\n"
+            "    print(type(err).__name__)\n"
+            "m_go.reset_metrics()\n"
+            "print(m_go.metrics()['functions'])\n"
+        )
+        self.assertEqual(
+            self.run_python(code), ["['hello_Sum']", "3", "3", "True", "True", "True", "True", "True", "OSError", "{}"]
+        )
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build")
+    def test_lazy(self, build_mock: mock.Mock) -> None:
+        build_mock.side_effect = self.fake_build
+        ext = extension.GoExtension("m_go", ["example.com/m/hello"], lazy=True, go_runtime={}, instrument=True)
+        self.command.build_go(ext)
+        code = (
+            "import sys, m_go\n"
+            "print(m_go.metrics()['heap'], 'm_go._go' in sys.modules)\n"
+            "print(m_go.hello.Sum(10), list(m_go.metrics()['functions']), m_go.started())\n"
+        )
+        self.assertEqual(self.run_python(code), ["None", "False", "45", "['hello_Sum']", "True"])
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build")
+    def test_disabled(self, build_mock: mock.Mock) -> None:
+        build_mock.side_effect = self.fake_build
+        ext = extension.GoExtension("m_go", ["example.com/m/hello"])
+        self.command.build_go(ext)
+        output = Path(self.tmp.name, "m_go")
+        self.assertFalse((output / "_metrics.py").exists())
+        self.assertEqual((output / "__init__.py").read_text(), "from . import hello\n")
+
+
+class Testbuild_ext_handle_registry(TestCase):
+    go_source = """package main
+
+// #include <stdlib.h>
+import "C"
+import (
+    "encoding/json"
+    "fmt"
+    "reflect"
+    "sync"
+    "unsafe"
+
+    "example.com/handles/gopyh"
+)
+
+type Point struct{ X int }
+
+func ptrFromHandle_Point(h C.longlong) *Point {
+    return gopyh.VarFromHandle(gopyh.CGoHandle(h), "main.Point").(*Point)
+}
+
+//export NewPoint
+func NewPoint(x C.longlong) C.longlong {
+    return C.longlong(gopyh.Register("main.Point", &Point{X: int(x)}))
+}
+
+//export PointX
+func PointX(h C.longlong) C.longlong {
+    if _, err := gopyh.VarFromHandleTry(gopyh.CGoHandle(h), "main.Point"); err != nil {
+        return -1
+    }
+    return C.longlong(ptrFromHandle_Point(h).X)
+}
+
+//export DecRef
+func DecRef(h C.longlong) { gopyh.DecRef(gopyh.CGoHandle(h)) }
+
+//export IncRef
+func IncRef(h C.longlong) { gopyh.IncRef(gopyh.CGoHandle(h)) }
+
+//export NumHandles
+func NumHandles() C.longlong { return C.longlong(gopyh.NumHandles()) }
+
+func main() {}
+"""
+    # Stand-ins for the extension module and the Python modules built by gopy.
+    go_module = (
+        "import ctypes\n"
+        "__file__ = {library!r}\n"
+        "_library = ctypes.CDLL(__file__)\n"
+        "for _name in ('NewPoint', 'PointX', 'NumHandles'):\n"
+        "    getattr(_library, _name).restype = ctypes.c_longlong\n"
+        "NewPoint, PointX, NumHandles = _library.NewPoint, _library.PointX, _library.NumHandles\n"
+        "def DecRef(handle):\n    _library.DecRef(ctypes.c_longlong(handle))\n"
+    )
+    hello_module = (
+        "from . import _go, go\n"
+        "class Point(go.GoClass):\n"
+        "    def __init__(self, x):\n        self.handle = _go.NewPoint(x)\n"
+        "    def __del__(self):\n        _go.DecRef(self.handle)\n"
+        "    @property\n    def X(self):\n        return _go.PointX(ctypes.c_longlong(self.handle))\n"
+    )
+    tempdir: str
+    library: Path
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.tempdir = tempfile.mkdtemp()
+        Path(cls.tempdir, "go.mod").write_text("module example.com/handles\n\ngo 1.19\n")
+        Path(cls.tempdir, "gopyh").mkdir()
+        # Only the handle type of gopyh is left after its registry is replaced.
+        Path(cls.tempdir, "gopyh", "gopyh.go").write_text("package gopyh\n\ntype CGoHandle int64\n")
+        Path(cls.tempdir, "main.go").write_text(cls.go_source)
+        bindings.replace_handle_registry(cls.tempdir, "main")
+        cls.library = Path(cls.tempdir, "_go.so")
+        subprocess.run(
+            ["go", "build", "-buildmode=c-shared", "-o", cls.library.name, "."], cwd=cls.tempdir, check=True
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree(cls.tempdir)
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.command = build_ext.build_ext(dist.Distribution())
+        self.command.build_lib = self.tmp.name
+        self.command.gopy_compiler.build_cache = None
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def fake_build(self, ext: extension.GoExtension, output: Path) -> None:
+        output.mkdir(parents=True, exist_ok=True)
+        (output / "__init__.py").write_text("from . import hello\n")
+        (output / "_go.py").write_text(self.go_module.format(library=str(self.library)))
+        (output / "go.py").write_text("class GoClass:\n    pass\n")
+        (output / "hello.py").write_text("import ctypes\n" + self.hello_module)
+
+    def run_python(self, code: str) -> list[str]:
+        proc = subprocess.run(
+            [sys.executable, "-c", code], cwd=self.tmp.name, stdout=subprocess.PIPE, text=True, check=True
+        )
+        return proc.stdout.split()
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build")
+    def test_eager(self, build_mock: mock.Mock) -> None:
+        build_mock.side_effect = self.fake_build
+        ext = extension.GoExtension("h_go", ["example.com/m/hello"], handle_registry=True)
+        self.command.build_go(ext)
+        self.command.build_go(ext)  # The handle registry is suffixed to __init__.py once.
+        code = (
+            "import h_go\n"
+            "from h_go import _go, hello\n"
+            "points = [hello.Point(i) for i in range(10)]\n"
+            "stale = points[0].handle\n"
+            "del points\n"
+            "point = hello.Point(7)\n"
+            "with hello.Point(3) as other:\n"
+            "    print(other.X)\n"
+            "print(other.X, other.handle, _go.PointX(stale), point.X)\n"
+            "stats = h_go.handle_stats()\n"
+            "print(stats['live'], stats['peak'], stats['allocations'], stats['releases'], stats['capacity'])\n"
+            "print(stats['types'] == {'main.Point': {'live': 1, 'peak': 10, 'allocations': 12}})\n"
+            "print(stats['allocation_rate'] > 0, h_go.handle_stats()['allocation_rate'])\n"
+            "h_go.release(point)\n"
+            "h_go.reset_handle_peak()\n"
+            "print(_go.NumHandles(), h_go.handle_stats()['peak'])\n"
+        )
+        self.assertEqual(
+            self.run_python(code),
+            ["3", "-1", "0", "-1", "7", "1", "10", "12", "11", "10", "True", "True", "0.0", "0", "0"],
+        )
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build")
+    def test_lazy(self, build_mock: mock.Mock) -> None:
+        build_mock.side_effect = self.fake_build
+        ext = extension.GoExtension("h_go", ["example.com/m/hello"], lazy=True, instrument=True, handle_registry=True)
+        self.command.build_go(ext)
+        code = (
+            "import sys, h_go\n"
+            "print('h_go._go' in sys.modules)\n"
+            "with h_go.hello.Point(2) as point:\n"
+            "    print(point.X, h_go.handle_stats()['live'])\n"
+            "print(h_go.handle_stats()['live'])\n"
+        )
+        self.assertEqual(self.run_python(code), ["False", "2", "1", "0"])
+
+
+class Testbuild_ext_build_go_targets(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.command = build_ext.build_ext(dist.Distribution())
+        self.command.go_targets = "linux/amd64\nlinux/arm64 CC=aarch64-linux-gnu-gcc PYTHON=/opt/arm64/bin/python3"
+        self.command.go_targets_dir = self.tmp.name
+        self.exts = [extension.GoExtension("pkg.a_go", ["example.com/a"])]
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.build", autospec=True)
+    def test_targets(self, build_mock: mock.Mock) -> None:
+        self.command.build_go_targets(self.exts)
+        builds = {
+            str(call.args[2]): (call.args[0].env["GOARCH"], call.args[0].env.get("CC"), call.args[0].python)
+            for call in build_mock.call_args_list
+        }
+        self.assertEqual(
+            builds,
+            {
+                os.path.join(self.tmp.name, "linux-amd64", "pkg", "a_go"): (
+                    "amd64",
+                    self.command.gopy_compiler.env.get("CC"),
+                    sys.executable,
+                ),
+                os.path.join(self.tmp.name, "linux-arm64", "pkg", "a_go"): (
+                    "arm64",
+                    "aarch64-linux-gnu-gcc",
+                    "/opt/arm64/bin/python3",
+                ),
+            },
+        )
+        self.assertNotIn("GOARCH", self.command.gopy_compiler.env)
+
+    def test_invalid(self) -> None:
+        self.command.go_targets = "linux"
+        with self.assertRaises(errors.DistutilsOptionError):
+            self.command.build_go_targets(self.exts)
+
+
+class Testbuild_ext_sizes(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.command = build_ext.build_ext(dist.Distribution())
+        self.command.build_lib = self.tmp.name
+        self.command.build_temp = None
+        self.command.go_size_report = os.path.join(self.tmp.name, "sizes.json")
+        self.command.go_debug_info = "split"
+        self.command.go_debug_dir = os.path.join(self.tmp.name, "debug")
+        self.ext = extension.GoExtension("pkg.a_go", ["example.com/a"])
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def build(self, gopy_compiler: compiler.GoPyCompiler, ext: extension.GoExtension, output: Path) -> None:
+        output.mkdir(parents=True, exist_ok=True)
+        (output / "_a_go.so").write_bytes(b"x" * 100)
+
+    @mock.patch("go_extension.sizes.strip_debug_info")
+    @mock.patch("go_extension.sizes.analyze")
+    def test_build_go(self, analyze_mock: mock.Mock, strip_mock: mock.Mock) -> None:
+        analyze_mock.side_effect = lambda path, *args, **kwargs: {
+            "path": str(path),
+            "size": 100,
+            "debug_size": 0,
+            "packages": [],
+        }
+        with mock.patch("go_extension.compiler.GoPyCompiler.build", autospec=True, side_effect=self.build):
+            self.command.build_go(self.ext)
+        artifact = Path(self.tmp.name, "pkg", "a_go", "_a_go.so")
+        # Debug information is stripped before the shared library is moved into the output directory.
+        strip_mock.assert_called_once_with(
+            Path(self.tmp.name, "pkg", ".a_go.go-staging", "_a_go.so"),
+            "split",
+            Path(self.tmp.name, "debug", "_a_go.so.debug"),
+            command_runner=mock.ANY,
+        )
+        self.assertEqual(analyze_mock.call_args.args[0], artifact)
+        self.command._size_budget = 50
+        with self.assertRaises(errors.DistutilsError):
+            self.command.check_sizes()
+        with open(os.path.join(self.tmp.name, "sizes.json")) as f:
+            report = json.load(f)
+        self.assertEqual(report["over_budget"], [str(artifact)])
+        self.assertEqual(report["artifacts"][0]["extension"], "pkg.a_go")
+        self.assertEqual(report["artifacts"][0]["unstripped_size"], 100)
+
+    @mock.patch.object(build_ext.build_ext.__bases__[0], "run")
+    def test_invalid_options(self, run_mock: mock.Mock) -> None:
+        self.command.go_debug_info = "compress"
+        with self.assertRaises(errors.DistutilsOptionError):
+            self.command.run()
+        self.command.go_debug_info = None
+        self.command.go_size_budget = "large"
+        with self.assertRaises(errors.DistutilsOptionError):
+            self.command.run()
+        run_mock.assert_not_called()
+
+
+class Test_link_tree(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = Path(self.tmp.name, "src")
+        self.dst = Path(self.tmp.name, "dst")
+        (self.src / "sub").mkdir(parents=True)
+        (self.src / "sub" / "go.py").write_text("wrapper")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_hardlink(self) -> None:
+        (self.src / "user.py").write_text("copied by build_py")
+        build_ext._link_tree(self.src, self.dst, ["sub/go.py"])
+        self.assertTrue(os.path.samefile(self.src / "sub" / "go.py", self.dst / "sub" / "go.py"))
+        self.assertFalse((self.dst / "user.py").exists())
+
+    def test_same_content(self) -> None:
+        (self.dst / "sub").mkdir(parents=True)
+        (self.dst / "sub" / "go.py").write_text("wrapper")
+        os.utime(self.dst / "sub" / "go.py", (0, 0))
+        build_ext._link_tree(self.src, self.dst, ["sub/go.py"])
+        self.assertFalse(os.path.samefile(self.src / "sub" / "go.py", self.dst / "sub" / "go.py"))
+        self.assertEqual((self.dst / "sub" / "go.py").stat().st_mtime, 0)
+
+    @mock.patch("go_extension.build_ext._reflink", return_value=False)
+    @mock.patch("go_extension.build_ext.os.link", side_effect=OSError)
+    def test_copy_fallback(self, link_mock: mock.Mock, reflink_mock: mock.Mock) -> None:
+        (self.dst / "sub").mkdir(parents=True)
+        (self.dst / "sub" / "go.py").write_text("stale")
+        build_ext._link_tree(self.src, self.dst, ["sub/go.py"])
+        self.assertFalse(os.path.samefile(self.src / "sub" / "go.py", self.dst / "sub" / "go.py"))
+        self.assertEqual((self.dst / "sub" / "go.py").read_text(), "wrapper")
+
+
 def load_tests(loader, tests, _):  # type: ignore
     tests.addTests(doctest.DocTestSuite(build_ext))
     return tests
@@ -0,0 +1,70 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase
+import doctest
+import tempfile
+from pathlib import Path
+
+from go_extension import buildlog
+
+
+class TestBuildLog(TestCase):
+    def test_tail(self) -> None:
+        build_log = buildlog.BuildLog(tail_size=20)
+        build_log.command(["seq", "1000"])
+        for i in range(1, 1001):
+            build_log.write(f"{i}\n")
+        self.assertEqual(build_log.tail(), "997\n998\n999\n1000\n")
+        self.assertLessEqual(len(build_log._tail), 20)
+        self.assertEqual(build_log.lines, 1000)
+        self.assertEqual(build_log.commands, 1)
+
+    def test_spool(self) -> None:
+        build_log = buildlog.BuildLog(spool_size=100)
+        build_log.write("x" * 50 + "\n")
+        self.assertFalse(build_log._file._rolled)  # type: ignore
+        build_log.write("x" * 100 + "\n")
+        self.assertTrue(build_log._file._rolled)  # type: ignore
+        self.assertEqual(build_log.getvalue(), "x" * 50 + "\n" + "x" * 100 + "\n")
+
+    def test_command_after_partial_line(self) -> None:
+        build_log = buildlog.BuildLog()
+        build_log.write("no newline")
+        build_log.command(["go", "build"])
+        self.assertEqual(build_log.getvalue(), "no newline\ngo build\n")
+
+    def test_extend(self) -> None:
+        build_log, other = buildlog.BuildLog(), buildlog.BuildLog(spool_size=10)
+        build_log.command(["go", "install"])
+        other.command(["gopy", "build"])
+        other.write("é" * 100 + "\n")
+        build_log.extend(other)
+        self.assertEqual(build_log.getvalue(), "go install\ngopy build\n" + "é" * 100 + "\n")
+        self.assertEqual(build_log.commands, 2)
+        self.assertEqual(build_log.size, 201)
+        self.assertFalse(other)
+
+    def test_save(self) -> None:
+        build_log = buildlog.BuildLog()
+        build_log.write("error\n")
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = build_log.save(Path(tempdir, "logs", "hello.log"))
+            self.assertEqual(path.read_text(), "error\n")
+        path = build_log.save()
+        try:
+            self.assertEqual(path.read_text(), "error\n")
+        finally:
+            path.unlink()
+
+    def test_close(self) -> None:
+        build_log = buildlog.BuildLog()
+        build_log.write("output\n")
+        self.assertTrue(build_log)
+        build_log.close()
+        self.assertFalse(build_log)
+        self.assertEqual(build_log.getvalue(), "")
+        self.assertEqual(build_log.tail(), "")
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(buildlog))
+    return tests
@@ -0,0 +1,138 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase, mock
+from pathlib import Path
+import doctest
+import os
+import tempfile
+from setuptools._distutils import errors
+
+from go_extension import cache
+
+
+class TestBuildCache_from_env(TestCase):
+    def test_default(self) -> None:
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": "/tmp/xdg"}):
+            os.environ.pop(cache.CACHE_DIR_ENV, None)
+            os.environ.pop(cache.CACHE_MAX_SIZE_ENV, None)
+            build_cache = cache.BuildCache.from_env()
+        assert build_cache is not None
+        self.assertEqual(build_cache.root, Path("/tmp/xdg/go-extension/builds"))
+        self.assertEqual(build_cache.max_size, cache.DEFAULT_MAX_SIZE)
+
+    def test_configured(self) -> None:
+        env = {cache.CACHE_DIR_ENV: "/tmp/ci-cache", cache.CACHE_MAX_SIZE_ENV: "1024"}
+        with mock.patch.dict(os.environ, env):
+            build_cache = cache.BuildCache.from_env()
+        assert build_cache is not None
+        self.assertEqual(build_cache.root, Path("/tmp/ci-cache/builds"))
+        self.assertEqual(build_cache.max_size, 1024)
+
+    def test_invalid_max_size(self) -> None:
+        with mock.patch.dict(os.environ, {cache.CACHE_MAX_SIZE_ENV: "1G"}):
+            with self.assertRaisesRegex(errors.DistutilsOptionError, cache.CACHE_MAX_SIZE_ENV):
+                cache.BuildCache.from_env()
+
+    def test_disabled(self) -> None:
+        with mock.patch.dict(os.environ, {cache.CACHE_DIR_ENV: ""}):
+            self.assertIsNone(cache.BuildCache.from_env())
+        with mock.patch.dict(os.environ, {cache.CACHE_MAX_SIZE_ENV: "0"}):
+            self.assertIsNone(cache.BuildCache.from_env())
+
+
+class TestBuildCache(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.cache = cache.BuildCache(self.root / "cache")
+        self.output = self.root / "output"
+        self.output.mkdir()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_key(self) -> None:
+        self.assertEqual(self.cache.key([b"a", b"b"]), self.cache.key([b"a", b"b"]))
+        self.assertNotEqual(self.cache.key([b"ab"]), self.cache.key([b"a", b"b"]))
+
+    def test_store_and_restore(self) -> None:
+        (self.output / "_go.so").write_bytes(b"so")
+        (self.output / "sub").mkdir()
+        (self.output / "sub" / "go.py").write_text("wrapper")
+        self.cache.store("key", self.output, ["_go.so", "sub/go.py"])
+        restored = self.root / "restored"
+        self.assertTrue(self.cache.restore("key", restored))
+        self.assertEqual((restored / "_go.so").read_bytes(), b"so")
+        self.assertEqual((restored / "sub" / "go.py").read_text(), "wrapper")
+        self.assertFalse(self.cache.restore("missing", restored))
+
+    def test_restore_replaces(self) -> None:
+        (self.output / "_go.so").write_bytes(b"so")
+        self.cache.store("key", self.output, ["_go.so"])
+        loaded = self.root / "loaded"
+        loaded.mkdir()
+        os.link(self.output / "_go.so", loaded / "_go.so")
+        self.cache.restore("key", loaded)
+        # A library loaded from the old file, here another link of it, is not truncated.
+        self.assertFalse(os.path.samefile(loaded / "_go.so", self.output / "_go.so"))
+        self.assertEqual((self.output / "_go.so").read_bytes(), b"so")
+
+    def test_evict(self) -> None:
+        self.cache.max_size = 10
+        (self.output / "_go.so").write_bytes(b"x" * 6)
+        self.cache.store("old", self.output, ["_go.so"])
+        os.utime(self.cache.root / "old", (0, 0))
+        self.cache.store("new", self.output, ["_go.so"])
+        self.assertFalse((self.cache.root / "old").exists())
+        self.assertTrue((self.cache.root / "new").exists())
+
+
+class Test_changed_files(TestCase):
+    def test_changed_files(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, "unchanged.py").write_text("a")
+            Path(tmp, "modified.py").write_text("a")
+            before = cache.snapshot(tmp)
+            Path(tmp, "modified.py").write_text("ab")
+            Path(tmp, "created.py").write_text("a")
+            self.assertListEqual(cache.changed_files(tmp, before), ["created.py", "modified.py"])
+
+    def test_missing_directory(self) -> None:
+        self.assertDictEqual(cache.snapshot("/nonexistent/go_extension"), {})
+
+
+class Test_replace_changed(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.src = Path(self.tmp.name, "src")
+        self.dst = Path(self.tmp.name, "dst")
+        (self.src / "sub").mkdir(parents=True)
+        self.dst.mkdir()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_replace_changed(self) -> None:
+        (self.src / "same.py").write_text("same")
+        (self.dst / "same.py").write_text("same")
+        os.utime(self.dst / "same.py", ns=(0, 0))
+        (self.src / "changed.py").write_text("new")
+        (self.dst / "changed.py").write_text("old")
+        (self.src / "sub" / "created.py").write_text("created")
+        (self.dst / "kept.py").write_text("kept")
+        self.assertEqual(cache.replace_changed(self.src, self.dst), ["changed.py", "sub/created.py"])
+        self.assertEqual((self.dst / "same.py").stat().st_mtime_ns, 0)
+        self.assertEqual((self.dst / "changed.py").read_text(), "new")
+        self.assertEqual((self.dst / "sub" / "created.py").read_text(), "created")
+        self.assertTrue((self.dst / "kept.py").exists())
+
+    def test_relocate(self) -> None:
+        (self.src / "go.go").write_text(f"// gopy gen -output={self.src}\n")
+        (self.src / "_go.so").write_bytes(b"\0" + os.fsencode(self.src))
+        cache.relocate(self.src, self.src, self.dst)
+        self.assertEqual((self.src / "go.go").read_text(), f"// gopy gen -output={self.dst}\n")
+        self.assertEqual((self.src / "_go.so").read_bytes(), b"\0" + os.fsencode(self.src))
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(cache))
+    return tests
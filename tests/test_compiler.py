@@ -1,13 +1,24 @@
 # Copyright (c) 2021 Shuhei Nitta. All rights reserved.
 from unittest import TestCase, mock
+import asyncio
 import doctest
+import io
 import shutil
 import os
+import subprocess
+import tempfile
+from pathlib import Path
+from setuptools._distutils import errors
 
 from go_extension import (
+    buildlog,
+    cache,
     compiler,
     exceptions,
     extension,
+    profiling,
+    runner,
+    toolchain,
 )
 from tests import utils
 
@@ -40,6 +51,44 @@ class TestGopyCompiler___init__(TestCase):
         complr = compiler.GoPyCompiler(inplace=True)
         self.assertTrue(complr.inplace)
 
+    def test_workers(self) -> None:
+        assert compiler.GoPyCompiler.workers == 1
+        complr = compiler.GoPyCompiler(workers=8)
+        self.assertEqual(complr.workers, 8)
+        complr = compiler.GoPyCompiler(workers=0)
+        self.assertEqual(complr.workers, 1)
+
+    def test_go_caches(self) -> None:
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": "/tmp/xdg"}):
+            os.environ.pop("GOCACHE", None)
+            os.environ.pop("GOMODCACHE", None)
+            complr = compiler.GoPyCompiler()
+        self.assertEqual(complr.env["GOCACHE"], "/tmp/xdg/go-build")
+        self.assertNotIn("GOMODCACHE", complr.env)
+        with mock.patch.dict(os.environ, {"GOCACHE": "/tmp/gocache", "GOMODCACHE": "/tmp/gomodcache"}):
+            complr = compiler.GoPyCompiler()
+        self.assertEqual(complr.env["GOCACHE"], "/tmp/gocache")
+        self.assertEqual(complr.env["GOMODCACHE"], "/tmp/gomodcache")
+        complr = compiler.GoPyCompiler(gocache="/tmp/a", gomodcache="/tmp/b", goflags="-mod=mod")
+        self.assertEqual(complr.env["GOCACHE"], "/tmp/a")
+        self.assertEqual(complr.env["GOMODCACHE"], "/tmp/b")
+        self.assertEqual(complr.env["GOFLAGS"], "-mod=mod")
+
+    def test_offline(self) -> None:
+        complr = compiler.GoPyCompiler(offline=True, goflags="")
+        self.assertEqual(complr.env["GOPROXY"], "off")
+        self.assertEqual(complr.env["GOSUMDB"], "off")
+        self.assertEqual(complr.env["GOFLAGS"], "-mod=mod")
+        complr = compiler.GoPyCompiler(offline=True, goflags="-mod=readonly")
+        self.assertEqual(complr.env["GOFLAGS"], "-mod=readonly")
+
+    def test_goproxy(self) -> None:
+        with tempfile.TemporaryDirectory() as proxy:
+            complr = compiler.GoPyCompiler(offline=True, goproxy=proxy)
+            self.assertEqual(complr.env["GOPROXY"], Path(proxy).resolve().as_uri())
+        complr = compiler.GoPyCompiler(goproxy="https://proxy.example.com")
+        self.assertEqual(complr.env["GOPROXY"], "https://proxy.example.com")
+
     def test_env(self) -> None:
         assert compiler.GoPyCompiler.env.get("LD_LIBRATY_PATH", None) is None
         go_compiler = compiler.GoPyCompiler()
@@ -66,6 +115,35 @@ class TestGoPyCompiler_install_build_tools(TestCase):
         except Exception as err:
             self.fail(err)
 
+    def test_resolved_tools(
+        self,
+        gopy_is_installed_mock: mock.Mock,
+        goimports_is_installed_mock: mock.Mock,
+    ) -> None:
+        gopy_is_installed_mock.return_value = True
+        goimports_is_installed_mock.return_value = True
+        go_compiler = compiler.GoPyCompiler()
+        go_compiler.install_build_tools()
+        go = go_compiler.tools["go"]
+        self.assertTrue(os.path.isabs(go.path))
+        self.assertEqual(go_compiler._executable("go"), go.path)
+        # `go` is already found in PATH, which is not reordered.
+        self.assertEqual(go_compiler.env["PATH"], os.environ["PATH"])
+        go_compiler.install_build_tools()
+        self.assertEqual(go_compiler.env["PATH"], os.environ["PATH"])
+
+    @mock.patch("go_extension.toolchain.probe_go")
+    def test_go_too_old(
+        self,
+        probe_go_mock: mock.Mock,
+        gopy_is_installed_mock: mock.Mock,
+        goimports_is_installed_mock: mock.Mock,
+    ) -> None:
+        probe_go_mock.return_value = toolchain.Tool("go", "/usr/bin/go", "go1.15.2")
+        go_compiler = compiler.GoPyCompiler()
+        with self.assertRaises(exceptions.GoNotFoundError):
+            go_compiler.install_build_tools()
+
     def test_go_command_not_exist(
         self,
         gopy_is_installed_mock: mock.Mock,
@@ -100,6 +178,247 @@ class TestGoPyCompiler_install_build_tools(TestCase):
         goimports_is_installed_mock.assert_called_once()
 
 
+class Test_go_cache_entries(TestCase):
+    def test_go_cache_entries(self) -> None:
+        with tempfile.TemporaryDirectory() as gocache:
+            os.makedirs(os.path.join(gocache, "0a"))
+            for name in ("0a1b-a", "0a1b-d", "0a2c-a"):
+                open(os.path.join(gocache, "0a", name), "w").close()
+            self.assertEqual(compiler.go_cache_entries(gocache), 2)
+
+    def test_missing(self) -> None:
+        self.assertEqual(compiler.go_cache_entries("/nonexistent/gocache"), 0)
+
+    def test_count_go_cache(self) -> None:
+        complr = compiler.GoPyCompiler(gocache="/nonexistent/gocache")
+        with mock.patch("go_extension.compiler.go_cache_entries", return_value=3) as go_cache_entries_mock:
+            self.assertIsNone(complr.count_go_cache())
+            complr.verbose = True
+            self.assertEqual(complr.count_go_cache(), 3)
+        go_cache_entries_mock.assert_called_once_with("/nonexistent/gocache")
+
+
+class TestGoPyCompiler_clone(TestCase):
+    def test_clone(self) -> None:
+        complr = compiler.GoPyCompiler(workers=2)
+        complr.captured.write("output")
+        clone = complr.clone(capture_output=True)
+        self.assertIsNot(clone, complr)
+        self.assertTrue(clone.capture_output)
+        self.assertFalse(complr.capture_output)
+        self.assertEqual(clone.workers, 2)
+        self.assertIsNot(clone.captured, complr.captured)
+        self.assertFalse(clone.captured)
+
+
+class TestGoPyCompiler_spawn(TestCase):
+    def test_capture_output(self) -> None:
+        complr = compiler.GoPyCompiler(capture_output=True)
+        complr.spawn(["echo", "hello"])
+        self.assertEqual(complr.captured.getvalue(), "echo hello\nhello\n")
+
+    def test_capture_output_failure(self) -> None:
+        complr = compiler.GoPyCompiler(capture_output=True)
+        with self.assertRaises(errors.DistutilsExecError):
+            complr.spawn(["false"])
+
+    def test_capture_output_bounded(self) -> None:
+        complr = compiler.GoPyCompiler(capture_output=True)
+        complr.captured = buildlog.BuildLog(tail_size=100, spool_size=1000)
+        complr.spawn(["seq", "10000"])
+        self.assertEqual(complr.captured.lines, 10000)
+        self.assertEqual(complr.captured.tail().splitlines()[-1], "10000")
+        self.assertLessEqual(len(complr.captured.tail()), 100)
+        self.assertEqual(len(complr.captured.getvalue().splitlines()), 10001)
+
+    def test_timeout(self) -> None:
+        complr = compiler.GoPyCompiler(capture_output=True, timeout=0.2)
+        with self.assertRaises(exceptions.CommandTimeoutError):
+            complr.spawn(["sleep", "10"])
+
+    def test_spawn_async(self) -> None:
+        complr = compiler.GoPyCompiler(capture_output=True)
+
+        async def main() -> None:
+            await asyncio.gather(complr.spawn_async(["echo", "a"]), complr.spawn_async(["echo", "b"]))
+
+        asyncio.run(main())
+        self.assertCountEqual(complr.captured.getvalue().splitlines(), ["echo a", "a", "echo b", "b"])
+
+    def test_resolved_tool(self) -> None:
+        complr = compiler.GoPyCompiler(capture_output=True)
+        echo = shutil.which("echo")
+        assert echo is not None
+        complr.tools = {"gopy": toolchain.Tool("gopy", echo, "")}
+        complr.spawn(["gopy", "hello"])
+        self.assertListEqual(complr.captured.getvalue().splitlines(), ["gopy hello", "hello"])
+
+    def test_stream(self) -> None:
+        complr = compiler.GoPyCompiler()
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            complr.spawn(["echo", "hello"])
+        self.assertEqual(stdout.getvalue(), "hello\n")
+
+    def test_profile(self) -> None:
+        complr = compiler.GoPyCompiler(capture_output=True)
+        complr.profile = profiling.BuildProfile()
+        complr.spawn(["echo", "hello"])
+        self.assertListEqual([phase["name"] for phase in complr.profile.phases], ["echo hello"])
+
+    def test_capture_output_dry_run(self) -> None:
+        complr = compiler.GoPyCompiler(capture_output=True, dry_run=True)
+        complr.spawn(["false"])
+        self.assertEqual(complr.captured.getvalue(), "false\n")
+
+
+class TestGoPyCompiler_prewarm(TestCase):
+    go_module_name: str = "github.com/huisint/go-extension-python"
+    pkgs: list[str] = ["tests/go_src", "tests/go_src2"]
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory(dir=".")
+        self.compiler = compiler.GoPyCompiler(capture_output=True, offline=True, use_cache=False)
+        for pkg in self.pkgs:
+            utils.create_go_pkg(pkg)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+        for pkg in self.pkgs:
+            utils.clean_up_go_pkg(pkg)
+
+    def test_prewarm(self) -> None:
+        exts = [
+            extension.GoExtension("a_go", [f"{self.go_module_name}/{pkg}"], cgo_cflags=cflags)
+            for pkg in self.pkgs
+            for cflags in ([], ["-O3"])
+        ]
+        saved = self.compiler.prewarm(exts + exts[:1], self.tmp.name)
+        self.assertGreaterEqual(saved, 0.0)
+        mains = sorted(Path(self.tmp.name).glob("prewarm*/main.go"))
+        self.assertEqual(len(mains), 2)
+        for main in mains:
+            content = main.read_text()
+            self.assertIn('import "C"', content)
+            for pkg in self.pkgs:
+                self.assertIn(f'_ "{self.go_module_name}/{pkg}"', content)
+        builds = [
+            line for line in self.compiler.captured.getvalue().splitlines() if " build -buildmode=c-shared" in line
+        ]
+        self.assertEqual(len(builds), 2)
+        self.assertNotIn("mod download", self.compiler.captured.getvalue())
+
+    def test_failure(self) -> None:
+        ext = extension.GoExtension("a_go", [f"{self.go_module_name}/tests/missing"])
+        with mock.patch("go_extension.compiler.log.warn") as warn_mock:
+            self.assertEqual(self.compiler.prewarm([ext, ext], self.tmp.name), 0.0)
+        warn_mock.assert_called_once()
+
+    def test_dry_run(self) -> None:
+        self.compiler.dry_run = True
+        ext = extension.GoExtension("a_go", [f"{self.go_module_name}/tests/go_src"])
+        self.assertEqual(self.compiler.prewarm([ext, ext], self.tmp.name), 0.0)
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+
+class TestGoPyCompiler_resolve_dependencies(TestCase):
+    go_module_name: str = "github.com/huisint/go-extension-python"
+    pkgs: list[str] = ["tests/go_src", "tests/go_src2"]
+
+    def setUp(self) -> None:
+        self.compiler = compiler.GoPyCompiler()
+        for pkg in self.pkgs:
+            utils.create_go_pkg(pkg)
+        with open("tests/go_src/main.go", "a") as f:
+            f.write(f'\nimport _ "{self.go_module_name}/tests/go_src2"\n')
+
+    def tearDown(self) -> None:
+        for pkg in self.pkgs:
+            utils.clean_up_go_pkg(pkg)
+
+    def test_transitive(self) -> None:
+        files = self.compiler.resolve_dependencies([self.go_module_name + "/tests/go_src"])
+        self.assertIn(os.path.join("tests", "go_src", "main.go"), files)
+        self.assertIn(os.path.join("tests", "go_src2", "main.go"), files)
+        self.assertIn("go.mod", files)
+
+    def test_memoised(self) -> None:
+        packages = [self.go_module_name + "/" + pkg for pkg in self.pkgs]
+        with mock.patch("go_extension.compiler.subprocess.run", wraps=subprocess.run) as run_mock:
+            self.compiler.resolve_dependencies(packages[:1])
+            self.compiler.resolve_dependencies(packages[1:])
+            self.compiler.resolve_dependencies(packages)
+        run_mock.assert_called_once()
+
+    def test_failure(self) -> None:
+        with mock.patch("go_extension.compiler.subprocess.run", wraps=subprocess.run) as run_mock:
+            self.assertListEqual(self.compiler.resolve_dependencies(["example.com/pkg"]), [])
+            self.assertListEqual(self.compiler.resolve_dependencies(["example.com/pkg"]), [])
+            run_mock.assert_called_once()
+            self.compiler.forget_dependencies()
+            self.compiler.resolve_dependencies(["example.com/pkg"])
+        self.assertEqual(run_mock.call_count, 2)
+
+
+class TestGoPyCompiler_install_pinned_build_tools(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.dict(os.environ, {cache.CACHE_DIR_ENV: self.tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        toolchain.forget()
+        self.installs: list[tuple[list[str], dict[str, str]]] = []
+
+    def tearDown(self) -> None:
+        toolchain.forget()
+        self.tmp.cleanup()
+
+    def fake_spawn(self, complr: compiler.GoPyCompiler, cmd: list[str]) -> None:
+        self.installs.append((cmd, complr.env))
+        name = cmd[-1].split("@")[0].rsplit("/", 1)[-1]
+        os.makedirs(complr.env["GOBIN"], exist_ok=True)
+        executable = os.path.join(complr.env["GOBIN"], name)
+        with open(executable, "w") as f:
+            f.write("#!/bin/sh\n")
+        os.chmod(executable, 0o755)
+
+    def test_install_once(self) -> None:
+        with mock.patch.object(compiler.GoPyCompiler, "spawn", autospec=True, side_effect=self.fake_spawn):
+            complr = compiler.GoPyCompiler(offline=True, gopy_version="v0.4.10", goimports_version="v0.21.0")
+            complr.install_build_tools()
+            toolchain.forget()
+            compiler.GoPyCompiler(gopy_version="v0.4.10", goimports_version="v0.21.0").install_build_tools()
+        self.assertListEqual(
+            [cmd[-1] for cmd, _ in self.installs],
+            [compiler.GOPY_PACKAGE + "@v0.4.10", compiler.GOIMPORTS_PACKAGE + "@v0.21.0"],
+        )
+        gopy_cmd, gopy_env = self.installs[0]
+        self.assertTrue(gopy_env["GOBIN"].startswith(self.tmp.name))
+        self.assertIn("gopy@v0.4.10", gopy_env["GOBIN"])
+        self.assertNotIn("-mod=", gopy_env["GOFLAGS"])
+        self.assertEqual(complr.tools["gopy"].path, os.path.join(gopy_env["GOBIN"], "gopy"))
+        self.assertTrue(gopy_env["PATH"].startswith(gopy_env["GOBIN"] + os.pathsep))
+        self.assertTrue(gopy_env["PATH"].endswith(os.pathsep + os.environ["PATH"]))
+
+    def test_ignore_other_version_in_path(self) -> None:
+        other = os.path.join(self.tmp.name, "bin")
+        os.makedirs(other)
+        for name in ("gopy", "goimports"):
+            executable = os.path.join(other, name)
+            with open(executable, "w") as f:
+                f.write("#!/bin/sh\n")
+            os.chmod(executable, 0o755)
+        with mock.patch.dict(os.environ, {"PATH": other + os.pathsep + os.environ["PATH"]}):
+            with mock.patch.object(compiler.GoPyCompiler, "spawn", autospec=True, side_effect=self.fake_spawn):
+                complr = compiler.GoPyCompiler(gopy_version="v0.4.10", goimports_version="v0.21.0")
+                complr.install_build_tools()
+        self.assertEqual(len(self.installs), 2)
+        self.assertEqual(complr.tools["gopy"].path, os.path.join(self.installs[0][1]["GOBIN"], "gopy"))
+        # Only the directories of the pinned tools are prepended, so gopy runs the pinned goimports.
+        tool_dirs = [os.path.dirname(complr.tools[name].path) for name in ("goimports", "gopy")]
+        self.assertEqual(complr.env["PATH"].split(os.pathsep)[:3], tool_dirs + [other])
+        self.assertEqual(shutil.which("goimports", path=complr.env["PATH"]), complr.tools["goimports"].path)
+
+
 class TestGoPyCompiler_generate(TestCase):
     go_module_name: str = "github.com/huisint/go-extension-python"
 
@@ -136,6 +455,40 @@ class TestGoPyCompiler_generate(TestCase):
                 utils.clean_up_go_pkg(pkg)
 
 
+@mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+class TestGoPyCompiler_generate_incremental(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.compiler = compiler.GoPyCompiler(use_cache=False)
+        self.ext = extension.GoExtension("tests.go", ["example.com/hello"])
+        self.output = Path(self.tmp.name, "output")
+        self.api = "func Hello()"
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def fake_gopy_gen(self, cmd: list[str]) -> None:
+        output = Path(next(arg.split("=", 1)[1] for arg in cmd if arg.startswith("-output=")))
+        (output / "go.go").write_text(f"// gopy gen -output={output}\n{self.api}\n")
+        (output / "go.py").write_text("import _go\n")
+
+    def test_unchanged(self, install_build_tools_mock: mock.Mock) -> None:
+        with mock.patch.object(self.compiler, "spawn", side_effect=self.fake_gopy_gen):
+            self.assertEqual(self.compiler.generate(self.ext, self.output), ["go.go", "go.py"])
+            mtimes = {path.name: path.stat().st_mtime_ns for path in self.output.iterdir()}
+            self.assertEqual(self.compiler.generate(self.ext, self.output), [])
+        self.assertEqual({path.name: path.stat().st_mtime_ns for path in self.output.iterdir()}, mtimes)
+        self.assertEqual((self.output / "go.go").read_text(), f"// gopy gen -output={self.output}\nfunc Hello()\n")
+        self.assertEqual(os.listdir(self.tmp.name), ["output"])
+
+    def test_changed(self, install_build_tools_mock: mock.Mock) -> None:
+        with mock.patch.object(self.compiler, "spawn", side_effect=self.fake_gopy_gen):
+            self.compiler.generate(self.ext, self.output)
+            self.api = "func Hello(name string)"
+            self.assertEqual(self.compiler.generate(self.ext, self.output), ["go.go"])
+        self.assertIn("func Hello(name string)", (self.output / "go.go").read_text())
+
+
 class TestGoPyCompiler_build(TestCase):
     go_module_name: str = "github.com/huisint/go-extension-python"
 
@@ -172,6 +525,193 @@ class TestGoPyCompiler_build(TestCase):
                 utils.clean_up_go_pkg(pkg)
 
 
+@mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+class TestGoPyCompiler_build_cache(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.compiler = compiler.GoPyCompiler()
+        self.compiler.build_cache = cache.BuildCache(os.path.join(self.tmp.name, "cache"))
+        self.source = os.path.join(self.tmp.name, "main.go")
+        Path(self.source).write_text("package pkg\n")
+        self.ext = extension.GoExtension("tests.go", ["example.com/pkg"], [self.source], resolve_depends=False)
+        self.output = os.path.join(self.tmp.name, "output")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def fake_gopy(self, cmd: list[str]) -> None:
+        os.makedirs(self.output, exist_ok=True)
+        with open(os.path.join(self.output, "_go.so"), "w") as f:
+            f.write("so")
+
+    def test_hit(self, install_build_tools_mock: mock.Mock) -> None:
+        with mock.patch.object(self.compiler, "spawn", side_effect=self.fake_gopy) as spawn_mock:
+            self.compiler.build(self.ext, self.output)
+            shutil.rmtree(self.output)
+            self.compiler.build(self.ext, self.output)
+        spawn_mock.assert_called_once()
+        self.assertTrue(os.path.exists(os.path.join(self.output, "_go.so")))
+
+    def test_miss(self, install_build_tools_mock: mock.Mock) -> None:
+        other = extension.GoExtension("tests.go", ["example.com/other"], [self.source], resolve_depends=False)
+        with mock.patch.object(self.compiler, "spawn", side_effect=self.fake_gopy) as spawn_mock:
+            self.compiler.build(self.ext, self.output)
+            self.compiler.build(other, self.output)
+        self.assertEqual(spawn_mock.call_count, 2)
+
+    def test_source_changed(self, install_build_tools_mock: mock.Mock) -> None:
+        with mock.patch.object(self.compiler, "spawn", side_effect=self.fake_gopy) as spawn_mock:
+            self.compiler.build(self.ext, self.output)
+            Path(self.source).write_text("package pkg\n\nfunc Hello() {}\n")
+            self.compiler.build(self.ext, self.output)
+        self.assertEqual(spawn_mock.call_count, 2)
+
+    def test_no_sources(self, install_build_tools_mock: mock.Mock) -> None:
+        # `go list` fails for the package, so none of its files are known.
+        ext = extension.GoExtension("tests.go", ["example.com/pkg"])
+        with mock.patch.object(self.compiler, "spawn", side_effect=self.fake_gopy) as spawn_mock:
+            with mock.patch("go_extension.compiler.subprocess.run", wraps=subprocess.run) as run_mock:
+                self.compiler.build(ext, self.output)
+                self.compiler.build(ext, self.output)
+        self.assertEqual(spawn_mock.call_count, 2)
+        self.assertEqual(self.compiler._dependencies, {})
+        # The failure of `go list` is memoised for the second build.
+        self.assertEqual(sum(call.args[0][1:2] == ["list"] for call in run_mock.call_args_list), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "cache")))
+
+    def test_force(self, install_build_tools_mock: mock.Mock) -> None:
+        self.compiler.force = True
+        with mock.patch.object(self.compiler, "spawn", side_effect=self.fake_gopy) as spawn_mock:
+            self.compiler.build(self.ext, self.output)
+            self.compiler.build(self.ext, self.output)
+        self.assertEqual(spawn_mock.call_count, 2)
+
+
+@mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+class TestGoPyCompiler_build_postprocess(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.compiler = compiler.GoPyCompiler(use_cache=False)
+        self.output = os.path.join(self.tmp.name, "output")
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def fake_gopy_gen(self, cmd: list[str]) -> None:
+        if cmd[1] != "gen":
+            return
+        os.makedirs(self.output, exist_ok=True)
+        with open(os.path.join(self.output, "build.py"), "w") as f:
+            f.write("mod.add_function('hello_Sum', retval('double'), [param('int64_t', 'h')])\nmod.generate(f)\n")
+
+    def test_release_gil(self, install_build_tools_mock: mock.Mock) -> None:
+        ext = extension.GoExtension("tests.go", ["example.com/hello"], release_gil=["hello.*"])
+        with mock.patch.object(self.compiler, "spawn", side_effect=self.fake_gopy_gen) as spawn_mock:
+            self.compiler.build(ext, self.output)
+        gen, make = (call.args[0] for call in spawn_mock.call_args_list)
+        self.assertEqual(gen[1], "gen")
+        self.assertNotIn("-no-make", gen)
+        self.assertEqual(make, ["make", "-C", self.output, "build", "GOBUILD=go build"])
+        with open(os.path.join(self.output, "build.py")) as f:
+            self.assertIn("unblock_threads=True", f.read())
+
+    def test_plain(self, install_build_tools_mock: mock.Mock) -> None:
+        ext = extension.GoExtension("tests.go", ["example.com/hello"])
+        with mock.patch.object(self.compiler, "spawn") as spawn_mock:
+            self.compiler.build(ext, self.output)
+        spawn_mock.assert_called_once()
+        self.assertEqual(spawn_mock.call_args.args[0][1], "build")
+        self.assertIn("-no-make", spawn_mock.call_args.args[0])
+
+    def test_build_flags(self, install_build_tools_mock: mock.Mock) -> None:
+        ext = extension.GoExtension("tests.go", ["example.com/hello"], go_build_flags=["-ldflags=-s -w"])
+        with mock.patch.object(self.compiler, "spawn", side_effect=self.fake_gopy_gen) as spawn_mock:
+            self.compiler.build(ext, self.output)
+        make = spawn_mock.call_args.args[0]
+        self.assertEqual(make[-1], "GOBUILD=go build '-ldflags=-s -w'")
+
+
+class TestGoPyCompiler_build_flags(TestCase):
+    def setUp(self) -> None:
+        self.compiler = compiler.GoPyCompiler(
+            use_cache=False, build_flags=["-trimpath"], cgo_cflags=["-O3"], pgo="default.pgo"
+        )
+        self.compiler.env.pop("CGO_CFLAGS", None)
+        self.compiler.env["GOFLAGS"] = "-mod=mod"
+        self.ext = extension.GoExtension("tests.go", ["example.com/hello"], go_build_flags=["-tags=fast"])
+
+    def test_go_build_flags(self) -> None:
+        self.assertEqual(
+            self.compiler.go_build_flags(self.ext),
+            ["-trimpath", "-tags=fast", f"-pgo={os.path.abspath('default.pgo')}"],
+        )
+
+    def test_build_env(self) -> None:
+        env = self.compiler.build_env(self.ext)
+        self.assertEqual(env["CGO_CFLAGS"], "-g -O2 -O3")
+        self.assertEqual(env["GOFLAGS"], f"-mod=mod -trimpath -tags=fast -pgo={os.path.abspath('default.pgo')}")
+        self.assertNotIn("CGO_LDFLAGS", env)
+
+    def test_build_config(self) -> None:
+        other = extension.GoExtension("tests.go", ["example.com/hello"], go_build_flags=["-tags=slow"])
+        self.assertNotEqual(self.compiler.build_config(self.ext), self.compiler.build_config(other))
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+    def test_spawn_env(self, install_build_tools_mock: mock.Mock) -> None:
+        with mock.patch.object(self.compiler.command_runner, "run", new_callable=mock.AsyncMock) as run_mock:
+            run_mock.return_value = runner.CommandResult([], 0, "")
+            self.compiler.build(self.ext, "output")
+        self.assertIn("-tags=fast", run_mock.call_args.kwargs["env"]["GOFLAGS"])
+        self.assertNotIn("-tags=fast", self.compiler.env["GOFLAGS"])
+
+
+@mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+class TestGoPyCompiler_build_interpreters(TestCase):
+    def setUp(self) -> None:
+        self.compiler = compiler.GoPyCompiler(workers=2, use_cache=False)
+        self.ext = extension.GoExtension("tests.go", ["example.com/hello"])
+        self.pythons = {
+            "python3.10": toolchain.Interpreter(
+                "/usr/bin/python3.10", ".cpython-310-x86_64-linux-gnu.so", "cpython-310"
+            ),
+            "python3.11": toolchain.Interpreter(
+                "/usr/bin/python3.11", ".cpython-311-x86_64-linux-gnu.so", "cpython-311"
+            ),
+            "python3": toolchain.Interpreter("/usr/bin/python3", ".cpython-311-x86_64-linux-gnu.so", "cpython-311"),
+        }
+        patcher = mock.patch("go_extension.toolchain.probe_python", side_effect=self.pythons.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_build_interpreters(self, install_build_tools_mock: mock.Mock) -> None:
+        builds: list[tuple[str, str]] = []
+
+        def build(compiler: compiler.GoPyCompiler, ext: extension.GoExtension, output: Path) -> None:
+            builds.append((compiler.python, str(output)))
+
+        with mock.patch("go_extension.compiler.GoPyCompiler.build", autospec=True, side_effect=build):
+            outputs = self.compiler.build_interpreters(self.ext, ["python3.10", "python3.11", "python3"], "out")
+        self.assertEqual(
+            outputs,
+            {
+                "cpython-310-x86_64-linux-gnu": Path("out/cpython-310-x86_64-linux-gnu"),
+                "cpython-311-x86_64-linux-gnu": Path("out/cpython-311-x86_64-linux-gnu"),
+            },
+        )
+        # The first build fills the Go build cache before the others.
+        self.assertEqual(builds[0], ("/usr/bin/python3.10", "out/cpython-310-x86_64-linux-gnu"))
+        self.assertEqual(builds[1:], [("/usr/bin/python3.11", "out/cpython-311-x86_64-linux-gnu")])
+
+    def test_not_found(self, install_build_tools_mock: mock.Mock) -> None:
+        with self.assertRaises(errors.DistutilsExecError):
+            self.compiler.build_interpreters(self.ext, ["python2"], "out")
+
+    def test_vm(self, install_build_tools_mock: mock.Mock) -> None:
+        with mock.patch.object(self.compiler, "spawn") as spawn_mock:
+            self.compiler.build_interpreters(self.ext, ["python3.11"], "out")
+        self.assertIn("-vm=/usr/bin/python3.11", spawn_mock.call_args.args[0])
+
+
 def load_tests(loader, tests, _):  # type: ignore
     tests.addTests(doctest.DocTestSuite(compiler))
     return tests
@@ -0,0 +1,140 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase, mock
+import asyncio
+import doctest
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from setuptools._distutils import errors, log
+
+from go_extension import cache, compiler, daemon, extension, profiling
+
+
+class TestBuildServer(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.socket = os.path.join(self.tmp.name, "daemon.sock")
+        self.server = daemon.BuildServer(self.socket, poll_interval=60)
+        started = threading.Event()
+        self.thread = threading.Thread(target=asyncio.run, args=(self.server.serve(started),))
+        self.thread.start()
+        self.assertTrue(started.wait(10))
+        self.compiler = compiler.GoPyCompiler(use_cache=False)
+        self.compiler.daemon_socket = self.socket
+        self.ext = extension.GoExtension("tests.go", ["example.com/hello"])
+        self.output = os.path.join(self.tmp.name, "output")
+
+    def tearDown(self) -> None:
+        daemon.shutdown(self.socket)
+        self.thread.join(10)
+        self.tmp.cleanup()
+
+    def test_ping(self) -> None:
+        self.assertEqual(daemon.ping(self.socket), os.getpid())
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+    @mock.patch("go_extension.compiler.GoPyCompiler.spawn")
+    def test_delegate(self, spawn_mock: mock.Mock, install_build_tools_mock: mock.Mock) -> None:
+        self.compiler.capture_output = True
+        self.compiler.build(self.ext, self.output)
+        spawn_mock.assert_called_once()
+        cmd = spawn_mock.call_args.args[0]
+        self.assertEqual(cmd[:2], ["gopy", "build"])
+        self.assertIn(f"-output={self.output}", cmd)
+        self.assertEqual(len(self.server._compilers), 1)
+        self.compiler.build(self.ext, self.output)
+        self.assertEqual(len(self.server._compilers), 1)
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+    @mock.patch("go_extension.compiler.GoPyCompiler.spawn")
+    def test_failure(self, spawn_mock: mock.Mock, install_build_tools_mock: mock.Mock) -> None:
+        spawn_mock.side_effect = errors.DistutilsExecError("command 'gopy' failed with exit code 1")
+        with self.assertRaisesRegex(errors.DistutilsExecError, "exit code 1"):
+            self.compiler.build(self.ext, self.output)
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+    @mock.patch.object(compiler.GoPyCompiler, "spawn", autospec=True)
+    def test_cwd(self, spawn_mock: mock.Mock, install_build_tools_mock: mock.Mock) -> None:
+        self.compiler.cwd = self.tmp.name
+        with mock.patch("os.chdir", side_effect=AssertionError("the server changed its working directory")):
+            self.compiler.build(self.ext, self.output)
+        self.assertEqual(spawn_mock.call_args.args[0].cwd, self.tmp.name)
+
+    @mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+    @mock.patch.object(compiler.GoPyCompiler, "spawn", autospec=True)
+    def test_logs_and_profile(self, spawn_mock: mock.Mock, install_build_tools_mock: mock.Mock) -> None:
+        def spawn(builder: compiler.GoPyCompiler, cmd: list[str]) -> None:
+            with builder.phase("gopy build", "spawn"):
+                log.info("compiled %s", cmd[-1])
+
+        spawn_mock.side_effect = spawn
+        self.compiler.profile = profiling.BuildProfile()
+        with mock.patch.object(daemon, "_replay_logs", wraps=daemon._replay_logs) as replay_mock:
+            with self.compiler.phase("build_go", "build_go", extension="tests.go"):
+                self.compiler.build(self.ext, self.output)
+        self.assertIn(["info", "compiled example.com/hello"], replay_mock.call_args.args[0]["logs"])
+        phase = next(phase for phase in self.compiler.profile.phases if phase["name"] == "gopy build")
+        self.assertEqual(phase["extension"], "tests.go")
+
+    @mock.patch("go_extension.compiler.GoPyCompiler._go_list_dependencies")
+    def test_resolve(self, go_list_mock: mock.Mock) -> None:
+        go_list_mock.return_value = {"example.com/hello": ["hello.go"]}
+        for _ in range(2):
+            gopy_compiler = compiler.GoPyCompiler(use_cache=False, daemon_socket=self.socket)
+            self.assertListEqual(gopy_compiler.resolve_dependencies(["example.com/hello"]), ["hello.go"])
+        # Resolved once by the server, which keeps the result for the next build.
+        go_list_mock.assert_called_once_with(["example.com/hello"])
+
+    def test_evict(self) -> None:
+        self.server.max_compilers = 1
+        for flags in (["-trimpath"], ["-race"]):
+            gopy_compiler = compiler.GoPyCompiler(use_cache=False, build_flags=flags)
+            self.server._compiler(daemon._compiler_request(gopy_compiler, "build"))
+        self.assertEqual(len(self.server._compilers), 1)
+        self.assertEqual(next(iter(self.server._compilers.values())).build_flags, ["-race"])
+
+    def test_refresh(self) -> None:
+        source = Path(self.tmp.name, "main.go")
+        source.write_text("package hello\n")
+        gopy_compiler = compiler.GoPyCompiler(use_cache=False, cwd=self.tmp.name)
+        gopy_compiler._dependencies["example.com/hello"] = ["main.go"]
+        self.server._compilers["key"] = gopy_compiler
+        self.server._watch_dependencies("key", gopy_compiler)
+        self.assertFalse(self.server._refresh("key", gopy_compiler))
+        time.sleep(0.01)
+        source.write_text("package hello\n\nfunc Hello() {}\n")
+        with mock.patch.object(gopy_compiler, "forget_dependencies") as forget_mock:
+            self.assertTrue(self.server._refresh("key", gopy_compiler))
+        forget_mock.assert_called_once_with()
+
+
+class Test_delegate_build(TestCase):
+    @mock.patch("go_extension.compiler.GoPyCompiler.install_build_tools")
+    @mock.patch("go_extension.compiler.GoPyCompiler.spawn")
+    def test_fallback(self, spawn_mock: mock.Mock, install_build_tools_mock: mock.Mock) -> None:
+        gopy_compiler = compiler.GoPyCompiler(use_cache=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            gopy_compiler.daemon_socket = os.path.join(tmp, "daemon.sock")
+            ext = extension.GoExtension("tests.go", ["example.com/hello"])
+            self.assertFalse(daemon.delegate_build(gopy_compiler, ext, tmp))
+            gopy_compiler.build(ext, tmp)
+        spawn_mock.assert_called_once()
+
+    def test_socket_path(self) -> None:
+        with mock.patch.dict(os.environ, {daemon.SOCKET_ENV: "/tmp/go-extension.sock"}):
+            self.assertEqual(daemon.socket_path(), Path("/tmp/go-extension.sock"))
+            self.assertEqual(compiler.GoPyCompiler().daemon_socket, "/tmp/go-extension.sock")
+        with mock.patch.dict(os.environ, {daemon.SOCKET_ENV: ""}):
+            self.assertIsNone(daemon.socket_path())
+        # The server is opt-in.
+        with mock.patch.dict(os.environ, {cache.CACHE_DIR_ENV: "/tmp/go-extension"}):
+            os.environ.pop(daemon.SOCKET_ENV, None)
+            self.assertIsNone(compiler.GoPyCompiler().daemon_socket)
+            self.assertEqual(daemon.default_socket_path(), Path("/tmp/go-extension", daemon.SOCKET_FILE))
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(daemon))
+    return tests
@@ -38,6 +38,41 @@ class TestGoExtension_property(TestCase):
     def test_original_name(self) -> None:
         self.assertEqual(self.ext.original_name, self.name)
 
+    def test_resolve_depends(self) -> None:
+        self.assertTrue(self.ext.resolve_depends)
+        ext = extension.GoExtension(self.name, self.packages, resolve_depends=False)
+        self.assertFalse(ext.resolve_depends)
+
+    def test_lazy(self) -> None:
+        self.assertFalse(self.ext.lazy)
+        ext = extension.GoExtension(self.name, self.packages, lazy=True)
+        self.assertTrue(ext.lazy)
+
+    def test_release_gil(self) -> None:
+        self.assertEqual(self.ext.release_gil, [])
+        ext = extension.GoExtension(self.name, self.packages, release_gil=("hello.Sum",))
+        self.assertEqual(ext.release_gil, ["hello.Sum"])
+
+    def test_buffer_protocol(self) -> None:
+        self.assertFalse(self.ext.buffer_protocol)
+        ext = extension.GoExtension(self.name, self.packages, buffer_protocol=True)
+        self.assertTrue(ext.buffer_protocol)
+
+    def test_go_runtime(self) -> None:
+        self.assertIsNone(self.ext.go_runtime)
+        ext = extension.GoExtension(self.name, self.packages, go_runtime={"GOMAXPROCS": 2, "GOGC": "off"})
+        self.assertEqual(ext.go_runtime, {"GOMAXPROCS": "2", "GOGC": "off"})
+
+    def test_instrument(self) -> None:
+        self.assertFalse(self.ext.instrument)
+        ext = extension.GoExtension(self.name, self.packages, instrument=True)
+        self.assertTrue(ext.instrument)
+
+    def test_handle_registry(self) -> None:
+        self.assertFalse(self.ext.handle_registry)
+        ext = extension.GoExtension(self.name, self.packages, handle_registry=True)
+        self.assertTrue(ext.handle_registry)
+
 
 def load_tests(loader, tests, _):  # type: ignore
     tests.addTests(doctest.DocTestSuite(extension))
@@ -0,0 +1,72 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase
+import doctest
+import json
+import subprocess
+import tempfile
+
+from go_extension import profiling
+
+
+class TestBuildProfile_phase(TestCase):
+    def setUp(self) -> None:
+        self.profile = profiling.BuildProfile()
+
+    def test_phase(self) -> None:
+        with self.profile.phase("true", "spawn"):
+            subprocess.run(["true"])
+        [phase] = self.profile.phases
+        self.assertEqual(phase["name"], "true")
+        self.assertEqual(phase["category"], "spawn")
+        self.assertGreaterEqual(phase["wall"], 0)
+        self.assertGreaterEqual(phase["cpu_children"], 0)
+        self.assertNotIn("max_rss_children_kb", phase)
+        self.assertGreater(self.profile.report()["max_rss_children_kb"], 0)
+
+    def test_nested(self) -> None:
+        with self.profile.phase("build_go", "build_go", extension="hello_go"):
+            with self.profile.phase("gopy build", "spawn"):
+                pass
+        with self.profile.phase("go list", "spawn"):
+            pass
+        extensions = {phase["name"]: phase.get("extension") for phase in self.profile.phases}
+        self.assertDictEqual(extensions, {"gopy build": "hello_go", "build_go": "hello_go", "go list": None})
+
+    def test_failure(self) -> None:
+        with self.assertRaises(RuntimeError):
+            with self.profile.phase("gopy build", "spawn"):
+                raise RuntimeError
+        self.assertEqual(len(self.profile.phases), 1)
+
+
+class TestBuildProfile_report(TestCase):
+    def setUp(self) -> None:
+        self.profile = profiling.BuildProfile()
+        for ext in ("a", "b"):
+            with self.profile.phase("build_go", "build_go", extension=ext):
+                with self.profile.phase("gopy build", "spawn"):
+                    pass
+
+    def test_report(self) -> None:
+        report = self.profile.report()
+        self.assertEqual(len(report["phases"]), 4)
+        self.assertSetEqual(set(report["total_by_name"]), {"build_go", "gopy build"})
+        self.assertSetEqual(set(report["total_by_extension"]), {"a", "b"})
+
+    def test_trace_events(self) -> None:
+        events = self.profile.trace_events()["traceEvents"]
+        self.assertEqual(len(events), 4)
+        for event in events:
+            self.assertEqual(event["ph"], "X")
+            self.assertIn("extension", event["args"])
+
+    def test_write(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            report, trace = self.profile.write(tmp)
+            self.assertIn("phases", json.loads(report.read_text()))
+            self.assertIn("traceEvents", json.loads(trace.read_text()))
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(profiling))
+    return tests
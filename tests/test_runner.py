@@ -0,0 +1,111 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase
+import asyncio
+import doctest
+import os
+import tempfile
+import threading
+import time
+
+from go_extension import exceptions, runner
+
+
+class TestRunner_run(TestCase):
+    def test_output(self) -> None:
+        chunks: list[str] = []
+        result = runner.Runner().run_sync(["sh", "-c", "echo out; echo err >&2; exit 3"], on_output=chunks.append)
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.output, "out\nerr\n")
+        self.assertEqual("".join(chunks), result.output)
+
+    def test_env(self) -> None:
+        result = runner.Runner().run_sync(["sh", "-c", "echo $GO_EXTENSION_TEST"], env={"GO_EXTENSION_TEST": "1"})
+        self.assertEqual(result.output, "1\n")
+
+    def test_cwd(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = runner.Runner().run_sync(["pwd", "-P"], cwd=tmp)
+            self.assertEqual(result.output, os.path.realpath(tmp) + "\n")
+
+    def test_timeout(self) -> None:
+        start = time.perf_counter()
+        with self.assertRaises(exceptions.CommandTimeoutError):
+            runner.Runner(timeout=0.2).run_sync(["sleep", "10"])
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_cancel(self) -> None:
+        async def main() -> None:
+            task = asyncio.create_task(runner.Runner().run(["sleep", "10"]))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            await task
+
+        start = time.perf_counter()
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(main())
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_max_concurrency(self) -> None:
+        async def main(cmd_runner: runner.Runner) -> float:
+            start = time.perf_counter()
+            await asyncio.gather(*(cmd_runner.run(["sleep", "0.3"]) for _ in range(2)))
+            return time.perf_counter() - start
+
+        self.assertGreaterEqual(asyncio.run(main(runner.Runner(max_concurrency=1))), 0.6)
+        self.assertLess(asyncio.run(main(runner.Runner(max_concurrency=2))), 0.6)
+
+    def test_max_concurrency_threads(self) -> None:
+        cmd_runner = runner.Runner(max_concurrency=1)
+        threads = [threading.Thread(target=cmd_runner.run_sync, args=(["sleep", "0.3"],)) for _ in range(3)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.perf_counter() - start, 0.9)
+
+    def test_max_concurrency_cancel(self) -> None:
+        cmd_runner = runner.Runner(max_concurrency=1)
+
+        async def main() -> None:
+            running = asyncio.create_task(cmd_runner.run(["sleep", "0.2"]))
+            await asyncio.sleep(0.05)
+            waiting = asyncio.create_task(cmd_runner.run(["true"]))
+            await asyncio.sleep(0.05)
+            waiting.cancel()
+            await running
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            await asyncio.wait_for(cmd_runner.run(["true"]), 5)
+
+        asyncio.run(main())
+
+    def test_kill_all(self) -> None:
+        results: list[runner.CommandResult] = []
+        thread = threading.Thread(target=lambda: results.append(runner.Runner().run_sync(["sleep", "10"])))
+        start = time.perf_counter()
+        thread.start()
+        while not runner._running and time.perf_counter() - start < 5:
+            time.sleep(0.01)
+        runner.kill_all()
+        thread.join(5)
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertNotEqual(results[0].returncode, 0)
+        self.assertSetEqual(runner._running, set())
+
+    def test_not_found(self) -> None:
+        with self.assertRaises(OSError):
+            runner.Runner().run_sync(["unexist_command"])
+
+
+class Test_run_sync(TestCase):
+    def test_in_running_loop(self) -> None:
+        async def main() -> int:
+            return runner.run_sync(asyncio.sleep(0, result=1))
+
+        self.assertEqual(asyncio.run(main()), 1)
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(runner))
+    return tests
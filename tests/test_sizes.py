@@ -0,0 +1,134 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase
+import doctest
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+from go_extension import sizes
+
+_GO_SOURCE = """package main
+
+import "C"
+import "fmt"
+
+//export Hello
+func Hello() { fmt.Println("Hello, World") }
+
+func main() {}
+"""
+
+
+class TestSharedLibrary(TestCase):
+    tempdir: str
+    library: Path
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.tempdir = tempfile.mkdtemp()
+        Path(cls.tempdir, "go.mod").write_text("module example.com/hello\n\ngo 1.16\n")
+        Path(cls.tempdir, "main.go").write_text(_GO_SOURCE)
+        cls.library = Path(cls.tempdir, "_hello.so")
+        subprocess.run(
+            ["go", "build", "-buildmode=c-shared", "-o", cls.library.name, "."],
+            cwd=cls.tempdir,
+            env=dict(os.environ, CGO_ENABLED="1"),
+            check=True,
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        shutil.rmtree(cls.tempdir)
+
+    def copy_library(self) -> Path:
+        path = Path(tempfile.mkdtemp(dir=self.tempdir), self.library.name)
+        shutil.copy(self.library, path)
+        return path
+
+    def test_elf_sections(self) -> None:
+        sections = sizes.elf_sections(self.library)
+        assert sections is not None
+        self.assertIn(".text", sections)
+        self.assertNotIn(".bss", sections)
+        self.assertGreater(sizes.debug_size(sections), 0)
+        self.assertLess(sum(sections.values()), self.library.stat().st_size)
+
+    def test_elf_sections_not_elf(self) -> None:
+        path = Path(self.tempdir, "main.go")
+        self.assertIsNone(sizes.elf_sections(path))
+
+    def test_analyze(self) -> None:
+        report = sizes.analyze(self.library, top=5)
+        self.assertEqual(report["size"], self.library.stat().st_size)
+        self.assertGreater(report["debug_size"], 0)
+        self.assertEqual(len(report["symbols"]), 5)
+        symbol_sizes = [symbol["size"] for symbol in report["symbols"]]
+        self.assertEqual(symbol_sizes, sorted(symbol_sizes, reverse=True))
+        packages = [package["package"] for package in report["packages"]]
+        self.assertEqual(packages[0], "runtime")
+        self.assertIn("fmt", packages)
+
+    def test_strip(self) -> None:
+        path = self.copy_library()
+        self.assertIsNone(sizes.strip_debug_info(path, "strip"))
+        sections = sizes.elf_sections(path)
+        assert sections is not None
+        self.assertEqual(sizes.debug_size(sections), 0)
+        self.assertLess(path.stat().st_size, self.library.stat().st_size)
+
+    def test_split(self) -> None:
+        path = self.copy_library()
+        debug_file = sizes.strip_debug_info(path, "split", Path(path.parent, "debug", "_hello.so.debug"))
+        assert debug_file is not None
+        sections, debug_sections = sizes.elf_sections(path), sizes.elf_sections(debug_file)
+        assert sections is not None and debug_sections is not None
+        self.assertEqual(sizes.debug_size(sections), 0)
+        self.assertIn(".gnu_debuglink", sections)
+        self.assertGreater(sizes.debug_size(debug_sections), 0)
+
+    def test_keep(self) -> None:
+        path = self.copy_library()
+        self.assertIsNone(sizes.strip_debug_info(path, "keep"))
+        self.assertEqual(path.stat().st_size, self.library.stat().st_size)
+
+    def test_invalid_mode(self) -> None:
+        with self.assertRaises(ValueError):
+            sizes.strip_debug_info(self.library, "compress")
+
+
+class Test_parse_size(TestCase):
+    def test_invalid(self) -> None:
+        for text in ("", "M", "20X", "-1"):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                sizes.parse_size(text)
+
+
+class Test_write_report(TestCase):
+    def test_write_report(self) -> None:
+        reports = [{"path": "b.so", "size": 30}, {"path": "a.so", "size": 10}]
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = sizes.write_report(Path(tempdir, "reports", "sizes.json"), reports, 20)
+            report = json.loads(path.read_text())
+        self.assertEqual(report["budget"], 20)
+        self.assertEqual(report["over_budget"], ["b.so"])
+        self.assertEqual(report["total_size"], 40)
+        self.assertEqual([artifact["path"] for artifact in report["artifacts"]], ["a.so", "b.so"])
+
+
+class Test_artifacts(TestCase):
+    def test_artifacts(self) -> None:
+        with tempfile.TemporaryDirectory() as tempdir:
+            for name in ("_hello.cpython-311-x86_64-linux-gnu.so", "hello.py", "build.py"):
+                Path(tempdir, name).touch()
+            self.assertEqual(
+                [path.name for path in sizes.artifacts(tempdir)], ["_hello.cpython-311-x86_64-linux-gnu.so"]
+            )
+            self.assertEqual(sizes.artifacts(Path(tempdir, "missing")), [])
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(sizes))
+    return tests
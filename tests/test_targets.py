@@ -0,0 +1,54 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase, mock
+import doctest
+
+from go_extension import targets
+
+
+class TestTarget_parse(TestCase):
+    def test_env(self) -> None:
+        target = targets.Target.parse("windows/amd64 CC=x86_64-w64-mingw32-gcc 'CGO_CFLAGS=-O2 -I/opt/win/include'")
+        self.assertEqual(target.tag, "windows-amd64")
+        self.assertEqual(
+            target.env,
+            {
+                "GOOS": "windows",
+                "GOARCH": "amd64",
+                "CGO_ENABLED": "1",
+                "CC": "x86_64-w64-mingw32-gcc",
+                "CGO_CFLAGS": "-O2 -I/opt/win/include",
+            },
+        )
+        self.assertIsNone(target.python)
+
+    def test_invalid(self) -> None:
+        for spec in ("linux", "linux/", "linux/arm64 CC"):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                targets.Target.parse(spec)
+
+
+class Test_concurrency(TestCase):
+    @mock.patch("os.cpu_count", return_value=8)
+    def test_cpu(self, cpu_count_mock: mock.Mock) -> None:
+        with mock.patch("go_extension.targets.available_memory", return_value=None):
+            self.assertEqual(targets.concurrency(20), 8)
+            self.assertEqual(targets.concurrency(3), 3)
+            self.assertEqual(targets.concurrency(20, workers=16), 8)
+            self.assertEqual(targets.concurrency(20, workers=2), 2)
+
+    @mock.patch("os.cpu_count", return_value=8)
+    def test_memory(self, cpu_count_mock: mock.Mock) -> None:
+        with mock.patch("go_extension.targets.available_memory", return_value=3 << 30):
+            self.assertEqual(targets.concurrency(20), 3)
+        with mock.patch("go_extension.targets.available_memory", return_value=1 << 20):
+            self.assertEqual(targets.concurrency(20), 1)
+
+    def test_available_memory(self) -> None:
+        memory = targets.available_memory()
+        if memory is not None:
+            self.assertGreater(memory, 0)
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(targets))
+    return tests
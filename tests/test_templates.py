@@ -0,0 +1,92 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase, skipIf
+from pathlib import Path
+import doctest
+import itertools
+import shutil
+import subprocess
+import tempfile
+
+from go_extension import bindings, build_ext, templates
+
+GO_PREAMBLE = 'package main\n\n// #include <stdlib.h>\nimport "C"\n'
+
+
+class Test_render(TestCase):
+    def test_missing_value(self) -> None:
+        with self.assertRaises(KeyError):
+            templates.render("facade.py.in", bundle="pkg._bundle")
+
+
+class Test_generated_python(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def assertCompiles(self, directory: Path) -> None:
+        files = sorted(directory.rglob("*.py"))
+        self.assertTrue(files)
+        for path in files:
+            with self.subTest(path=str(path.relative_to(self.root))):
+                compile(path.read_text(), str(path), "exec")
+
+    def test_packages(self) -> None:
+        for runtime, metrics, handles, lazy in itertools.product([False, True], repeat=4):
+            output = self.root / f"runtime{runtime:d}_metrics{metrics:d}_handles{handles:d}_lazy{lazy:d}"
+            output.mkdir()
+            if lazy:
+                build_ext._write_lazy_init(output, ["hello"], runtime, metrics, handles)
+            else:
+                (output / "__init__.py").write_text("from . import hello\n")
+            if runtime:
+                build_ext._write_runtime(output, {"GOGC": "50", "GOMEMLIMIT": "512MiB"}, lazy)
+            if metrics:
+                build_ext._write_metrics(output, lazy, runtime)
+            if handles:
+                build_ext._write_handles(output, lazy, runtime)
+        self.assertCompiles(self.root)
+
+    def test_facade(self) -> None:
+        (self.root / "hello.py").write_text(templates.render("facade.py.in", bundle="pkg._bundle", module="hello"))
+        self.assertCompiles(self.root)
+
+    def test_buffer_protocol(self) -> None:
+        (self.root / "go.go").write_text(GO_PREAMBLE)
+        (self.root / "build.py").write_text("mod.generate(open('go.c', 'w'))\n")
+        (self.root / "go.py").write_text("class Slice_byte:\n    pass\n")
+        bindings.add_buffer_protocol(self.root, "go")
+        self.assertCompiles(self.root)
+
+
+@skipIf(shutil.which("gofmt") is None, "gofmt is not installed")
+class Test_generated_go(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.go_file = Path(self.tmp.name, "go.go")
+        self.go_file.write_text(
+            GO_PREAMBLE
+            + 'func register(p interface{}) { gopyh.Register("main.Point", p) }\n'
+            + 'func get(h CGoHandle) interface{} { return gopyh.VarFromHandle(gopyh.CGoHandle(h), "main.Point") }\n'
+            + "func decRef(h CGoHandle) { gopyh.DecRef(gopyh.CGoHandle(h)) }\n"
+        )
+        Path(self.tmp.name, "build.py").write_text("mod.generate(open('go.c', 'w'))\n")
+        Path(self.tmp.name, "go.py").touch()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_gofmt(self) -> None:
+        bindings.add_buffer_protocol(self.tmp.name, "go")
+        bindings.add_runtime_setters(self.tmp.name, "go")
+        bindings.add_profiling(self.tmp.name, "go")
+        bindings.replace_handle_registry(self.tmp.name, "go")
+        result = subprocess.run(["gofmt", "-e", "-l", str(self.go_file)], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(templates))
+    return tests
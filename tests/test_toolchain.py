@@ -0,0 +1,92 @@
+# Copyright (c) 2021 Shuhei Nitta. All rights reserved.
+from unittest import TestCase, mock
+import doctest
+import os
+import subprocess
+import sys
+import sysconfig
+import tempfile
+
+from go_extension import cache, toolchain
+
+
+class TestToolchain_probe(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = mock.patch.dict(os.environ, {cache.CACHE_DIR_ENV: self.tmp.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        toolchain.forget()
+
+    def tearDown(self) -> None:
+        toolchain.forget()
+        self.tmp.cleanup()
+
+    def test_probe_go(self) -> None:
+        go = toolchain.probe_go()
+        assert go is not None
+        self.assertTrue(os.path.isabs(go.path))
+        self.assertGreaterEqual(go.version_info, (1, 16))
+
+    def test_not_found(self) -> None:
+        self.assertIsNone(toolchain.probe_go("unexist_go"))
+
+    def test_memoised(self) -> None:
+        with mock.patch("go_extension.toolchain.subprocess.run", wraps=subprocess.run) as run_mock:
+            go = toolchain.probe_go()
+            self.assertIs(toolchain.probe_go(), go)
+        run_mock.assert_called_once()
+
+    def test_disk_cache(self) -> None:
+        go = toolchain.probe_go()
+        assert go is not None
+        toolchain.forget()
+        with mock.patch("go_extension.toolchain.subprocess.run") as run_mock:
+            cached = toolchain.probe_go()
+        run_mock.assert_not_called()
+        assert cached is not None
+        self.assertEqual(cached.version, go.version)
+
+    def test_forget(self) -> None:
+        go = toolchain.probe_go()
+        toolchain.forget("go")
+        self.assertIsNot(toolchain.probe_go(), go)
+
+
+class TestToolchain_install_dir(TestCase):
+    def test_gobin(self) -> None:
+        self.assertEqual(toolchain.install_dir({"GOBIN": "/gobin", "GOPATH": "/gopath"}), "/gobin")
+
+    def test_gopath(self) -> None:
+        gopath = os.pathsep.join(["/gopath", "/other"])
+        self.assertEqual(toolchain.install_dir({"GOPATH": gopath}), os.path.join("/gopath", "bin"))
+
+    def test_default(self) -> None:
+        self.assertEqual(toolchain.install_dir({}), os.path.join(os.path.expanduser("~"), "go", "bin"))
+
+
+class TestToolchain_probe_python(TestCase):
+    def test_current(self) -> None:
+        python = toolchain.probe_python(sys.executable)
+        assert python is not None
+        self.assertEqual(python.ext_suffix, sysconfig.get_config_var("EXT_SUFFIX"))
+        self.assertEqual(python.cache_tag, sys.implementation.cache_tag)
+
+    def test_other(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "python3.99")
+            with open(path, "w") as f:
+                f.write("#!/bin/sh\necho .cpython-399-x86_64-linux-gnu.so\necho cpython-399\n")
+            os.chmod(path, 0o755)
+            python = toolchain.probe_python(path)
+        assert python is not None
+        self.assertEqual(python.path, path)
+        self.assertEqual(python.abi_tag, "cpython-399-x86_64-linux-gnu")
+
+    def test_not_found(self) -> None:
+        self.assertIsNone(toolchain.probe_python("unexist_python"))
+
+
+def load_tests(loader, tests, _):  # type: ignore
+    tests.addTests(doctest.DocTestSuite(toolchain))
+    return tests